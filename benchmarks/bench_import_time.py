@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""Cold-start import time of the customer service agent.
+
+Imports MODULE (customer_service.agent by default) in REPEAT fresh
+interpreters with ``-X importtime`` and reports:
+
+* the median and best total import time of MODULE, and of a baseline
+  import (the ADK framework the agent cannot start without), so the
+  difference is the cost this package adds;
+* the packages that cost the most, by the self time of their modules, and
+  the slowest modules of this package.
+
+A new replica pays this once before serving its first request, so use
+--max-ms in CI to catch a dependency sneaking back onto the import path.
+
+Usage:
+    python benchmarks/bench_import_time.py [--module M] [--repeat N]
+        [--top K] [--max-ms MS] [--json]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def import_times(module: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Imports a module in a fresh interpreter.
+
+    Returns:
+        (module, self us, cumulative us, depth) for every imported module,
+        in the order -X importtime reports them.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise SystemExit(f"import {module} failed:\n{result.stderr[-2000:]}")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            rows.append(
+                (match[4], int(match[1]), int(match[2]), (len(match[3]) - 1) // 2)
+            )
+    return rows
+
+
+def total_ms(rows: List[Tuple[str, int, int, int]], module: str) -> float:
+    return next(cum for name, _, cum, _ in rows if name == module) / 1000
+
+
+def by_package(rows: List[Tuple[str, int, int, int]]) -> Dict[str, float]:
+    """Self ms summed per top-level package."""
+    packages: Dict[str, float] = defaultdict(float)
+    for name, self_us, _, _ in rows:
+        packages[name.split(".")[0]] += self_us / 1000
+    return packages
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--module", default="customer_service.agent")
+    parser.add_argument("--baseline", default="google.adk.tools.agent_tool")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--max-ms", type=float, help="exit non-zero if the median exceeds this"
+    )
+    parser.add_argument("--json", action="store_true")
+    options = parser.parse_args()
+
+    # The first run also warms the bytecode and OS file caches.
+    import_times(options.module)
+    runs = [import_times(options.module) for _ in range(options.repeat)]
+    totals = [total_ms(rows, options.module) for rows in runs]
+    baselines = [
+        total_ms(import_times(options.baseline), options.baseline)
+        for _ in range(options.repeat)
+    ]
+    median_run = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    packages = sorted(by_package(median_run).items(), key=lambda p: -p[1])
+    own = options.module.split(".")[0]
+    own_modules = sorted(
+        ((name, self_us / 1000) for name, self_us, _, _ in median_run
+         if name.split(".")[0] == own),
+        key=lambda m: -m[1],
+    )
+    loaded = {name.split(".")[0] for name, *_ in median_run}
+
+    report = {
+        "module": options.module,
+        "median_ms": round(statistics.median(totals), 1),
+        "best_ms": round(min(totals), 1),
+        "baseline": options.baseline,
+        "baseline_median_ms": round(statistics.median(baselines), 1),
+        "modules_imported": len(median_run),
+        "packages": {name: round(ms, 1) for name, ms in packages[: options.top]},
+        "own_modules": {name: round(ms, 1) for name, ms in own_modules[: options.top]},
+        "heavy_loaded": sorted(loaded & {"pymongo", "numpy", "scipy", "PIL", "qrcode"}),
+    }
+    if options.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(
+            f"{options.module}: median {report['median_ms']:.0f} ms,"
+            f" best {report['best_ms']:.0f} ms,"
+            f" {report['modules_imported']} modules"
+        )
+        print(
+            f"{options.baseline} alone: median {report['baseline_median_ms']:.0f} ms"
+            f" (package overhead {report['median_ms'] - report['baseline_median_ms']:.0f} ms)"
+        )
+        print("heavy dependencies loaded:", ", ".join(report["heavy_loaded"]) or "none")
+        print("\nself ms by package:")
+        for name, ms in report["packages"].items():
+            print(f"  {ms:8.1f}  {name}")
+        print(f"\nself ms of {own} modules:")
+        for name, ms in report["own_modules"].items():
+            print(f"  {ms:8.1f}  {name}")
+    if options.max_ms is not None and report["median_ms"] > options.max_ms:
+        raise SystemExit(
+            f"median import time {report['median_ms']:.0f} ms exceeds {options.max_ms:.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Caller-side cost of a log call, written directly or through the pipeline.
+
+Logs COUNT records the way modify_cart does (a customer id plus a cart
+payload of ITEMS items) and reports the time spent in the calling thread
+per record for:
+
+* direct: a FileHandler on the root logger, formatting and writing in the
+  caller, as with logging.basicConfig;
+* pipeline: the same handler behind configure_logging();
+* slow sink: both again with a handler that takes --sink-ms per record,
+  like a blocked terminal or a remote log shipper.
+
+Usage:
+    python benchmarks/bench_logging.py [--count N] [--items N] [--sink-ms MS]
+        [--format text|json]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_service.config import LoggingModel
+from customer_service.shared_libraries.logging_pipeline import (
+    configure_logging,
+    logging_stats,
+    shutdown_logging,
+)
+
+
+class SlowFileHandler(logging.FileHandler):
+    def __init__(self, path: str, delay_secs: float):
+        super().__init__(path)
+        self.delay_secs = delay_secs
+
+    def emit(self, record):
+        time.sleep(self.delay_secs)
+        super().emit(record)
+
+
+def run(handler, settings, count, cart, pipeline):
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(logging.INFO)
+    if pipeline:
+        configure_logging(settings)
+    log = logging.getLogger("customer_service.tools.tools")
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        log.info("Modifying cart for customer ID: %s (adding %s)", f"cust-{i}", cart)
+        timings.append(time.perf_counter() - start)
+    stats = logging_stats()
+    start = time.perf_counter()
+    if pipeline:
+        shutdown_logging()
+    handler.close()
+    drain = time.perf_counter() - start
+    timings.sort()
+    return {
+        "mean_us": statistics.fmean(timings) * 1e6,
+        "p99_us": timings[int(len(timings) * 0.99)] * 1e6,
+        "drain_ms": drain * 1000,
+        "dropped": stats.get("dropped", 0),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=20_000)
+    parser.add_argument("--items", type=int, default=200)
+    parser.add_argument("--sink-ms", type=float, default=1.0)
+    parser.add_argument("--format", choices=("text", "json"), default="text")
+    options = parser.parse_args()
+
+    cart = [
+        {"product_id": f"978-0-{i:06d}-0", "quantity": 1 + i % 3, "price": 12.99}
+        for i in range(options.items)
+    ]
+    settings = LoggingModel(format=options.format, queue_size=options.count)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "log.txt")
+        cases = [
+            ("direct", lambda: logging.FileHandler(path), False, options.count),
+            ("pipeline", lambda: logging.FileHandler(path), True, options.count),
+            (
+                "direct, slow sink",
+                lambda: SlowFileHandler(path, options.sink_ms / 1000),
+                False,
+                min(options.count, 500),
+            ),
+            (
+                "pipeline, slow sink",
+                lambda: SlowFileHandler(path, options.sink_ms / 1000),
+                True,
+                min(options.count, 500),
+            ),
+        ]
+        print(f"{'':20} {'mean us':>9} {'p99 us':>9} {'drain ms':>9} {'dropped':>8}")
+        for name, handler, pipeline, count in cases:
+            result = run(handler(), settings, count, cart, pipeline)
+            print(
+                f"{name:20} {result['mean_us']:9.1f} {result['p99_us']:9.1f}"
+                f" {result['drain_ms']:9.1f} {result['dropped']:8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Throughput benchmark of the discount QR code renderer.
+
+Renders COUNT distinct signed codes three ways:
+
+* inline: render_png() called directly, as a blocking tool would on the
+  event loop;
+* pool: QRCodeRenderer.generate() with the process pool, measured together
+  with the event-loop lag a concurrent heartbeat task observes;
+* cached: the same codes again, answered from the in-process cache.
+
+Usage:
+    python benchmarks/bench_qr_render.py [--count N] [--workers W]
+        [--output file|data_uri] [--mask-pattern 0-7]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_service.config import QRCodeModel
+from customer_service.shared_libraries.qr_codes import (
+    QRCodeRenderer,
+    render_png,
+    sign_token,
+)
+
+KEY = b"benchmark"
+EXPIRY = date(2030, 1, 1)
+
+
+async def heartbeat(lags, stop, interval=0.005):
+    """Records how late the loop wakes up a task that sleeps `interval`."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(loop.time() - start - interval)
+
+
+async def run_pool(renderer, count):
+    lags, stop = [], asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    # Warm up the worker processes before timing.
+    await renderer.generate("warmup", 5, "fixed", EXPIRY)
+    start = time.perf_counter()
+    await asyncio.gather(
+        *(renderer.generate(str(i), 10, "percentage", EXPIRY) for i in range(count))
+    )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    start = time.perf_counter()
+    for i in range(count):
+        await renderer.generate(str(i), 10, "percentage", EXPIRY)
+    cached = time.perf_counter() - start
+    return elapsed, cached, max(lags, default=0.0)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--output", choices=("file", "data_uri"), default="file")
+    parser.add_argument("--mask-pattern", type=int, default=None)
+    options = parser.parse_args()
+
+    tokens = [
+        sign_token(KEY, f"inline-{i}", 10, "percentage", EXPIRY)
+        for i in range(options.count)
+    ]
+    start = time.perf_counter()
+    sizes = [
+        len(render_png(token, mask_pattern=options.mask_pattern)) for token in tokens
+    ]
+    inline = time.perf_counter() - start
+    print(
+        f"token length: {len(tokens[0])} chars,"
+        f" PNG: {sum(sizes) / len(sizes):.0f} bytes"
+    )
+    print(f"inline: {options.count / inline:8.0f} codes/s")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        settings = QRCodeModel(
+            output=options.output,
+            output_dir=output_dir,
+            workers=options.workers,
+            max_pending=options.workers * 4,
+            mask_pattern=options.mask_pattern,
+        )
+        renderer = QRCodeRenderer(settings, KEY)
+        try:
+            elapsed, cached, max_lag = asyncio.run(run_pool(renderer, options.count))
+        finally:
+            renderer.shutdown()
+    print(
+        f"pool ({options.workers} workers): {options.count / elapsed:8.0f} codes/s,"
+        f" max event-loop lag {max_lag * 1000:.1f} ms"
+    )
+    print(f"cached: {cached / options.count * 1e6:8.1f} us/code")
+
+
+if __name__ == "__main__":
+    main()
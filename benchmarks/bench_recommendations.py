@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Build time and serving latency of the recommendation engine.
+
+Builds a RecommendationEngine from a synthetic catalog of BOOKS books and
+the purchase histories of CUSTOMERS synthetic customers
+(synthetic_data.generate_books / generate_customers / baskets), then
+reports:
+
+* the time to build the tables, and how many books have co-purchase
+  neighbours;
+* p50/p99 latency of recommend() for REQUESTS requests of real customers:
+  their owned books, favorite authors and one of their preferred genres;
+* p50/p99 latency of record_purchase(), the incremental update.
+
+Usage:
+    python benchmarks/bench_recommendations.py [--books N] [--customers N]
+        [--requests N] [--top-k K] [--seed S]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_service.shared_libraries.recommendations import RecommendationEngine
+from synthetic_data import baskets, generate_books, generate_customers
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return (
+        statistics.median(timings) * 1000,
+        timings[int(len(timings) * 0.99)] * 1000,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--customers", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=2_000)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    options = parser.parse_args()
+
+    books = (
+        doc for batch in generate_books(options.books, options.seed) for doc in batch
+    )
+    started = time.perf_counter()
+    engine = RecommendationEngine(
+        books,
+        baskets(generate_customers(options.customers, options.books, options.seed)),
+        top_k=options.top_k,
+    )
+    build_secs = time.perf_counter() - started
+    with_neighbors = sum(1 for neighbors in engine.neighbors if len(neighbors))
+    print(
+        f"{options.books:,} books, {options.customers:,} customers:"
+        f" built in {build_secs:.1f}s, {with_neighbors:,} books with neighbours"
+    )
+
+    # Requests come from the first customers; regenerating them is cheap.
+    customers = next(
+        generate_customers(
+            options.requests, options.books, options.seed, batch_size=options.requests
+        )
+    )
+    rng = random.Random(options.seed)
+    timings = []
+    for customer in customers:
+        owned = [
+            item["product_id"]
+            for purchase in customer["purchase_history"]
+            for item in purchase["items"]
+        ]
+        profile = customer["reading_profile"]
+        start = time.perf_counter()
+        engine.recommend(
+            rng.choice(profile["preferred_genres"]),
+            owned=owned,
+            favorite_authors=profile["favorite_authors"],
+        )
+        timings.append(time.perf_counter() - start)
+    p50, p99 = percentiles(timings)
+    print(f"recommend():       p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+    timings = []
+    for basket in baskets([customers[: min(len(customers), 500)]]):
+        start = time.perf_counter()
+        engine.record_purchase(basket)
+        timings.append(time.perf_counter() - start)
+    p50, p99 = percentiles(timings)
+    print(f"record_purchase(): p50 {p50:.3f} ms, p99 {p99:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
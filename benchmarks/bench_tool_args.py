@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Micro-benchmark of the per-call cost of before_tool argument normalization.
+
+Compares normalize_args() with the previous approach, which rebuilt every
+string, list and dict in args recursively on every tool call, for a small
+call and for a modify_cart call with a large cart payload.
+
+Usage:
+    python benchmarks/bench_tool_args.py [--number N]
+"""
+
+import argparse
+import copy
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_service.shared_libraries.callbacks import normalize_args
+
+
+def rebuild_lowercase(value):
+    """The previous behaviour: a lowercased deep rebuild of every value."""
+    if isinstance(value, dict):
+        return {k: rebuild_lowercase(v) for k, v in value.items()}
+    if isinstance(value, str):
+        return value.lower()
+    if isinstance(value, (list, set, tuple)):
+        return type(value)(rebuild_lowercase(i) for i in value)
+    return value
+
+
+CASES = {
+    "get_book_recommendations": {
+        "book_genre": "  Science Fiction ",
+        "customer_id": "123",
+    },
+    "modify_cart": {
+        "customer_id": "123",
+        "items_to_add": [
+            {"product_id": f"978-0-00-{i:06d}-X", "quantity": 1} for i in range(200)
+        ],
+        "items_to_remove": [{"product_id": f"978-1-00-{i:06d}-0"} for i in range(50)],
+    },
+    "update_salesforce_crm": {
+        "customer_id": "123",
+        "details": {"notes": "Customer asked about book clubs. " * 200},
+    },
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=20_000)
+    number = parser.parse_args().number
+
+    print(f"{'tool':<28}{'rebuild (us/call)':>20}{'normalize_args (us/call)':>28}")
+    for tool_name, args in CASES.items():
+        old = timeit.timeit(lambda: rebuild_lowercase(args), number=number)
+        # normalize_args mutates args in place; repeated runs on the already
+        # normalized values do exactly the same work as the first one.
+        args = copy.deepcopy(args)
+        new = timeit.timeit(lambda: normalize_args(tool_name, args), number=number)
+        print(
+            f"{tool_name:<28}{old / number * 1e6:>20.2f}{new / number * 1e6:>28.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Build time and query latency of the similarity index on a synthetic catalog.
+
+Generates a catalog of BOOKS books with synthetic_data.generate_books(),
+builds the IVF index from it in a temporary directory and reports:
+
+* the build time and the index size on disk;
+* p50/p99 latency of VectorIndex.search() for each --nprobe value, over
+  QUERIES free-text queries drawn from the catalog's own genres, titles and
+  authors;
+* recall@k of each nprobe against a scan of every cluster, i.e. how often
+  the probed clusters hold the exact top k.
+
+Usage:
+    python benchmarks/bench_vector_search.py [--books N] [--queries N]
+        [--nprobe 4,16,64] [-k K] [--seed S]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from customer_service.config import VectorSearchModel
+from customer_service.shared_libraries.vector_search import VectorIndex, build_index
+from synthetic_data import GENRES, generate_books
+
+
+def make_queries(books, count: int, seed: int):
+    """Free-text requests mixing a genre with words from titles and authors."""
+    rng = random.Random(seed)
+    sample = rng.sample(books, min(count, len(books)))
+    queries = []
+    for book in sample:
+        words = [w for w in book["title"].split() if len(w) > 3]
+        parts = [rng.choice(GENRES).lower(), *rng.sample(words, min(2, len(words)))]
+        if rng.random() < 0.3:
+            parts.append(book["author"].split()[-1])
+        queries.append(" ".join(parts))
+    return queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--books", type=int, default=200_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument(
+        "--nprobe",
+        type=lambda s: [int(n) for n in s.split(",")],
+        default=[4, 16, 64],
+        help="comma-separated nprobe values",
+    )
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    options = parser.parse_args()
+
+    def documents():
+        for batch in generate_books(options.books, options.seed):
+            yield from batch
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "index")
+        started = time.perf_counter()
+        meta = build_index(documents, path, VectorSearchModel(seed=options.seed))
+        build_secs = time.perf_counter() - started
+        size = sum(
+            os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+        )
+        print(
+            f"{options.books:,} books: built in {build_secs:.1f}s,"
+            f" {size / 2**20:.0f} MiB, {meta['nlist']} clusters"
+        )
+
+        index = VectorIndex(path)
+        sample = next(generate_books(options.books, options.seed, batch_size=50_000))
+        queries = make_queries(sample, options.queries, options.seed)
+        exact = [
+            {hit["isbn"] for hit in index.search(q, options.k, len(index.centroids))}
+            for q in queries
+        ]
+        print(f"{'nprobe':>8}{'p50 ms':>10}{'p99 ms':>10}{'recall@' + str(options.k):>12}")
+        for nprobe in options.nprobe:
+            timings, hits = [], 0
+            for query, truth in zip(queries, exact):
+                start = time.perf_counter()
+                results = index.search(query, options.k, nprobe)
+                timings.append(time.perf_counter() - start)
+                hits += len(truth & {hit["isbn"] for hit in results})
+            timings.sort()
+            recall = hits / max(1, sum(len(truth) for truth in exact))
+            print(
+                f"{nprobe:>8}{statistics.median(timings) * 1000:>10.2f}"
+                f"{timings[int(len(timings) * 0.99)] * 1000:>10.2f}{recall:>12.1%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""Offline load test: replays recorded conversations against root_agent.
+
+Every agent's model is replaced by FakeLlm, a deterministic local model that
+answers each user message with the function calls and the reply recorded for
+it in a conversation file (benchmarks/conversations.json by default). No
+request leaves the process, so what is measured is the overhead of the ADK
+runner, the callbacks and the tools themselves.
+
+For each concurrency level the conversations are replayed in fresh sessions,
+that many at a time, and the report gives p50/p95/p99 of:
+
+* turn: one user message, from run_async() to its last event;
+* tool: a tool call, from the end of before_tool to the start of after_tool
+  (calls answered by the tool cache are not counted);
+* callback: each before_agent / before_model / before_tool / after_tool call;
+* lag: how late the event loop wakes up a task sleeping 5 ms.
+
+Stores run in memory (customers, carts, consultation slots) and the outbox
+and QR codes use a temporary directory. Conversations marked "catalog" need
+the Library.Books collection and only run with --catalog. With
+--catalog-books N, the catalog tools read N synthetic books
+(synthetic_data.generate_books) loaded into a scratch database on the
+configured MongoDB, dropped afterwards, and conversations marked "catalog":
+"synthetic" run instead of those naming real Library.Books titles.
+
+Conversation file format: a list of {"name", "catalog"?, "turns": [{"user",
+"calls", "reply"}]}, where "calls" lists the model's steps, each one call
+{"name", "args"} or a list of calls made in parallel. "{date+N}" in an
+argument is replaced by the date N days from today, and "{isbn:N}" by the
+ISBN of synthetic book N.
+
+Usage:
+    python benchmarks/load_test.py [--concurrency 1,8,32] [--sessions N]
+        [--model-latency-ms MS] [--catalog] [--catalog-books N]
+        [--json results.json]
+"""
+
+import argparse
+import asyncio
+import datetime
+import functools
+import inspect
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, AsyncGenerator, Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.agents import LlmAgent
+from google.adk.models.base_llm import BaseLlm, LlmCapabilities
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.adk.tools.agent_tool import AgentTool
+from google.genai import types
+
+from customer_service.config import get_config
+from synthetic_data import generate_books, insert_batches, isbns
+
+DEFAULT_CONVERSATIONS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "conversations.json"
+)
+CALLBACKS = (
+    "before_agent_callback",
+    "before_model_callback",
+    "before_tool_callback",
+    "after_tool_callback",
+)
+_DATE_PLACEHOLDER = re.compile(r"\{date\+(\d+)\}")
+_ISBN_PLACEHOLDER = re.compile(r"\{isbn:(\d+)\}")
+
+
+class FakeLlm(BaseLlm):
+    """A model that replays the function calls recorded for each user message."""
+
+    model: str = "fake-replay"
+    # User message -> steps, each a list of calls made in one response.
+    script: Dict[str, List[List[Dict[str, Any]]]] = {}
+    replies: Dict[str, str] = {}
+    latency_secs: float = 0.0
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [r"fake-.*"]
+
+    @property
+    def capabilities(self) -> LlmCapabilities:
+        return LlmCapabilities(output_schema_and_tools=True)
+
+    @staticmethod
+    def position(contents: List[types.Content]) -> Tuple[str, int]:
+        """Returns the last user message and how many steps followed it."""
+        steps = 0
+        for content in reversed(contents):
+            parts = content.parts or []
+            if content.role == "model" and any(p.function_call for p in parts):
+                steps += 1
+            elif content.role == "user" and any(p.text for p in parts):
+                return "".join(p.text for p in parts if p.text), steps
+        return "", steps
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.latency_secs:
+            await asyncio.sleep(self.latency_secs)
+        text, step = self.position(llm_request.contents)
+        steps = self.script.get(text, [])
+        if step < len(steps):
+            parts = [
+                types.Part(
+                    function_call=types.FunctionCall(name=call["name"], args=call["args"])
+                )
+                for call in steps[step]
+            ]
+        else:
+            parts = [types.Part(text=self.replies.get(text, "OK."))]
+        yield LlmResponse(
+            content=types.Content(role="model", parts=parts),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=0, candidates_token_count=0, total_token_count=0
+            ),
+        )
+
+
+def _expand(value: Any, today: datetime.date, books: int) -> Any:
+    if isinstance(value, str):
+        value = _DATE_PLACEHOLDER.sub(
+            lambda m: (today + datetime.timedelta(days=int(m.group(1)))).isoformat(),
+            value,
+        )
+        return _ISBN_PLACEHOLDER.sub(
+            lambda m: isbns(np.array([int(m.group(1)) % books]))[0], value
+        )
+    if isinstance(value, list):
+        return [_expand(v, today, books) for v in value]
+    if isinstance(value, dict):
+        return {k: _expand(v, today, books) for k, v in value.items()}
+    return value
+
+
+def load_conversations(
+    path: str, catalog: bool, catalog_books: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Reads a conversation file, dropping catalog conversations unless asked.
+
+    With a synthetic catalog of catalog_books books, only the "synthetic"
+    catalog conversations are kept, since the others name real titles.
+    """
+    with open(path) as f:
+        conversations = json.load(f)
+    today = datetime.date.today()
+    selected = []
+    for conversation in conversations:
+        kind = conversation.get("catalog")
+        if kind == "synthetic" and not catalog_books:
+            continue
+        if kind and kind != "synthetic" and (not catalog or catalog_books):
+            continue
+        for turn in conversation["turns"]:
+            turn["calls"] = [
+                step if isinstance(step, list) else [step]
+                for step in _expand(turn["calls"], today, max(catalog_books, 1))
+            ]
+        selected.append(conversation)
+    users = [turn["user"] for c in selected for turn in c["turns"]]
+    if len(users) != len(set(users)):
+        raise ValueError("User messages must be unique across conversations")
+    return selected
+
+
+def build_model(conversations: List[Dict[str, Any]], latency_secs: float) -> FakeLlm:
+    """Returns a FakeLlm scripted with every turn of the conversations."""
+    turns = [turn for conversation in conversations for turn in conversation["turns"]]
+    return FakeLlm(
+        script={turn["user"]: turn["calls"] for turn in turns},
+        replies={turn["user"]: turn["reply"] for turn in turns},
+        latency_secs=latency_secs,
+    )
+
+
+def configure_offline(workdir: str, tool_cache: bool, rate_limit: bool) -> None:
+    """Points every store the tools use at memory or at files in workdir."""
+    config = get_config()
+    config.customer_settings.backend = "memory"
+    config.cart_settings.backend = "memory"
+    config.scheduling_settings.backend = "memory"
+    config.outbox_settings.path = os.path.join(workdir, "outbox.sqlite3")
+    config.qr_code_settings.output_dir = os.path.join(workdir, "qr_codes")
+    config.tool_cache_settings.enabled = tool_cache
+    config.rate_limit_settings.enabled = rate_limit
+
+
+def seed_catalog(books: int, seed: int) -> str:
+    """
+    Loads a synthetic catalog into a scratch database and points the catalog
+    tools at it; Library.Books is not touched.
+
+    Returns:
+        The name of the scratch database, for the caller to drop.
+    """
+    from customer_service.shared_libraries.mongo import get_collection
+
+    settings = get_config().catalog_settings
+    settings.database = f"load_test_{os.getpid()}"
+    started = time.perf_counter()
+    count = insert_batches(
+        generate_books(books, seed, store_quantities=True),
+        get_collection(settings.database, settings.collection),
+    )
+    print(
+        f"loaded {count:,} synthetic books into {settings.database}"
+        f" in {time.perf_counter() - started:.1f}s",
+        file=sys.stderr,
+    )
+    return settings.database
+
+
+class Probe:
+    """Timings collected while replaying at one concurrency level."""
+
+    def __init__(self):
+        self.turns: List[float] = []
+        self.tools: Dict[str, List[float]] = defaultdict(list)
+        self.callbacks: Dict[str, List[float]] = defaultdict(list)
+        self.lags: List[float] = []
+        self.errors = 0
+        self._tool_started: Dict[str, float] = {}
+
+    def wrap(self, name: str, callback):
+        """Returns callback timed under name; tool callbacks also time the tool."""
+
+        def on_exit(result, args, kwargs, start):
+            end = time.perf_counter()
+            self.callbacks[name].append(end - start)
+            if name == "before_tool" and result is None:
+                tool_context = kwargs.get("tool_context") or args[2]
+                self._tool_started[tool_context.function_call_id] = end
+
+        def on_entry(args, kwargs):
+            if name == "after_tool":
+                tool_context = kwargs.get("tool_context") or args[2]
+                tool = kwargs.get("tool") or args[0]
+                started = self._tool_started.pop(tool_context.function_call_id, None)
+                if started is not None:
+                    self.tools[tool.name].append(time.perf_counter() - started)
+
+        if inspect.iscoroutinefunction(callback):
+
+            @functools.wraps(callback)
+            async def timed(*args, **kwargs):
+                on_entry(args, kwargs)
+                start = time.perf_counter()
+                result = await callback(*args, **kwargs)
+                on_exit(result, args, kwargs, start)
+                return result
+
+        else:
+
+            @functools.wraps(callback)
+            def timed(*args, **kwargs):
+                on_entry(args, kwargs)
+                start = time.perf_counter()
+                result = callback(*args, **kwargs)
+                on_exit(result, args, kwargs, start)
+                return result
+
+        return timed
+
+
+def instrument(agent: LlmAgent, model: FakeLlm, probes: List[Probe]) -> None:
+    """Swaps in the fake model and timed callbacks, recursively over AgentTools."""
+
+    agent.model = model
+    for attribute in CALLBACKS:
+        original = getattr(agent, attribute)
+        if original is None or isinstance(original, list):
+            continue
+        name = attribute.removesuffix("_callback")
+
+        # The callbacks report to the probe of the level being run.
+        def bind(original=original, name=name):
+            if inspect.iscoroutinefunction(original):
+
+                async def callback(*args, **kwargs):
+                    return await probes[-1].wrap(name, original)(*args, **kwargs)
+
+            else:
+
+                def callback(*args, **kwargs):
+                    return probes[-1].wrap(name, original)(*args, **kwargs)
+
+            return callback
+
+        setattr(agent, attribute, bind())
+    for tool in agent.tools:
+        if isinstance(tool, AgentTool) and isinstance(tool.agent, LlmAgent):
+            instrument(tool.agent, model, probes)
+
+
+async def heartbeat(probe: Probe, stop: asyncio.Event, interval: float = 0.005):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        probe.lags.append(loop.time() - start - interval)
+
+
+async def replay(
+    runner: InMemoryRunner, conversation: Dict[str, Any], user_id: str, probe: Probe
+) -> None:
+    session = await runner.session_service.create_session(
+        app_name=runner.app_name, user_id=user_id
+    )
+    for turn in conversation["turns"]:
+        message = types.Content(role="user", parts=[types.Part(text=turn["user"])])
+        start = time.perf_counter()
+        try:
+            async for event in runner.run_async(
+                user_id=user_id, session_id=session.id, new_message=message
+            ):
+                if event.error_code:
+                    probe.errors += 1
+        except Exception as e:
+            logging.getLogger(__name__).error("Turn failed: %s", e)
+            probe.errors += 1
+        probe.turns.append(time.perf_counter() - start)
+
+
+async def run_level(
+    runner: InMemoryRunner,
+    conversations: List[Dict[str, Any]],
+    concurrency: int,
+    sessions: int,
+    probe: Probe,
+) -> float:
+    """Replays `sessions` conversations, `concurrency` at a time; returns seconds."""
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with slots:
+            await replay(runner, conversations[i % len(conversations)], f"user-{i}", probe)
+
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(probe, stop))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    return elapsed
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Returns p50/p95/p99 and the maximum in milliseconds."""
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    p50, p95, p99 = np.percentile(np.asarray(samples) * 1000, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 3),
+        "p95": round(float(p95), 3),
+        "p99": round(float(p99), 3),
+        "max": round(max(samples) * 1000, 3),
+    }
+
+
+def summarize(probe: Probe, concurrency: int, elapsed: float) -> Dict[str, Any]:
+    tool_samples = [s for samples in probe.tools.values() for s in samples]
+    callback_samples = [s for samples in probe.callbacks.values() for s in samples]
+    return {
+        "concurrency": concurrency,
+        "turns": len(probe.turns),
+        "errors": probe.errors,
+        "turns_per_sec": round(len(probe.turns) / elapsed, 1),
+        "turn_ms": percentiles(probe.turns),
+        "tool_ms": percentiles(tool_samples),
+        "callback_ms": percentiles(callback_samples),
+        # Time spent in callbacks per turn, as a share of the turn latency.
+        "callback_share": round(sum(callback_samples) / sum(probe.turns), 4)
+        if probe.turns
+        else 0.0,
+        "lag_ms": percentiles(probe.lags),
+        "per_tool_ms": {name: percentiles(s) for name, s in sorted(probe.tools.items())},
+        "per_callback_ms": {
+            name: percentiles(s) for name, s in sorted(probe.callbacks.items())
+        },
+    }
+
+
+def print_report(results: List[Dict[str, Any]], per_tool: bool) -> None:
+    def triple(stats):
+        return f"{stats['p50']:7.2f}{stats['p95']:8.2f}{stats['p99']:8.2f}"
+
+    header = (
+        f"{'conc':>5}{'turns/s':>9}{'err':>5} | {'turn p50/p95/p99 ms':>23}"
+        f" | {'tool p50/p95/p99 ms':>23} | {'callback p50/p95/p99 ms':>23}"
+        f"{'share':>7} | {'lag p50/p99/max ms':>23}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        lag = r["lag_ms"]
+        print(
+            f"{r['concurrency']:>5}{r['turns_per_sec']:>9.1f}{r['errors']:>5} |"
+            f" {triple(r['turn_ms'])} | {triple(r['tool_ms'])} |"
+            f" {triple(r['callback_ms'])}{r['callback_share']:>7.1%} |"
+            f" {lag['p50']:7.2f}{lag['p99']:8.2f}{lag['max']:8.2f}"
+        )
+    if per_tool:
+        for r in results:
+            print(f"\nconcurrency {r['concurrency']}")
+            for name, stats in {**r["per_tool_ms"], **r["per_callback_ms"]}.items():
+                print(f"  {name:<36}{triple(stats)}")
+
+
+async def main_async(options) -> List[Dict[str, Any]]:
+    from customer_service.agent import root_agent
+
+    conversations = load_conversations(
+        options.conversations, options.catalog, options.catalog_books
+    )
+    model = build_model(conversations, options.model_latency_ms / 1000)
+    probes: List[Probe] = [Probe()]
+    instrument(root_agent, model, probes)
+    runner = InMemoryRunner(agent=root_agent, app_name="load_test")
+
+    # One unmeasured pass warms up imports, caches and the worker pools.
+    await run_level(runner, conversations, 1, len(conversations), probes[-1])
+    results = []
+    for concurrency in options.concurrency:
+        probes.append(Probe())
+        sessions = options.sessions or max(concurrency * 4, len(conversations))
+        elapsed = await run_level(
+            runner, conversations, concurrency, sessions, probes[-1]
+        )
+        results.append(summarize(probes[-1], concurrency, elapsed))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--conversations", default=DEFAULT_CONVERSATIONS)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda s: [int(level) for level in s.split(",")],
+        default=[1, 8, 32],
+        help="comma-separated concurrency levels",
+    )
+    parser.add_argument(
+        "--sessions",
+        type=int,
+        default=0,
+        help="conversations replayed per level (default: 4 x concurrency)",
+    )
+    parser.add_argument("--model-latency-ms", type=float, default=0.0)
+    parser.add_argument("--catalog", action="store_true")
+    parser.add_argument(
+        "--catalog-books",
+        type=int,
+        default=0,
+        help="serve the catalog from this many synthetic books in a scratch database",
+    )
+    parser.add_argument("--seed", type=int, default=42, help="synthetic catalog seed")
+    parser.add_argument("--no-tool-cache", action="store_true")
+    parser.add_argument("--rate-limit", action="store_true")
+    parser.add_argument("--per-tool", action="store_true")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    options = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_offline(workdir, not options.no_tool_cache, options.rate_limit)
+        logging.basicConfig(level=options.log_level)
+        scratch = None
+        if options.catalog_books:
+            scratch = seed_catalog(options.catalog_books, options.seed)
+        try:
+            results = asyncio.run(main_async(options))
+        finally:
+            if scratch:
+                from customer_service.shared_libraries.mongo import get_client
+
+                get_client().drop_database(scratch)
+    print_report(results, options.per_tool)
+    if options.json:
+        with open(options.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
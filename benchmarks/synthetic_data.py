@@ -0,0 +1,548 @@
+#!/usr/bin/env python3
+"""Seeded, streaming generator of a production-scale catalog and customer base.
+
+Produces Library.Books documents in the format of sampleData.py and customer
+documents in the shape of customer_service.entities.customer.Customer, in
+batches, so generating millions of them keeps memory flat. It is the fixture
+source for the performance benchmarks.
+
+Distributions:
+
+* genres follow a Zipf-like share (a few genres hold most of the catalog);
+* authors are Zipf distributed too: a few prolific authors write hundreds
+  of books, most only a handful, and each writes mostly in one genre;
+* customers make a geometric number of purchases of one to four books, and
+  the books they buy are Zipf distributed by popularity rank, so a small
+  head of bestsellers accounts for most purchases.
+
+A book is a pure function of (seed, index): every field is derived from
+hashes of the index, so the same seed gives the same catalog whatever the
+batch size, and customers can name the books they bought without a lookup.
+Customers are generated per batch from a seeded generator, so they depend on
+the seed and the batch size.
+
+Usage:
+    python benchmarks/synthetic_data.py books --count 1000000 > books.jsonl
+    python benchmarks/synthetic_data.py customers --count 100000 --books 1000000 \\
+        --format csv --output customers.csv
+    python benchmarks/synthetic_data.py books --count 1000000 --mongo
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Sequence
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GENRES = (
+    "Fiction", "Mystery", "Romance", "Fantasy", "Science Fiction", "Thriller",
+    "Biography", "History", "Self-Help", "Young Adult", "Children", "Horror",
+    "Memoir", "Science", "Poetry", "Business", "Travel", "Cooking", "Philosophy",
+    "Graphic Novel",
+)
+FIRST_NAMES = (
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda",
+    "David", "Elizabeth", "William", "Barbara", "Richard", "Susan", "Joseph",
+    "Jessica", "Thomas", "Sarah", "Charles", "Karen", "Priya", "Arjun", "Mei",
+    "Hiro", "Fatima", "Omar", "Sofia", "Mateo", "Amara", "Kwame", "Ingrid",
+    "Lars", "Chloe", "Noah", "Aisha", "Ravi", "Elena", "Luca", "Yuki", "Ana",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson",
+    "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez",
+    "Thompson", "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis",
+    "Robinson", "Walker", "Young", "Allen", "King", "Wright", "Scott", "Torres",
+    "Nguyen", "Hill", "Flores", "Green", "Adams", "Nelson", "Baker", "Hall",
+    "Rivera", "Campbell", "Mitchell", "Carter", "Roberts", "Dey", "Sato",
+    "Kowalski", "Okafor", "Haddad", "Novak", "Larsen", "Rossi", "Silva", "Kim",
+)
+ADJECTIVES = (
+    "Silent", "Last", "Hidden", "Broken", "Golden", "Forgotten", "Midnight",
+    "Crimson", "Secret", "Lost", "Burning", "Quiet", "Wild", "Endless", "Hollow",
+    "Shattered", "Distant", "Bright", "Frozen", "Wandering", "Little", "Dark",
+    "Invisible", "Beautiful", "Dangerous", "Final", "First", "Strange", "Radiant",
+    "Restless",
+)
+NOUNS = (
+    "Garden", "River", "House", "Library", "Kingdom", "Ocean", "Witness",
+    "Promise", "Shadow", "Winter", "Orchard", "Lighthouse", "Island", "Letter",
+    "Mountain", "Storm", "Road", "Daughter", "Stranger", "Clockmaker", "Map",
+    "Crown", "Forest", "Memory", "Signal", "Harbor", "Bridge", "Machine", "Song",
+    "Empire", "Fire", "Mirror", "Journey", "Secret", "City", "Star", "Wolf",
+    "Tide", "Archive", "Heart",
+)
+PLACES = (
+    "Paris", "the North", "Avalon", "Kyoto", "the Deep", "Tomorrow", "Venice",
+    "the Valley", "Lagos", "the Moon", "Prague", "the Sea", "Cairo", "Everwood",
+    "the Sky", "Lisbon", "the Desert", "Oslo", "Mumbai", "the Old World",
+)
+PUBLISHERS = (
+    "Penguin Random House", "HarperCollins", "Simon & Schuster", "Macmillan",
+    "Hachette", "Scholastic", "Bloomsbury", "Scribner", "Vintage", "Tor Books",
+    "Orbit", "Knopf", "Del Rey", "Crown", "Little, Brown", "Faber & Faber",
+)
+LANGUAGES = ("English", "Spanish", "French", "German", "Japanese", "Hindi")
+LANGUAGE_WEIGHTS = (0.82, 0.06, 0.04, 0.03, 0.03, 0.02)
+STORES = ("main", "downtown", "uptown", "airport", "campus")
+READING_LEVELS = ("beginner", "intermediate", "advanced")
+INTERESTS = (
+    "book clubs", "author events", "reading challenges", "audiobooks",
+    "signed editions", "poetry readings", "children's story time", "rare books",
+)
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+# 3**18 is coprime with 10**9, so index -> ISBN body is a bijection.
+_ISBN_MULTIPLIER = 387_420_489
+_EPOCH = datetime.date(2020, 1, 1)
+_LANGUAGE_CDF = np.cumsum(LANGUAGE_WEIGHTS)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    x = (x + np.uint64(0x9E3779B97F4A7C15)) & _MASK64
+    x = ((x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)) & _MASK64
+    x = ((x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)) & _MASK64
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniform(seed: int, indices: np.ndarray, salt: int) -> np.ndarray:
+    """Deterministic uniform floats in [0, 1) for each index."""
+    with np.errstate(over="ignore"):
+        key = _splitmix64(np.uint64(seed) * np.uint64(1_000_003) + np.uint64(salt))
+        h = _splitmix64(indices.astype(np.uint64) ^ key)
+    return (h >> np.uint64(11)).astype(np.float64) * 2.0**-53
+
+
+def zipf_weights(n: int, exponent: float) -> np.ndarray:
+    """Normalized weights proportional to 1 / rank**exponent for n ranks."""
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    return weights / weights.sum()
+
+
+def _pick(u: np.ndarray, cumulative: np.ndarray) -> np.ndarray:
+    """Maps uniforms to indices drawn by cumulative weights (inverse CDF)."""
+    return np.minimum(
+        np.searchsorted(cumulative, u, side="right"), len(cumulative) - 1
+    )
+
+
+def isbns(indices: np.ndarray) -> List[str]:
+    """Returns the unique, checksum-valid ISBN-13 of each book index."""
+    body = (indices.astype(np.int64) * _ISBN_MULTIPLIER + 123_456_789) % 10**9
+    digits = (body[:, None] // 10 ** np.arange(8, -1, -1)) % 10
+    # "978" contributes 9*1 + 7*3 + 8*1 = 38; the body digits take weights
+    # 3, 1, 3, ... from the fourth position on.
+    weights = np.tile([3, 1], 5)[:9]
+    check = (10 - (38 + digits @ weights) % 10) % 10
+    return [
+        f"978-{b // 10**8}-{b // 10**4 % 10**4:04d}-{b % 10**4:04d}-{c}"
+        for b, c in zip(body.tolist(), check.tolist())
+    ]
+
+
+class CatalogSpec:
+    """The shape of a synthetic catalog of `count` books."""
+
+    def __init__(self, count: int, seed: int = 42, books_per_author: float = 8.0):
+        self.count = count
+        self.seed = seed
+        self.n_authors = max(1, int(count / books_per_author))
+        self.genre_cdf = np.cumsum(zipf_weights(len(GENRES), 0.9))
+        self.author_cdf = np.cumsum(zipf_weights(self.n_authors, 0.5))
+        # Each author's main genre and name, derived from the author index.
+        authors = np.arange(self.n_authors)
+        self.author_genre = _pick(_uniform(seed, authors, 1), self.genre_cdf)
+        self.author_first = (_uniform(seed, authors, 2) * len(FIRST_NAMES)).astype(int)
+        self.author_last = (_uniform(seed, authors, 3) * len(LAST_NAMES)).astype(int)
+
+    def author_name(self, author: int) -> str:
+        first = FIRST_NAMES[self.author_first[author]]
+        last = LAST_NAMES[self.author_last[author]]
+        # Disambiguates authors sharing a name, as initials do on covers.
+        initial = chr(ord("A") + author % 26) if author >= len(FIRST_NAMES) else ""
+        return f"{first} {initial + '. ' if initial else ''}{last}"
+
+    def columns(self, indices: np.ndarray) -> Dict[str, Any]:
+        """Returns the fields of the given books as arrays and lists."""
+        s = self.seed
+        author = _pick(_uniform(s, indices, 10), self.author_cdf)
+        genre = np.where(
+            _uniform(s, indices, 11) < 0.85,
+            self.author_genre[author],
+            _pick(_uniform(s, indices, 12), self.genre_cdf),
+        )
+        pattern = (_uniform(s, indices, 13) * 4).astype(int)
+        adjective = (_uniform(s, indices, 14) * len(ADJECTIVES)).astype(int)
+        noun = (_uniform(s, indices, 15) * len(NOUNS)).astype(int)
+        place = (_uniform(s, indices, 16) * len(PLACES)).astype(int)
+        titles = []
+        for p, a, n, pl, i in zip(pattern, adjective, noun, place, indices.tolist()):
+            if p == 0:
+                title = f"The {ADJECTIVES[a]} {NOUNS[n]}"
+            elif p == 1:
+                title = f"The {NOUNS[n]} of {PLACES[pl]}"
+            elif p == 2:
+                title = f"{ADJECTIVES[a]} {NOUNS[n]}s"
+            else:
+                title = f"A {NOUNS[n]} in {PLACES[pl]}"
+            # Volume numbers keep titles from repeating too often.
+            titles.append(title if i % 7 else f"{title}, Book {i % 5 + 2}")
+        # Most of the catalog is recent, with a long tail of classics.
+        age = np.floor(-np.log1p(-_uniform(s, indices, 17)) * 12).astype(int)
+        total = 1 + np.floor(-np.log1p(-_uniform(s, indices, 18)) * 4).astype(int)
+        available = np.floor(_uniform(s, indices, 19) * (total + 1)).astype(int)
+        available = np.minimum(available, total)
+        # $10.99 to $26.99, cheaper books being more common.
+        price = np.round(np.exp(2.4 + 0.9 * _uniform(s, indices, 20))) - 0.01
+        added = (_uniform(s, indices, 21) * 5 * 365).astype(int)
+        return {
+            "author": author,
+            "genre": genre,
+            "title": titles,
+            "year": np.maximum(2025 - age, 1850),
+            "total": total,
+            "available": available,
+            "price": price,
+            "publisher": (_uniform(s, indices, 22) * len(PUBLISHERS)).astype(int),
+            "language": _pick(_uniform(s, indices, 23), _LANGUAGE_CDF),
+            "maintenance": _uniform(s, indices, 24) < 0.01,
+            "location": (_uniform(s, indices, 25) * 26 * 10 * 50).astype(int),
+            "added": added,
+            "updated": added + (_uniform(s, indices, 26) * 60).astype(int),
+            "isbn": isbns(indices),
+        }
+
+    def names(self, indices: np.ndarray) -> List[str]:
+        """Returns "Title by Author" for the given books."""
+        columns = self.columns(indices)
+        return [
+            f"{title} by {self.author_name(author)}"
+            for title, author in zip(columns["title"], columns["author"].tolist())
+        ]
+
+
+def _iso(days: int) -> str:
+    moment = datetime.datetime.combine(
+        _EPOCH + datetime.timedelta(days=int(days)), datetime.time(10, 30)
+    )
+    return moment.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def generate_books(
+    count: int,
+    seed: int = 42,
+    batch_size: int = 10_000,
+    start: int = 0,
+    store_quantities: bool = False,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yields Library.Books documents in batches.
+
+    Args:
+        count: Number of books in the catalog.
+        seed: Seed of the catalog.
+        batch_size: Documents per yielded batch.
+        start: Index of the first book to generate, e.g. to resume.
+        store_quantities: Also split the stock over STORES in a
+            "store_quantities" map, as check_products_availability reads it.
+    """
+    spec = CatalogSpec(count, seed)
+    for first in range(start, count, batch_size):
+        indices = np.arange(first, min(first + batch_size, count))
+        c = spec.columns(indices)
+        split = _uniform(seed, indices, 27) if store_quantities else None
+        batch = []
+        for j in range(len(indices)):
+            available = int(c["available"][j])
+            if c["maintenance"][j]:
+                status = "maintenance"
+            else:
+                status = "available" if available else "checked_out"
+            location = int(c["location"][j])
+            doc = {
+                "title": c["title"][j],
+                "author": spec.author_name(int(c["author"][j])),
+                "isbn": c["isbn"][j],
+                "genre": GENRES[c["genre"][j]],
+                "publication_year": int(c["year"][j]),
+                "quantity_available": available,
+                "quantity_total": int(c["total"][j]),
+                "location": (
+                    f"{chr(65 + location // 500)}-{location // 50 % 10}"
+                    f"-{location % 50 + 1}"
+                ),
+                "publisher": PUBLISHERS[c["publisher"][j]],
+                "language": LANGUAGES[c["language"][j]],
+                "status": status,
+                "price": float(c["price"][j]),
+                "added_date": _iso(c["added"][j]),
+                "last_updated": _iso(c["updated"][j]),
+            }
+            if split is not None:
+                # The main store holds the larger share of the stock.
+                main = int(round(available * (0.4 + 0.4 * split[j])))
+                rest = available - main
+                others = len(STORES) - 1
+                doc["store_quantities"] = {
+                    STORES[0]: main,
+                    **{
+                        store: rest // others + (k < rest % others)
+                        for k, store in enumerate(STORES[1:])
+                    },
+                }
+            batch.append(doc)
+        yield batch
+
+
+def _zipf_ranks(
+    rng: np.random.Generator, size: int, n: int, exponent: float
+) -> np.ndarray:
+    """Draws 0-based popularity ranks from a Zipf law truncated to n items."""
+    ranks = rng.zipf(exponent, size) - 1
+    overflow = ranks >= n
+    while overflow.any():
+        ranks[overflow] = rng.zipf(exponent, int(overflow.sum())) - 1
+        overflow = ranks >= n
+    return ranks
+
+
+def generate_customers(
+    count: int,
+    books: int,
+    seed: int = 42,
+    batch_size: int = 10_000,
+    start: int = 0,
+    zipf_exponent: float = 1.2,
+    mean_purchases: float = 6.0,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yields customer documents (customer_service.users) in batches.
+
+    Args:
+        count: Number of customers.
+        books: Size of the catalog the purchases refer to; books are
+            identified by their ISBN in generate_books(books, seed).
+        seed: Seed of the catalog and the customers.
+        batch_size: Documents per yielded batch.
+        start: Index of the first customer to generate.
+        zipf_exponent: Skew of book popularity; larger is more skewed.
+        mean_purchases: Mean number of purchases per customer.
+    """
+    spec = CatalogSpec(books, seed)
+    # Popularity rank -> book index: an affine bijection spreads the
+    # bestsellers over the catalog without a permutation table.
+    multiplier = next(m for m in range(7_919, 10**9, 2) if np.gcd(m, books) == 1)
+    offset = seed % books
+    for first in range(start, count, batch_size):
+        size = min(batch_size, count - first)
+        rng = np.random.default_rng([seed, first])
+        n_purchases = rng.geometric(1 / mean_purchases, size)
+        n_items = rng.integers(1, 5, int(n_purchases.sum()))
+        ranks = _zipf_ranks(rng, int(n_items.sum()), books, zipf_exponent)
+        book_ids = (ranks * multiplier + offset) % books
+        bought = np.unique(book_ids)
+        isbn_of = dict(zip(bought.tolist(), isbns(bought)))
+        names = dict(zip(bought.tolist(), spec.names(bought)))
+        genres = _pick(rng.random((size, 3)), spec.genre_cdf)
+        purchase_days = rng.integers(0, 5 * 365, int(n_purchases.sum()))
+        start_days = rng.integers(0, 5 * 365, size)
+
+        batch = []
+        purchase = item = 0
+        for j in range(size):
+            index = first + j
+            history = []
+            for _ in range(int(n_purchases[j])):
+                # A bestseller drawn twice for one purchase is one line with
+                # quantity 2, as a checkout records it.
+                items: Dict[int, Dict[str, Any]] = {}
+                for _ in range(int(n_items[purchase])):
+                    book = int(book_ids[item])
+                    if book in items:
+                        items[book]["quantity"] += 1
+                    else:
+                        items[book] = {
+                            "product_id": isbn_of[book],
+                            "name": names[book],
+                            "quantity": 1,
+                        }
+                    item += 1
+                day = _EPOCH + datetime.timedelta(days=int(purchase_days[purchase]))
+                history.append(
+                    {
+                        "date": day.isoformat(),
+                        "items": list(items.values()),
+                        "total_amount": round(12.99 * int(n_items[purchase]), 2),
+                    }
+                )
+                purchase += 1
+            history.sort(key=lambda p: p["date"])
+            first_name = FIRST_NAMES[index % len(FIRST_NAMES)]
+            last_name = LAST_NAMES[index // len(FIRST_NAMES) % len(LAST_NAMES)]
+            preferred = list(dict.fromkeys(GENRES[g].lower() for g in genres[j]))
+            since = _EPOCH + datetime.timedelta(days=int(start_days[j]))
+            authors = {
+                item["name"].split(" by ", 1)[1]
+                for purchase_doc in history
+                for item in purchase_doc["items"]
+            }
+            batch.append(
+                {
+                    "account_number": f"{400_000_000 + index:09d}",
+                    "customer_id": f"cust-{index:08d}",
+                    "customer_first_name": first_name,
+                    "customer_last_name": last_name,
+                    "email": f"{first_name}.{last_name}.{index}@example.com".lower(),
+                    "phone_number": (
+                        f"+1-555-{index // 10_000 % 1000:03d}-{index % 10_000:04d}"
+                    ),
+                    "customer_start_date": since.isoformat(),
+                    "years_as_customer": (datetime.date(2025, 1, 1) - since).days // 365,
+                    "billing_address": {
+                        "street": f"{index % 9_000 + 1} Main St",
+                        "city": "Anytown",
+                        "state": "CA",
+                        "zip": f"{10_000 + index % 89_999:05d}",
+                    },
+                    "purchase_history": history,
+                    "loyalty_points": int(sum(p["total_amount"] for p in history) * 2),
+                    "preferred_store": STORES[index % len(STORES)],
+                    "communication_preferences": {
+                        "email": True,
+                        "sms": bool(index % 3),
+                        "push_notifications": bool(index % 2),
+                    },
+                    "reading_profile": {
+                        "preferred_genres": preferred,
+                        "reading_level": READING_LEVELS[index % len(READING_LEVELS)],
+                        "favorite_authors": sorted(authors)[:3],
+                        "reading_goals": f"Read {12 * (index % 4 + 1)} books this year",
+                        "interests": [INTERESTS[index % len(INTERESTS)]],
+                    },
+                    "scheduled_appointments": {},
+                }
+            )
+        yield batch
+
+
+def baskets(customers: Iterator[List[Dict[str, Any]]]) -> Iterator[List[str]]:
+    """Yields the product ids bought by each customer, for RecommendationEngine."""
+    for batch in customers:
+        for customer in batch:
+            yield [
+                item["product_id"]
+                for purchase in customer["purchase_history"]
+                for item in purchase["items"]
+            ]
+
+
+def _flatten(doc: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    row = {}
+    for key, value in doc.items():
+        if isinstance(value, dict):
+            row.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, list):
+            row[f"{prefix}{key}"] = json.dumps(value, separators=(",", ":"))
+        else:
+            row[f"{prefix}{key}"] = value
+    return row
+
+
+def write_batches(
+    batches: Iterator[List[Dict[str, Any]]], out, fmt: str, fields: Sequence[str] = ()
+) -> int:
+    """Writes batches as JSON lines or CSV; nested fields are dotted in CSV."""
+    written = 0
+    writer = None
+    for batch in batches:
+        if fmt == "jsonl":
+            out.writelines(
+                json.dumps(doc, separators=(",", ":")) + "\n" for doc in batch
+            )
+        else:
+            rows = [_flatten(doc) for doc in batch]
+            if writer is None:
+                writer = csv.DictWriter(
+                    out, fieldnames=list(fields) or list(rows[0]), extrasaction="ignore"
+                )
+                writer.writeheader()
+            writer.writerows(rows)
+        written += len(batch)
+    return written
+
+
+def insert_batches(batches: Iterator[List[Dict[str, Any]]], collection) -> int:
+    """Inserts batches with unordered insert_many calls."""
+    inserted = 0
+    for batch in batches:
+        inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+    return inserted
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("kind", choices=("books", "customers"))
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument(
+        "--books", type=int, default=100_000, help="catalog size customers buy from"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--start", type=int, default=0)
+    parser.add_argument("--store-quantities", action="store_true")
+    parser.add_argument("--format", choices=("jsonl", "csv"), default="jsonl")
+    parser.add_argument("--output", help="file to write (default: stdout)")
+    parser.add_argument(
+        "--mongo",
+        action="store_true",
+        help="insert into Library.Books / customer_service.users instead",
+    )
+    options = parser.parse_args()
+
+    if options.kind == "books":
+        batches = generate_books(
+            options.count,
+            options.seed,
+            options.batch_size,
+            options.start,
+            options.store_quantities,
+        )
+    else:
+        batches = generate_customers(
+            options.count, options.books, options.seed, options.batch_size, options.start
+        )
+
+    started = time.perf_counter()
+    if options.mongo:
+        from customer_service.config import get_config
+        from customer_service.shared_libraries.mongo import get_collection
+
+        config = get_config()
+        if options.kind == "books":
+            settings = config.catalog_settings
+        else:
+            settings = config.customer_settings
+        count = insert_batches(
+            batches, get_collection(settings.database, settings.collection)
+        )
+    elif options.output:
+        with open(options.output, "w", newline="") as out:
+            count = write_batches(batches, out, options.format)
+    else:
+        count = write_batches(batches, sys.stdout, options.format)
+    elapsed = time.perf_counter() - started
+    print(
+        f"{count} {options.kind} in {elapsed:.1f}s ({count / elapsed:,.0f}/s)",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
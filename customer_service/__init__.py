@@ -1,7 +1,14 @@
-
 """Includes all shared libraries for the agent."""
 
-from . import agent
-
+import importlib
 
 __all__ = ["agent"]
+
+
+def __getattr__(name):
+    # The agent is built on first access to customer_service.agent, so
+    # scripts that only need the config or a shared library (the ingestion
+    # CLI, benchmarks, sampleData.py) do not construct it.
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
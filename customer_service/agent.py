@@ -5,12 +5,12 @@ from google.adk.agents import LlmAgent
 from google.adk.tools.agent_tool import AgentTool
 from .sub_agents.googlesearchagent import academic_websearch_agent
 from .sub_agents.inventoryAgent import librarian_agent
-from .sub_agents.Databaseagent import database_agent 
 import logging
 import warnings
 from google.adk import Agent
-from .config import Config
-from .prompts import GLOBAL_INSTRUCTION, INSTRUCTION
+from .config import get_config
+from .prompts import INSTRUCTION, global_instruction
+from .shared_libraries.logging_pipeline import configure_logging
 from .shared_libraries.callbacks import (
     rate_limit_callback,
     before_agent,
@@ -22,29 +22,33 @@ from .tools.tools import (
     approve_discount,
     sync_ask_for_approval,
     update_salesforce_crm,
+    get_customer_record,
     access_cart_information,
     modify_cart,
     get_book_recommendations,
     check_product_availability,
+    check_products_availability,
     schedule_reading_consultation,
     get_available_consultation_times,
+    find_next_consultation_slots,
     send_reading_recommendations,
     generate_qr_code,
 )
 
-from .sub_agents.googlesearchagent import academic_websearch_agent
-
 warnings.filterwarnings("ignore", category=UserWarning, module=".*pydantic.*")
 
-configs = Config()
+configs = get_config()
 
 # configure logging __name__
 logger = logging.getLogger(__name__)
+# ADK has set up its handlers by the time it loads the agent; move them
+# off the request path.
+configure_logging()
 
 
 root_agent = Agent(
     model=configs.agent_settings.model,
-    global_instruction=GLOBAL_INSTRUCTION,
+    global_instruction=global_instruction,
     instruction=INSTRUCTION,
     name=configs.agent_settings.name,
     tools=[
@@ -52,12 +56,15 @@ root_agent = Agent(
         approve_discount,
         sync_ask_for_approval,
         update_salesforce_crm,
+        get_customer_record,
         access_cart_information,
         modify_cart,
         get_book_recommendations,
         check_product_availability,
+        check_products_availability,
         schedule_reading_consultation,
         get_available_consultation_times,
+        find_next_consultation_slots,
         send_reading_recommendations,
         generate_qr_code,
         AgentTool(agent=academic_websearch_agent) , # Add the web search agent as a tool
@@ -2,14 +2,24 @@
 
 import os
 import logging
+import tempfile
+from functools import lru_cache
+from typing import Dict
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import BaseModel, Field
 
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 
+def _data_dir() -> str:
+    """Per-user directory for state that must outlive the process and a reboot."""
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(
+        os.path.expanduser("~"), ".local", "state"
+    )
+    return os.path.join(base, "library_service")
+
+
 class AgentModel(BaseModel):
     """Agent model settings."""
 
@@ -17,6 +27,255 @@ class AgentModel(BaseModel):
     model: str = Field(default="gemini-2.5-flash")
 
 
+class MongoModel(BaseModel):
+    """MongoDB connection settings shared by every Mongo-backed tool."""
+
+    uri: str = Field(default="mongodb://localhost:27017/")
+    max_pool_size: int = Field(default=50)
+    min_pool_size: int = Field(default=0)
+    max_idle_time_ms: int = Field(default=300_000)
+    connect_timeout_ms: int = Field(default=5_000)
+    server_selection_timeout_ms: int = Field(default=5_000)
+    socket_timeout_ms: int | None = Field(default=10_000)
+    read_preference: str = Field(default="primaryPreferred")
+
+
+class CatalogModel(BaseModel):
+    """Book catalog (Library.Books) settings."""
+
+    database: str = Field(default="Library")
+    collection: str = Field(default="Books")
+    ensure_indexes: bool = Field(default=True)
+    verify_query_plans: bool = Field(default=False)
+    default_page_size: int = Field(default=20)
+    max_page_size: int = Field(default=100)
+    max_result_bytes: int = Field(default=16_384)
+    cache_enabled: bool = Field(default=True)
+    cache_size: int = Field(default=512)
+    cache_ttl_secs: float = Field(default=60.0)
+    # "auto" watches a change stream and falls back to polling last_updated
+    # when the server is not a replica set; "change_stream", "poll", "none".
+    cache_invalidation: str = Field(default="auto")
+    cache_poll_interval_secs: float = Field(default=5.0)
+
+
+class RateLimitModel(BaseModel):
+    """Model request quotas enforced by rate_limit_callback."""
+
+    enabled: bool = Field(default=True)
+    # Requests per minute for the whole process, per user and per session;
+    # None disables that scope.
+    global_rpm: int | None = Field(default=None)
+    user_rpm: int | None = Field(default=None)
+    session_rpm: int | None = Field(default=10)
+    # "wait" delays the request until quota is available (up to
+    # max_wait_secs); "reject" answers at once with a retry-after message.
+    mode: str = Field(default="wait")
+    max_wait_secs: float = Field(default=60.0)
+    # Estimated model tokens per minute across every worker; None disables.
+    global_tpm: int | None = Field(default=None)
+    # Where quota usage is counted: "memory" (this process only), "sqlite"
+    # (every process on this host) or "redis" (every replica in the fleet;
+    # needs the "redis" extra).
+    backend: str = Field(default="memory")
+    sqlite_path: str = Field(
+        default_factory=lambda: os.path.join(
+            tempfile.gettempdir(), "library_service_rate_limit.sqlite3"
+        )
+    )
+    redis_url: str = Field(default="redis://localhost:6379/0")
+
+
+class ProfileModel(BaseModel):
+    """How the customer profile is stored in session state and prompts."""
+
+    # Store minified JSON in session state instead of indented JSON.
+    compact_state: bool = Field(default=True)
+    # Purchases included in the prompt view; the full history is available
+    # through the get_customer_record tool.
+    prompt_recent_purchases: int = Field(default=3)
+
+
+class CustomerStoreModel(BaseModel):
+    """Where customer profiles are read from."""
+
+    # "memory" serves the bundled sample customers; "mongo" reads the
+    # customer_service.users collection.
+    backend: str = Field(default="memory")
+    database: str = Field(default="customer_service")
+    collection: str = Field(default="users")
+    cache_size: int = Field(default=10_000)
+    cache_ttl_secs: float = Field(default=300.0)
+    # Unknown ids are remembered for a shorter time.
+    negative_ttl_secs: float = Field(default=30.0)
+
+
+class RecommendationModel(BaseModel):
+    """Settings for the book recommendation engine."""
+
+    # Length of the precomputed genre, author and neighbour tables.
+    top_k: int = Field(default=20)
+    # Books returned per request.
+    results: int = Field(default=5)
+    # Age after which the tables are rebuilt in the background; 0 disables.
+    rebuild_secs: float = Field(default=3600.0)
+    # Build the tables in the background when the first session starts,
+    # rather than in the first get_book_recommendations call.
+    warm_up: bool = Field(default=True)
+
+
+class VectorSearchModel(BaseModel):
+    """Settings for the offline book similarity index."""
+
+    index_path: str = Field(
+        default_factory=lambda: os.path.join(
+            tempfile.gettempdir(), "library_service_vector_index"
+        )
+    )
+    # Hashed word/bigram features and dimensions they are projected to.
+    hash_buckets: int = Field(default=2**18)
+    dim: int = Field(default=128)
+    seed: int = Field(default=42)
+    # IVF clusters; 0 picks about 4 * sqrt(catalog size).
+    nlist: int = Field(default=0)
+    kmeans_iterations: int = Field(default=10)
+    # Clusters scanned per query.
+    nprobe: int = Field(default=16)
+
+
+class CartModel(BaseModel):
+    """Where shopping carts are stored."""
+
+    # "mongo" stores carts in customer_service.carts; "memory" keeps them in
+    # this process for development.
+    backend: str = Field(default="mongo")
+    database: str = Field(default="customer_service")
+    collection: str = Field(default="carts")
+    # Attempts before a modification that keeps losing races gives up.
+    max_retries: int = Field(default=5)
+    # Carts whose last version is remembered to skip the read before a write.
+    snapshot_size: int = Field(default=10_000)
+    # Price of books that have no price in the catalog.
+    default_price: float = Field(default=12.99)
+
+
+class ToolCacheModel(BaseModel):
+    """Memoization of idempotent tool results (see tool_cache.py)."""
+
+    enabled: bool = Field(default=True)
+    # Sessions whose cached results are kept, least recently used first out.
+    max_sessions: int = Field(default=10_000)
+    # Distinct argument sets remembered per tool and session.
+    max_entries_per_tool: int = Field(default=64)
+
+
+class SchedulingModel(BaseModel):
+    """Reading consultation scheduling."""
+
+    # "mongo" stores slot lanes in customer_service.consultation_slots;
+    # "memory" keeps them in this process for development.
+    backend: str = Field(default="mongo")
+    database: str = Field(default="customer_service")
+    collection: str = Field(default="consultation_slots")
+    default_store: str = Field(default="main")
+    open_hour: int = Field(default=9)
+    close_hour: int = Field(default=17)
+    # A day may have at most 63 slots.
+    slot_minutes: int = Field(default=30)
+    # Consultants per store, i.e. consultations that can run at once.
+    consultants: int = Field(default=2)
+    consultation_minutes: int = Field(default=60)
+    # How far ahead find_next_consultation_slots looks.
+    search_days: int = Field(default=14)
+
+
+class OutboxModel(BaseModel):
+    """Background delivery of CRM updates and notifications (see outbox.py)."""
+
+    # When disabled the tools deliver inline, as before.
+    enabled: bool = Field(default=True)
+    # SQLite file holding the queue; every process on the host shares it.
+    # It is kept in a persistent directory, since queued messages must
+    # survive a reboot; the directory is created on first use.
+    path: str = Field(
+        default_factory=lambda: os.path.join(_data_dir(), "outbox.sqlite3")
+    )
+    workers: int = Field(default=2)
+    batch_size: int = Field(default=50)
+    poll_interval_secs: float = Field(default=1.0)
+    # A claimed message is retried by another worker after this long.
+    lease_secs: float = Field(default=60.0)
+    max_attempts: int = Field(default=8)
+    backoff_base_secs: float = Field(default=1.0)
+    backoff_max_secs: float = Field(default=300.0)
+    # Delivered messages are kept this long for outbox_status().
+    retention_secs: float = Field(default=7 * 24 * 3600)
+    purge_interval_secs: float = Field(default=3600.0)
+
+
+class QRCodeModel(BaseModel):
+    """Discount QR codes (see qr_codes.py)."""
+
+    # HMAC key signing the discount tokens; stores need the same key to
+    # verify scanned codes. When empty a random key is used per process.
+    signing_key: str = Field(default="")
+    # "file" returns the path of the PNG; "data_uri" returns the PNG inline.
+    output: str = Field(default="file")
+    # Rendered codes are stored here, named after the hash of their token.
+    output_dir: str = Field(
+        default_factory=lambda: os.path.join(
+            tempfile.gettempdir(), "library_service_qr_codes"
+        )
+    )
+    # Render processes, and renders that may wait for one.
+    workers: int = Field(default=2)
+    max_pending: int = Field(default=32)
+    box_size: int = Field(default=4)
+    border: int = Field(default=2)
+    # A fixed QR mask (0-7) renders about 5x faster; None picks the most
+    # readable mask for every code.
+    mask_pattern: int | None = Field(default=None)
+    cache_size: int = Field(default=10_000)
+    cache_ttl_secs: float = Field(default=3600.0)
+
+
+class IngestModel(BaseModel):
+    """Bulk catalog ingestion (see ingest.py)."""
+
+    # A batch is written once it holds batch_size distinct ISBNs or spans
+    # max_batch_bytes of input, keeping each bulk_write well under the
+    # 48MB message limit; it is split by ISBN among the writers.
+    batch_size: int = Field(default=1000)
+    max_batch_bytes: int = Field(default=4 * 1024 * 1024)
+    # Writer threads, and parsed batches that may wait for each of them.
+    writers: int = Field(default=4)
+    queue_size: int = Field(default=8)
+    # Retries of upserts that lost a duplicate-key race with another writer.
+    max_retries: int = Field(default=1)
+    checkpoint_interval_secs: float = Field(default=5.0)
+    progress_secs: float = Field(default=5.0)
+
+
+class LoggingModel(BaseModel):
+    """Queued, sampled logging (see logging_pipeline.py)."""
+
+    enabled: bool = Field(default=True)
+    # "text" keeps the host's formatters; "json" writes one object per line.
+    format: str = Field(default="text")
+    # Records waiting for the writer thread; beyond this they are dropped.
+    queue_size: int = Field(default=10_000)
+    # Longest string, and most container items, rendered per log argument.
+    max_payload_chars: int = Field(default=500)
+    max_payload_items: int = Field(default=20)
+    # Fraction of the records below WARNING kept per logger (and children).
+    sample_rates: Dict[str, float] = Field(
+        default={"customer_service.shared_libraries.callbacks": 0.1}
+    )
+    # Logger levels, e.g. {"customer_service": "DEBUG"}; others are left to
+    # the host (adk --log_level, basicConfig).
+    levels: Dict[str, str] = Field(default={})
+
+
 class Config(BaseSettings):
     """Configuration settings for the customer service agent."""
 
@@ -28,8 +287,33 @@ class Config(BaseSettings):
         case_sensitive=True,
     )
     agent_settings: AgentModel = Field(default=AgentModel())
+    mongo_settings: MongoModel = Field(default=MongoModel())
+    catalog_settings: CatalogModel = Field(default=CatalogModel())
+    rate_limit_settings: RateLimitModel = Field(default=RateLimitModel())
+    profile_settings: ProfileModel = Field(default=ProfileModel())
+    customer_settings: CustomerStoreModel = Field(default=CustomerStoreModel())
+    recommendation_settings: RecommendationModel = Field(
+        default=RecommendationModel()
+    )
+    vector_search_settings: VectorSearchModel = Field(default=VectorSearchModel())
+    cart_settings: CartModel = Field(default=CartModel())
+    tool_cache_settings: ToolCacheModel = Field(default=ToolCacheModel())
+    scheduling_settings: SchedulingModel = Field(default=SchedulingModel())
+    outbox_settings: OutboxModel = Field(default=OutboxModel())
+    qr_code_settings: QRCodeModel = Field(default=QRCodeModel())
+    ingest_settings: IngestModel = Field(default=IngestModel())
+    logging_settings: LoggingModel = Field(default=LoggingModel())
     app_name: str = "library_service_app"
     CLOUD_PROJECT: str = Field(default="my_project")
     CLOUD_LOCATION: str = Field(default="us-central1")
     GENAI_USE_VERTEXAI: str = Field(default="0")
     GEMINI_API_KEY: str | None = Field(default="")
+    # Read without the GOOGLE_ prefix so the MONGODB_URI entry documented in
+    # .env.example keeps working; it wins over mongo_settings.uri when set.
+    MONGODB_URI: str | None = Field(default=None, validation_alias="MONGODB_URI")
+
+
+@lru_cache(maxsize=1)
+def get_config() -> Config:
+    """Returns the process-wide Config, loading the settings only once."""
+    return Config()
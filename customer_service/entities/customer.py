@@ -1,6 +1,7 @@
 
 """Customer entity module."""
 
+import json
 from typing import List, Dict, Optional
 from pydantic import BaseModel, Field, ConfigDict
 
@@ -85,14 +86,63 @@ class Customer(BaseModel):
     scheduled_appointments: Dict = Field(default_factory=dict)
     model_config = ConfigDict(from_attributes=True)
 
-    def to_json(self) -> str:
+    def to_json(self, indent: Optional[int] = 4) -> str:
         """
         Converts the Customer object to a JSON string.
 
+        Args:
+            indent: Indentation of the JSON; None produces minified JSON.
+
         Returns:
             A JSON string representing the Customer object.
         """
-        return self.model_dump_json(indent=4)
+        return self.model_dump_json(indent=indent)
+
+    def to_prompt_view(self, recent_purchases: int = 3) -> Dict:
+        """
+        Builds a trimmed view of the customer for the model prompt.
+
+        The purchase history is cut to the most recent purchases plus a
+        summary, so the prompt does not grow with the customer's history.
+
+        Args:
+            recent_purchases: How many of the latest purchases to include.
+
+        Returns:
+            A dictionary with the profile fields relevant to the conversation.
+        """
+        purchases = sorted(self.purchase_history, key=lambda p: p.date)
+        recent = purchases[-recent_purchases:] if recent_purchases > 0 else []
+        return {
+            "customer_id": self.customer_id,
+            "account_number": self.account_number,
+            "name": f"{self.customer_first_name} {self.customer_last_name}",
+            "email": self.email,
+            "phone_number": self.phone_number,
+            "customer_start_date": self.customer_start_date,
+            "years_as_customer": self.years_as_customer,
+            "loyalty_points": self.loyalty_points,
+            "preferred_store": self.preferred_store,
+            "communication_preferences": self.communication_preferences.model_dump(),
+            "reading_profile": self.reading_profile.model_dump(),
+            "purchase_summary": {
+                "total_purchases": len(purchases),
+                "total_spent": round(sum(p.total_amount for p in purchases), 2),
+                "first_purchase": purchases[0].date if purchases else None,
+                "last_purchase": purchases[-1].date if purchases else None,
+            },
+            "recent_purchases": [
+                {"date": p.date, "items": [item.name for item in p.items]}
+                for p in reversed(recent)
+            ],
+            "scheduled_appointments": self.scheduled_appointments,
+        }
+
+    def to_prompt_json(self, recent_purchases: int = 3) -> str:
+        """Returns to_prompt_view() as minified JSON."""
+        return json.dumps(
+            self.to_prompt_view(recent_purchases), separators=(",", ":")
+        )
 
     @staticmethod
     def get_customer(current_customer_id: str) -> Optional["Customer"]:
@@ -105,81 +155,8 @@ class Customer(BaseModel):
         Returns:
             The Customer object if found, None otherwise.
         """
-        # In a real application, this would involve a database lookup.
-        # For this example, we'll just return a dummy customer.
-        return Customer(
-            customer_id=current_customer_id,
-            account_number="428765091",
-            customer_first_name="Anubhob",
-            customer_last_name="Dey",
-            email="anubhob435@gmail.com",
-            phone_number="+91-1234567890",
-            customer_start_date="2022-06-10",
-            years_as_customer=2,
-            billing_address=Address(
-                street="123 Main St", city="Anytown", state="CA", zip="12345"
-            ),
-            purchase_history=[  # Example purchase history
-                Purchase(
-                    date="2023-03-05",
-                    items=[
-                        Product(
-                            product_id="book-111",
-                            name="The Thursday Murder Club by Richard Osman",
-                            quantity=1,
-                        ),
-                        Product(
-                            product_id="bookmark-222",
-                            name="Leather Bookmark Set",
-                            quantity=1,
-                        ),
-                    ],
-                    total_amount=24.98,
-                ),
-                Purchase(
-                    date="2023-07-12",
-                    items=[
-                        Product(
-                            product_id="book-333",
-                            name="Educated by Tara Westover",
-                            quantity=1,
-                        ),
-                        Product(
-                            product_id="book-444",
-                            name="The Seven Husbands of Evelyn Hugo",
-                            quantity=1,
-                        ),
-                    ],
-                    total_amount=32.5,
-                ),
-                Purchase(
-                    date="2024-01-20",
-                    items=[
-                        Product(
-                            product_id="book-555",
-                            name="Project Hail Mary by Andy Weir",
-                            quantity=1,
-                        ),
-                        Product(
-                            product_id="lamp-666",
-                            name="LED Reading Lamp",
-                            quantity=1,
-                        ),
-                    ],
-                    total_amount=45.25,
-                ),
-            ],
-            loyalty_points=133,
-            preferred_store="Downtown Library & Bookstore",
-            communication_preferences=CommunicationPreferences(
-                email=True, sms=False, push_notifications=True
-            ),
-            reading_profile=ReadingProfile(
-                preferred_genres=["mystery", "memoir", "science fiction"],
-                reading_level="advanced",
-                favorite_authors=["Richard Osman", "Tara Westover", "Andy Weir"],
-                reading_goals="Read 24 books this year, explore more diverse authors",
-                interests=["book clubs", "author events", "reading challenges"],
-            ),
-            scheduled_appointments={},
-        )
+        # Served by the configured CustomerRepository (in-memory samples or
+        # MongoDB) behind an LRU cache.
+        from .customer_repository import get_customer_repository
+
+        return get_customer_repository().get(current_customer_id)
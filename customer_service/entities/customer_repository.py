@@ -0,0 +1,316 @@
+"""Customer repositories: where Customer.get_customer reads profiles from."""
+
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from customer_service.config import CustomerStoreModel, get_config
+from customer_service.shared_libraries.cache import TTLCache
+
+from .customer import (
+    Address,
+    CommunicationPreferences,
+    Customer,
+    Product,
+    Purchase,
+    ReadingProfile,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CustomerRepository(ABC):
+    """Looks customers up by customer_id."""
+
+    @abstractmethod
+    def get_many(self, customer_ids: Sequence[str]) -> Dict[str, Customer]:
+        """
+        Retrieves several customers in one lookup.
+
+        Args:
+            customer_ids: The IDs of the customers to retrieve.
+
+        Returns:
+            A mapping of customer_id to Customer for the IDs that exist.
+        """
+
+    def get(self, customer_id: str) -> Optional[Customer]:
+        """
+        Retrieves a customer based on their ID.
+
+        Args:
+            customer_id: The ID of the customer to retrieve.
+
+        Returns:
+            The Customer object if found, None otherwise.
+        """
+        return self.get_many([customer_id]).get(customer_id)
+
+    @abstractmethod
+    def add_appointment(
+        self, customer_id: str, appointment_id: str, appointment: Dict
+    ) -> bool:
+        """
+        Adds an entry to a customer's scheduled_appointments.
+
+        Args:
+            customer_id: The ID of the customer.
+            appointment_id: The key of the appointment.
+            appointment: The appointment details.
+
+        Returns:
+            True if the customer exists and was updated.
+        """
+
+
+class InMemoryCustomerRepository(CustomerRepository):
+    """Customers held in a dictionary, e.g. the bundled sample customers."""
+
+    def __init__(self, customers: Iterable[Customer] = ()):
+        self._customers = {c.customer_id: c for c in customers}
+
+    def add(self, customer: Customer) -> None:
+        """Adds or replaces a customer."""
+        self._customers[customer.customer_id] = customer
+
+    def get_many(self, customer_ids: Sequence[str]) -> Dict[str, Customer]:
+        return {
+            customer_id: self._customers[customer_id]
+            for customer_id in customer_ids
+            if customer_id in self._customers
+        }
+
+    def add_appointment(self, customer_id, appointment_id, appointment):
+        customer = self._customers.get(customer_id)
+        if customer is None:
+            return False
+        # Replace rather than mutate: callers may hold the previous object.
+        self._customers[customer_id] = customer.model_copy(
+            update={
+                "scheduled_appointments": {
+                    **customer.scheduled_appointments,
+                    appointment_id: appointment,
+                }
+            }
+        )
+        return True
+
+
+class MongoCustomerRepository(CustomerRepository):
+    """Customers stored as documents with a customer_id field in MongoDB."""
+
+    def __init__(self, collection=None, settings: Optional[CustomerStoreModel] = None):
+        """
+        Args:
+            collection: The pymongo collection; defaults to the configured one
+                on the shared client.
+            settings: The customer store settings; defaults to the config.
+        """
+        if collection is None:
+            from customer_service.shared_libraries.mongo import get_collection
+
+            settings = settings or get_config().customer_settings
+            collection = get_collection(settings.database, settings.collection)
+        self._collection = collection
+
+    def ensure_indexes(self) -> None:
+        """Creates the unique customer_id index used by every lookup."""
+        # Partial, because the users collection also holds login-only
+        # documents without a customer_id.
+        self._collection.create_index(
+            "customer_id",
+            name="customer_id_1",
+            unique=True,
+            partialFilterExpression={"customer_id": {"$exists": True}},
+        )
+
+    def get_many(self, customer_ids: Sequence[str]) -> Dict[str, Customer]:
+        if not customer_ids:
+            return {}
+        docs = self._collection.find(
+            {"customer_id": {"$in": list(customer_ids)}}, {"_id": 0}
+        )
+        return {doc["customer_id"]: Customer.model_validate(doc) for doc in docs}
+
+    def add_appointment(self, customer_id, appointment_id, appointment):
+        # A single $set of one key, so concurrent bookings do not overwrite
+        # each other's appointments.
+        result = self._collection.update_one(
+            {"customer_id": customer_id},
+            {"$set": {f"scheduled_appointments.{appointment_id}": appointment}},
+        )
+        return bool(result.matched_count)
+
+
+_NOT_FOUND = object()
+
+
+class CachedCustomerRepository(CustomerRepository):
+    """
+    Bounded LRU + TTL cache in front of another repository.
+
+    IDs that do not exist are cached too (with a shorter TTL), so repeated
+    lookups of an unknown customer do not reach the backend either.
+    """
+
+    def __init__(
+        self,
+        backend: CustomerRepository,
+        maxsize: int = 10_000,
+        ttl: float = 300.0,
+        negative_ttl: float = 30.0,
+    ):
+        self.backend = backend
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get_many(self, customer_ids: Sequence[str]) -> Dict[str, Customer]:
+        found: Dict[str, Customer] = {}
+        missing: List[str] = []
+        for customer_id in dict.fromkeys(customer_ids):
+            cached = self.cache.get(customer_id, _NOT_FOUND)
+            if cached is _NOT_FOUND:
+                missing.append(customer_id)
+            elif cached is not None:
+                found[customer_id] = cached
+
+        if missing:
+            fetched = self.backend.get_many(missing)
+            for customer_id in missing:
+                customer = fetched.get(customer_id)
+                if customer is None:
+                    self.cache.set(customer_id, None, ttl=self.negative_ttl)
+                else:
+                    self.cache.set(customer_id, customer)
+                    found[customer_id] = customer
+        return found
+
+    def add_appointment(self, customer_id, appointment_id, appointment):
+        updated = self.backend.add_appointment(customer_id, appointment_id, appointment)
+        self.invalidate(customer_id)
+        return updated
+
+    def invalidate(self, customer_id: str) -> None:
+        """Forgets a customer, e.g. after its record was updated."""
+        self.cache.pop(customer_id)
+
+
+def sample_customers() -> List[Customer]:
+    """Returns the sample customers served by the in-memory repository."""
+    return [
+        Customer(
+            customer_id="123",
+            account_number="428765091",
+            customer_first_name="Anubhob",
+            customer_last_name="Dey",
+            email="anubhob435@gmail.com",
+            phone_number="+91-1234567890",
+            customer_start_date="2022-06-10",
+            years_as_customer=2,
+            billing_address=Address(
+                street="123 Main St", city="Anytown", state="CA", zip="12345"
+            ),
+            purchase_history=[  # Example purchase history
+                Purchase(
+                    date="2023-03-05",
+                    items=[
+                        Product(
+                            product_id="978-0-525-63489-9",
+                            name="The Thursday Murder Club by Richard Osman",
+                            quantity=1,
+                        ),
+                        Product(
+                            product_id="bookmark-222",
+                            name="Leather Bookmark Set",
+                            quantity=1,
+                        ),
+                    ],
+                    total_amount=24.98,
+                ),
+                Purchase(
+                    date="2023-07-12",
+                    items=[
+                        Product(
+                            product_id="978-0-399-59050-4",
+                            name="Educated by Tara Westover",
+                            quantity=1,
+                        ),
+                        Product(
+                            product_id="978-1-5011-3981-9",
+                            name="The Seven Husbands of Evelyn Hugo",
+                            quantity=1,
+                        ),
+                    ],
+                    total_amount=32.5,
+                ),
+                Purchase(
+                    date="2024-01-20",
+                    items=[
+                        Product(
+                            product_id="978-0-593-13520-1",
+                            name="Project Hail Mary by Andy Weir",
+                            quantity=1,
+                        ),
+                        Product(
+                            product_id="lamp-666",
+                            name="LED Reading Lamp",
+                            quantity=1,
+                        ),
+                    ],
+                    total_amount=45.25,
+                ),
+            ],
+            loyalty_points=133,
+            preferred_store="Downtown Library & Bookstore",
+            communication_preferences=CommunicationPreferences(
+                email=True, sms=False, push_notifications=True
+            ),
+            reading_profile=ReadingProfile(
+                preferred_genres=["mystery", "memoir", "science fiction"],
+                reading_level="advanced",
+                favorite_authors=["Richard Osman", "Tara Westover", "Andy Weir"],
+                reading_goals="Read 24 books this year, explore more diverse authors",
+                interests=["book clubs", "author events", "reading challenges"],
+            ),
+            scheduled_appointments={},
+        )
+    ]
+
+
+_repository: Optional[CachedCustomerRepository] = None
+_repository_lock = threading.Lock()
+
+
+def create_customer_repository(
+    settings: Optional[CustomerStoreModel] = None,
+) -> CachedCustomerRepository:
+    """Builds the cached repository selected in the configuration."""
+    settings = settings or get_config().customer_settings
+    if settings.backend == "mongo":
+        backend: CustomerRepository = MongoCustomerRepository(settings=settings)
+        try:
+            backend.ensure_indexes()
+        except Exception as e:
+            logger.error("Could not ensure the customer_id index: %s", e)
+    elif settings.backend == "memory":
+        backend = InMemoryCustomerRepository(sample_customers())
+    else:
+        raise ValueError(f"Unknown customer store backend: {settings.backend}")
+    return CachedCustomerRepository(
+        backend,
+        maxsize=settings.cache_size,
+        ttl=settings.cache_ttl_secs,
+        negative_ttl=settings.negative_ttl_secs,
+    )
+
+
+def get_customer_repository() -> CachedCustomerRepository:
+    """Returns the process-wide customer repository."""
+    global _repository
+
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = create_customer_repository()
+    return _repository
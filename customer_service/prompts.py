@@ -1,11 +1,52 @@
 """Global instruction and instruction for the customer service agent."""
 
-from .entities.customer import Customer
+from google.adk.agents.readonly_context import ReadonlyContext
 
-GLOBAL_INSTRUCTION = f"""
-The profile of the current customer is:  {Customer.get_customer("123").to_json()}
+from .config import get_config
+from .shared_libraries.cache import TTLCache
+from .shared_libraries.profile_cache import get_customer_profile
+
+GLOBAL_INSTRUCTION_TEMPLATE = """
+The profile of the current customer is:  {profile}
+"""
+
+NO_PROFILE_INSTRUCTION = """
+No customer profile is loaded for this conversation yet.
 """
 
+# Rendered instructions keyed on the stored profile JSON, so every session of
+# the same customer, and every turn of a session, reuses the same string
+# until the profile changes.
+_rendered_instructions = TTLCache(maxsize=1024, ttl=None)
+
+
+def global_instruction(context: ReadonlyContext) -> str:
+    """
+    Builds the global instruction for the customer of the current session.
+
+    Args:
+        context: The read-only invocation context, holding the profile loaded
+            into session state by before_agent.
+
+    Returns:
+        The global instruction with the customer's prompt view.
+    """
+    blob = context.state.get("customer_profile")
+    if blob is None:
+        return NO_PROFILE_INSTRUCTION
+
+    instruction = _rendered_instructions.get(blob)
+    if instruction is None:
+        customer = get_customer_profile(context.state)
+        instruction = GLOBAL_INSTRUCTION_TEMPLATE.format(
+            profile=customer.to_prompt_json(
+                get_config().profile_settings.prompt_recent_purchases
+            )
+        )
+        _rendered_instructions.set(blob, instruction)
+    return instruction
+
+
 INSTRUCTION = """
 You are "BookWise," the primary AI assistant for Literati Library & Bookstore, a comprehensive library and bookstore specializing in books, reading materials, and literary services.
 Your main goal is to provide excellent customer service, help customers find the right books, assist with their reading needs, and schedule services.
@@ -51,12 +92,15 @@ You have access to the following tools to assist you:
 *   `approve_discount: Approves a discount (within pre-defined limits).
 *   `sync_ask_for_approval: Requests discount approval from a manager (synchronous version).
 *   `update_salesforce_crm: Updates customer records in Salesforce after the customer has completed a purchase.
-*   `access_cart_information: Retrieves the customer's cart contents. Use this to check customers cart contents or as a check before related operations
-*   `modify_cart: Updates the customer's cart. before modifying a cart first access_cart_information to see what is already in the cart
-*   `get_book_recommendations: Suggests suitable books for a given genre or topic. i.e mystery novels. before recommending a book access_cart_information so you do not recommend something already in cart. if the book is in cart say you already have that
+*   `get_customer_record: Retrieves the customer's full profile. The profile above only lists recent purchases; use this when you need the complete purchase history or other details.
+*   `access_cart_information: Retrieves the customer's cart contents. Use this when the customer asks about their cart.
+*   `modify_cart: Updates the customer's cart and returns the updated cart, so there is no need to call access_cart_information before or after it.
+*   `get_book_recommendations: Suggests suitable books for a given genre or topic. i.e mystery novels. Books already in the cart or already purchased are left out automatically.
 *   `check_product_availability: Checks book stock.
+*   `check_products_availability: Checks the stock of several books at several stores in one call. Use it instead of repeated check_product_availability calls, e.g. for a whole cart plus recommendations.
 *   `schedule_reading_consultation: Books a reading consultation appointment.
 *   `get_available_consultation_times: Retrieves available time slots.
+*   `find_next_consultation_slots: Finds the earliest free consultation times over the next two weeks, for customers without a date in mind.
 *   `send_reading_recommendations: Sends personalized reading recommendations and book care information.
 *   `generate_qr_code: Creates a discount QR code 
 
@@ -2,30 +2,56 @@
 """Callback functions for FOMC Research Agent."""
 
 import logging
-import time
+import math
+import threading
 
 from google.adk.agents.callback_context import CallbackContext
-from google.adk.models import LlmRequest
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
 from typing import Any, Dict, Optional, Tuple
 from google.adk.tools import BaseTool
 from google.adk.agents.invocation_context import InvocationContext
 from google.adk.sessions.state import State
 from google.adk.tools.tool_context import ToolContext
-from jsonschema import ValidationError
+from pydantic import ValidationError
 from customer_service.entities.customer import Customer
+from customer_service.config import get_config
+from customer_service.shared_libraries.profile_cache import (
+    get_customer_profile,
+    profile_footprint,
+)
+from customer_service.shared_libraries.rate_limit import (
+    RateLimitExceeded,
+    get_rate_limiter,
+)
+from customer_service.shared_libraries.tool_cache import get_tool_cache
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
-RATE_LIMIT_SECS = 60
-RPM_QUOTA = 10
+def _estimate_tokens(llm_request: LlmRequest) -> int:
+    """Roughly estimates the prompt size (~4 characters per token)."""
+    chars = 0
+    for content in llm_request.contents:
+        for part in content.parts or []:
+            chars += len(part.text or "")
+    system_instruction = llm_request.config.system_instruction if llm_request.config else None
+    if isinstance(system_instruction, str):
+        chars += len(system_instruction)
+    return chars // 4 + 1
 
 
-def rate_limit_callback(
+async def rate_limit_callback(
     callback_context: CallbackContext, llm_request: LlmRequest
-) -> None:
+) -> Optional[LlmResponse]:
     """Callback function that implements a query rate limit.
 
+    Quotas come from Config.rate_limit_settings and are counted by the
+    configured backend, so with the sqlite or redis backend they hold across
+    worker processes and replicas. A throttled request waits with
+    asyncio.sleep, so other sessions served by the same event loop keep
+    running; when it cannot be admitted in time (or in "reject" mode) the
+    model call is skipped and a retry-after message is returned instead.
+
     Args:
       callback_context: A CallbackContext obj representing the active callback
         context.
@@ -36,42 +62,32 @@ def rate_limit_callback(
             if part.text=="":
                 part.text=" "
 
-    
-    
-
-    now = time.time()
-    if "timer_start" not in callback_context.state:
-
-        callback_context.state["timer_start"] = now
-        callback_context.state["request_count"] = 1
-        logger.debug(
-            "rate_limit_callback [timestamp: %i, "
-            "req_count: 1, elapsed_secs: 0]",
-            now,
+    session = callback_context.session
+    tokens = _estimate_tokens(llm_request)
+    try:
+        delay = await get_rate_limiter().acquire(
+            session.user_id, session.id, tokens=tokens
+        )
+    except RateLimitExceeded as e:
+        logger.warning("rate_limit_callback rejected request: %s", e)
+        return LlmResponse(
+            content=types.Content(
+                role="model",
+                parts=[
+                    types.Part(
+                        text=(
+                            "We're receiving a lot of requests right now. "
+                            f"Please try again in about {math.ceil(e.retry_after)} seconds."
+                        )
+                    )
+                ],
+            )
         )
-        return
-
-    request_count = callback_context.state["request_count"] + 1
-    elapsed_secs = now - callback_context.state["timer_start"]
-    logger.debug(
-        "rate_limit_callback [timestamp: %i, request_count: %i,"
-        " elapsed_secs: %i]",
-        now,
-        request_count,
-        elapsed_secs,
-    )
-
-    if request_count > RPM_QUOTA:
-        delay = RATE_LIMIT_SECS - elapsed_secs + 1
-        if delay > 0:
-            logger.debug("Sleeping for %i seconds", delay)
-            time.sleep(delay)
-        callback_context.state["timer_start"] = now
-        callback_context.state["request_count"] = 1
-    else:
-        callback_context.state["request_count"] = request_count
 
-    return
+    if delay:
+        logger.debug("rate_limit_callback delayed request by %.2fs", delay)
+    logger.debug("rate_limit_callback prompt size ~%i tokens", tokens)
+    return None
 
 def validate_customer_id(customer_id: str, session_state: State) -> Tuple[bool, str]:
     """
@@ -91,8 +107,9 @@ def validate_customer_id(customer_id: str, session_state: State) -> Tuple[bool,
 
     try:
         # We read the profile from the state, where it is set deterministically
-        # at the beginning of the session.
-        c = Customer.model_validate_json(session_state['customer_profile'])
+        # at the beginning of the session. It is only parsed again when the
+        # stored profile changes.
+        c = get_customer_profile(session_state)
         if customer_id == c.customer_id:
             return True, None
         else:
@@ -100,17 +117,37 @@ def validate_customer_id(customer_id: str, session_state: State) -> Tuple[bool,
     except ValidationError as e:
         return False, "Customer profile couldn't be parsed. Please reload the customer data. "
 
-def lowercase_value(value):
-    """Make dictionary lowercase"""
-    if isinstance(value, dict):
-        return (dict(k, lowercase_value(v)) for k, v in value.items())
-    elif isinstance(value, str):
-        return value.lower()
-    elif isinstance(value, (list, set, tuple)):
-        tp = type(value)
-        return tp(lowercase_value(i) for i in value)
-    else:
-        return value
+# Arguments each tool compares case-insensitively. Only these are
+# normalized; ids and free text such as details or reasons are passed
+# through untouched, and nothing else in args is copied or walked.
+CASE_INSENSITIVE_ARGS: Dict[str, Tuple[str, ...]] = {
+    "approve_discount": ("discount_type",),
+    "sync_ask_for_approval": ("discount_type",),
+    "get_book_recommendations": ("book_genre",),
+    "send_reading_recommendations": ("delivery_method",),
+    "generate_qr_code": ("discount_type",),
+}
+
+
+def normalize_args(tool_name: str, args: Dict[str, Any]) -> None:
+    """
+    Lowercases and strips the case-insensitive arguments of a tool call.
+
+    args is modified in place, so the normalized values are what the tool
+    receives. String lists are normalized element by element.
+
+    Args:
+        tool_name: The name of the tool being called.
+        args: The arguments the model passed to the tool.
+    """
+    for field in CASE_INSENSITIVE_ARGS.get(tool_name, ()):
+        value = args.get(field)
+        if isinstance(value, str):
+            args[field] = value.strip().lower()
+        elif isinstance(value, list):
+            for i, item in enumerate(value):
+                if isinstance(item, str):
+                    value[i] = item.strip().lower()
 
 
 # Callback Methods
@@ -118,8 +155,8 @@ def before_tool(
     tool: BaseTool, args: Dict[str, Any], tool_context: CallbackContext
 ):
 
-    # i make sure all values that the agent is sending to tools are lowercase
-    lowercase_value(args)
+    # Normalize the arguments the tools compare case-insensitively
+    normalize_args(tool.name, args)
 
     # Several tools require customer_id as input. We don't want to rely
     # solely on the model picking the right customer id. We validate it.
@@ -146,6 +183,20 @@ def before_tool(
             and args.get("items_removed") is True
         ):
             return {"result": "I have added and removed the requested items."}
+
+    # Repeated calls of idempotent tools are answered from the tool cache
+    # without running the tool.
+    cache = get_tool_cache()
+    if cache is not None:
+        cached = cache.lookup(
+            tool.name,
+            args,
+            tool_context.session.id,
+            tool_context.function_call_id,
+        )
+        if cached is not None:
+            logger.debug("before_tool: %s answered from the tool cache", tool.name)
+            return cached
     return None
 
 def after_tool(
@@ -164,15 +215,66 @@ def after_tool(
         logger.debug("Applying discount to the cart")
         # Actually make changes to the cart
 
+  # Remember idempotent results and drop the ones this call made stale.
+  cache = get_tool_cache()
+  if cache is not None:
+      cache.store(
+          tool.name,
+          args,
+          tool_context.session.id,
+          tool_response,
+          tool_context.function_call_id,
+      )
+
   return None
 
+_recommendations_warming = False
+
+
+def _warm_up_recommendations() -> None:
+    # Imported on this thread, so numpy and scipy load off the event loop.
+    from customer_service.shared_libraries.recommendations import warm_up
+
+    warm_up()
+
+
+def start_recommendation_warm_up() -> None:
+    """Builds the recommendation engine on a background thread, once."""
+    global _recommendations_warming
+
+    if _recommendations_warming or not get_config().recommendation_settings.warm_up:
+        return
+    _recommendations_warming = True
+    threading.Thread(
+        target=_warm_up_recommendations, name="recommendation-warmup", daemon=True
+    ).start()
+
+
 # checking that the customer profile is loaded as state.
 def before_agent(callback_context: InvocationContext):
+    start_recommendation_warm_up()
+
     # In a production agent, this is set as part of the
     # session creation for the agent. 
     if "customer_profile" not in callback_context.state:
-        callback_context.state["customer_profile"] = Customer.get_customer(
-            "123"
-        ).to_json()
+        settings = get_config().profile_settings
+        customer = Customer.get_customer("123")
+        if customer is None:
+            logger.warning("Customer 123 not found; no profile loaded")
+            return None
+        # The profile is persisted with the session on every turn, so it is
+        # stored minified unless compact_state is turned off.
+        callback_context.state["customer_profile"] = customer.to_json(
+            indent=None if settings.compact_state else 4
+        )
+        logger.info(
+            "Loaded customer profile %s: %s",
+            customer.customer_id,
+            profile_footprint(customer, settings.prompt_recent_purchases),
+        )
+    logger.debug(
+        "customer_profile state size: %i bytes",
+        len(callback_context.state["customer_profile"]),
+    )
 
     # logger.info(callback_context.state["customer_profile"])
@@ -0,0 +1,381 @@
+"""Shopping carts for access_cart_information and modify_cart.
+
+A cart is one document per customer in ``customer_service.carts``::
+
+    {
+        "customer_id": "123",
+        "items": {"978-0-441-17271-9": {"name": "Dune by Frank Herbert",
+                                        "quantity": 1, "price_cents": 1299}},
+        "subtotal_cents": 1299,
+        "version": 3,
+    }
+
+Items are keyed by product id, so a change is a single ``$inc`` / ``$set`` /
+``$unset`` on the affected items, with the subtotal adjusted by the same
+update instead of being recomputed. Every update is applied with
+``find_one_and_update`` conditioned on the version the change was computed
+from and returns the new cart, so a modification costs one round trip and
+concurrent writers cannot lose each other's updates. The last version seen
+of each cart is kept in this process, so usually no read precedes a write;
+when another writer got there first the cart is re-read and the change is
+computed again. A change that would do nothing to the snapshot is checked
+against a fresh read before it is reported as done.
+"""
+
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from customer_service.config import CartModel, get_config
+from customer_service.shared_libraries.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+class CartConflictError(RuntimeError):
+    """Raised when a cart keeps changing underneath an update."""
+
+
+def _empty_cart(customer_id: str) -> Dict[str, Any]:
+    return {"customer_id": customer_id, "items": {}, "subtotal_cents": 0, "version": 0}
+
+
+def cart_view(cart: Mapping[str, Any]) -> Dict[str, Any]:
+    """Returns a stored cart in the shape the tools return."""
+    return {
+        "items": [
+            {
+                "product_id": product_id,
+                "name": item["name"],
+                "quantity": item["quantity"],
+                "price": item["price_cents"] / 100,
+            }
+            for product_id, item in cart["items"].items()
+        ],
+        "subtotal": cart["subtotal_cents"] / 100,
+        "version": cart["version"],
+    }
+
+
+def plan_changes(
+    cart: Mapping[str, Any],
+    add: Mapping[str, int],
+    remove: Mapping[str, Optional[int]],
+    products: Mapping[str, Tuple[str, int]],
+) -> Dict[str, Any]:
+    """
+    Computes the update that applies a modification to a cart.
+
+    Adds and removals of the same product are netted first, so each item is
+    touched by exactly one operator.
+
+    Args:
+        cart: The cart the change is computed from.
+        add: Quantities to add per product id.
+        remove: Quantities to remove per product id; None removes the item.
+        products: (name, price in cents) of every product being added.
+
+    Returns:
+        A MongoDB update document; empty when nothing changes.
+    """
+    items = cart["items"]
+    inc: Dict[str, int] = {}
+    set_: Dict[str, Any] = {}
+    unset: Dict[str, str] = {}
+    delta_cents = 0
+    for product_id in dict.fromkeys([*add, *remove]):
+        current = items.get(product_id, {}).get("quantity", 0)
+        if remove.get(product_id, 0) is None:
+            target = add.get(product_id, 0)
+        else:
+            target = max(current + add.get(product_id, 0) - remove.get(product_id, 0), 0)
+        if target == current:
+            continue
+        price = items[product_id]["price_cents"] if current else products[product_id][1]
+        delta_cents += (target - current) * price
+        field = f"items.{product_id}"
+        if target == 0:
+            unset[field] = ""
+        elif current:
+            inc[f"{field}.quantity"] = target - current
+        else:
+            name, price = products[product_id]
+            set_[field] = {"name": name, "quantity": target, "price_cents": price}
+
+    if not (inc or set_ or unset):
+        return {}
+    inc["subtotal_cents"] = delta_cents
+    inc["version"] = 1
+    update: Dict[str, Any] = {"$inc": inc}
+    if set_:
+        update["$set"] = set_
+    if unset:
+        update["$unset"] = unset
+    return update
+
+
+def _apply(cart: Mapping[str, Any], update: Mapping[str, Any]) -> Dict[str, Any]:
+    """Applies a plan_changes() update to a cart held in memory."""
+    items = {k: dict(v) for k, v in cart["items"].items()}
+    new = {**cart, "items": items}
+    for field in update.get("$unset", {}):
+        items.pop(field.split(".", 1)[1])
+    for field, value in update.get("$set", {}).items():
+        items[field.split(".", 1)[1]] = dict(value)
+    for field, value in update.get("$inc", {}).items():
+        if field.startswith("items."):
+            items[field.split(".")[1]]["quantity"] += value
+        else:
+            new[field] += value
+    return new
+
+
+class CartStore(ABC):
+    """Reads and atomically modifies customer carts."""
+
+    def __init__(self, max_retries: int = 5, snapshot_size: int = 10_000):
+        self.max_retries = max_retries
+        # Last version of each cart seen by this process.
+        self.snapshots = TTLCache(maxsize=snapshot_size, ttl=None)
+        self.conflicts = 0
+
+    @abstractmethod
+    def _load(self, customer_id: str) -> Dict[str, Any]:
+        """Reads a cart from the backend, or an empty one at version 0."""
+
+    @abstractmethod
+    def _update(
+        self, cart: Mapping[str, Any], update: Mapping[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Applies update if the stored version still equals cart["version"].
+
+        Returns:
+            The updated cart, or None when the version has moved on.
+        """
+
+    def get(self, customer_id: str) -> Dict[str, Any]:
+        """Returns the current cart of a customer."""
+        cart = self._load(customer_id)
+        self.snapshots.set(customer_id, cart)
+        return cart
+
+    def modify(
+        self,
+        customer_id: str,
+        add: Mapping[str, int],
+        remove: Mapping[str, Optional[int]],
+        products: Mapping[str, Tuple[str, int]],
+    ) -> Dict[str, Any]:
+        """
+        Adds and removes items in one atomic update.
+
+        Args:
+            customer_id: The customer whose cart is modified.
+            add: Quantities to add per product id.
+            remove: Quantities to remove per product id; None removes all.
+            products: (name, price in cents) of every product being added.
+
+        Returns:
+            The cart after the modification.
+
+        Raises:
+            CartConflictError: If the cart changed concurrently on every try.
+        """
+        cart = self.snapshots.get(customer_id)
+        fresh = cart is None
+        if fresh:
+            cart = self._load(customer_id)
+        for _ in range(self.max_retries):
+            update = plan_changes(cart, add, remove, products)
+            if not update and not fresh:
+                # Nothing to do against the snapshot says nothing about the
+                # stored cart, which another process may have changed.
+                cart = self._load(customer_id)
+                fresh = True
+                update = plan_changes(cart, add, remove, products)
+            if not update:
+                self.snapshots.set(customer_id, cart)
+                return cart
+            updated = self._update(cart, update)
+            if updated is not None:
+                self.snapshots.set(customer_id, updated)
+                return updated
+            # Another writer got there first; start from its version.
+            self.conflicts += 1
+            cart = self._load(customer_id)
+            fresh = True
+        self.snapshots.pop(customer_id)
+        raise CartConflictError(f"Cart of customer {customer_id} kept changing")
+
+
+class InMemoryCartStore(CartStore):
+    """Carts held in this process, for development without MongoDB."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._carts: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _load(self, customer_id: str) -> Dict[str, Any]:
+        with self._lock:
+            return self._carts.get(customer_id) or _empty_cart(customer_id)
+
+    def _update(self, cart, update):
+        customer_id = cart["customer_id"]
+        with self._lock:
+            stored = self._carts.get(customer_id) or _empty_cart(customer_id)
+            if stored["version"] != cart["version"]:
+                return None
+            self._carts[customer_id] = _apply(stored, update)
+            return self._carts[customer_id]
+
+
+class MongoCartStore(CartStore):
+    """Carts stored one document per customer in MongoDB."""
+
+    def __init__(self, collection=None, settings: Optional[CartModel] = None, **kwargs):
+        """
+        Args:
+            collection: The pymongo collection; defaults to the configured one
+                on the shared client.
+            settings: The cart settings; defaults to the config.
+        """
+        super().__init__(**kwargs)
+        if collection is None:
+            from customer_service.shared_libraries.mongo import get_collection
+
+            settings = settings or get_config().cart_settings
+            collection = get_collection(settings.database, settings.collection)
+        self._collection = collection
+
+    def ensure_indexes(self) -> None:
+        """Creates the unique customer_id index the updates rely on."""
+        self._collection.create_index("customer_id", name="customer_id_1", unique=True)
+
+    def _load(self, customer_id: str) -> Dict[str, Any]:
+        cart = self._collection.find_one({"customer_id": customer_id}, {"_id": 0})
+        return cart or _empty_cart(customer_id)
+
+    def _update(self, cart, update):
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            return self._collection.find_one_and_update(
+                {"customer_id": cart["customer_id"], "version": cart["version"]},
+                update,
+                projection={"_id": 0},
+                # A first write creates the cart; if it already exists with
+                # another version, the insert hits the unique index instead.
+                upsert=cart["version"] == 0,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            return None
+
+
+def create_cart_store(settings: Optional[CartModel] = None) -> CartStore:
+    """Builds the cart store selected in the configuration."""
+    settings = settings or get_config().cart_settings
+    options = {
+        "max_retries": settings.max_retries,
+        "snapshot_size": settings.snapshot_size,
+    }
+    if settings.backend == "memory":
+        return InMemoryCartStore(**options)
+    if settings.backend != "mongo":
+        raise ValueError(f"Unknown cart store backend: {settings.backend}")
+    store = MongoCartStore(settings=settings, **options)
+    try:
+        store.ensure_indexes()
+    except Exception as e:
+        logger.error("Could not ensure the carts customer_id index: %s", e)
+    return store
+
+
+_store: Optional[CartStore] = None
+_store_lock = threading.Lock()
+
+
+def get_cart_store() -> CartStore:
+    """Returns the process-wide cart store."""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_cart_store()
+    return _store
+
+
+def parse_items(
+    items: Iterable[Any], default_quantity: Optional[int] = 1
+) -> Dict[str, Optional[int]]:
+    """
+    Normalizes tool arguments into quantities per product id.
+
+    Args:
+        items: Dictionaries with "product_id" and optional "quantity", or
+            bare product id strings.
+        default_quantity: Quantity used when none is given.
+
+    Returns:
+        The summed quantity per product id; None when any entry for a
+        product had no quantity and default_quantity is None.
+
+    Raises:
+        ValueError: If an entry has no valid product id or quantity.
+    """
+    quantities: Dict[str, Optional[int]] = {}
+    for item in items:
+        if isinstance(item, str):
+            product_id, quantity = item, default_quantity
+        else:
+            product_id = item.get("product_id")
+            quantity = item.get("quantity", default_quantity)
+        if not isinstance(product_id, str) or not product_id:
+            raise ValueError(f"Invalid cart item: {item!r}")
+        # Product ids are field names in the cart document.
+        if "." in product_id or product_id.startswith("$"):
+            raise ValueError(f"Invalid product ID: {product_id}")
+        if quantity is not None:
+            quantity = int(quantity)
+            if quantity <= 0:
+                raise ValueError(f"Invalid quantity for {product_id}: {quantity}")
+        previous = quantities.get(product_id, 0)
+        if previous is None or quantity is None:
+            quantities[product_id] = None
+        else:
+            quantities[product_id] = previous + quantity
+    return quantities
+
+
+def lookup_products(product_ids: Sequence[str]) -> Dict[str, Tuple[str, int]]:
+    """
+    Returns the display name and price in cents of catalog books.
+
+    Books without a price in the catalog use cart_settings.default_price.
+    """
+    from customer_service.shared_libraries.catalog import get_books_collection
+
+    if not product_ids:
+        return {}
+    default_cents = round(get_config().cart_settings.default_price * 100)
+    docs = get_books_collection().find(
+        {"isbn": {"$in": list(product_ids)}},
+        {"_id": 0, "isbn": 1, "title": 1, "author": 1, "price": 1},
+    )
+    return {
+        doc["isbn"]: (
+            f"{doc.get('title')} by {doc.get('author')}",
+            round(doc["price"] * 100) if doc.get("price") is not None else default_cents,
+        )
+        for doc in docs
+    }
+
+
+def cart_stats() -> Dict[str, Any]:
+    """Returns the version-conflict count and the snapshot cache counters."""
+    store = get_cart_store()
+    return {"conflicts": store.conflicts, **store.snapshots.stats()}
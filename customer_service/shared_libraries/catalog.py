@@ -0,0 +1,655 @@
+"""Query building and index management for the Library.Books catalog.
+
+``inventory_operations`` accepts small query strings such as ``"genre:Mystery"``
+or ``"author:Andy Weir"``. This module turns them into filters that the
+catalog indexes can serve, creates those indexes, and checks with
+``explain()`` that none of the supported query shapes falls back to a
+collection scan, and that genre, author and status pages come out of an
+index already in ``_id`` order.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.collection import Collection
+from pymongo.collation import Collation
+from pymongo.errors import OperationFailure
+
+from customer_service.config import get_config
+from customer_service.shared_libraries.mongo import get_async_collection, get_collection
+
+logger = logging.getLogger(__name__)
+
+# Case-insensitive comparison (strength 2 ignores case but not diacritics).
+# Queries must use the same collation as the index to be able to use it.
+CASE_INSENSITIVE = Collation(locale="en", strength=2)
+
+CATALOG_INDEXES = [
+    # Equality on the field followed by _id: a page is read from the index
+    # in _id order starting at the page token, however deep the page is.
+    IndexModel(
+        [("genre", ASCENDING), ("_id", ASCENDING)],
+        name="genre_ci__id",
+        collation=CASE_INSENSITIVE,
+    ),
+    IndexModel(
+        [("author", ASCENDING), ("_id", ASCENDING)],
+        name="author_ci__id",
+        collation=CASE_INSENSITIVE,
+    ),
+    IndexModel([("title", ASCENDING)], name="title_ci", collation=CASE_INSENSITIVE),
+    IndexModel([("status", ASCENDING), ("_id", ASCENDING)], name="status_1__id_1"),
+    # Lets the cache invalidator find the latest change without a scan.
+    IndexModel([("last_updated", DESCENDING)], name="last_updated_-1"),
+    IndexModel(
+        [("title", TEXT), ("author", TEXT), ("genre", TEXT)],
+        name="catalog_text",
+        weights={"title": 10, "author": 5, "genre": 2},
+    ),
+]
+
+# Product ids are ISBNs everywhere: in carts, availability lookups and
+# purchase histories (items that are not books keep their store SKU). Carts
+# and availability resolve them with $in, and the ingester upserts on them.
+# Being unique, the index cannot be built while the catalog holds duplicate
+# ISBNs, so it is created apart from CATALOG_INDEXES: a duplicate then
+# leaves the ISBN lookups unindexed without blocking the other indexes.
+ISBN_INDEX = IndexModel(
+    [("isbn", ASCENDING)],
+    name="isbn_1",
+    unique=True,
+    partialFilterExpression={"isbn": {"$type": "string"}},
+)
+
+# One representative query per supported shape; "all" is deliberately
+# absent because returning the whole catalog is a scan by definition.
+VERIFIED_QUERY_SHAPES = [
+    "available",
+    "status:checked_out",
+    "genre:Mystery",
+    "author:Andy Weir",
+    "title:The Great Gatsby",
+    "Atomic Habits",
+]
+
+# Query kinds whose exact-match pages must be served in _id order by their
+# index, with no in-memory SORT stage. Title matches are few, and prefix and
+# text searches are ordered after matching.
+INDEX_ORDERED_KINDS = ("status", "genre", "author")
+
+_SUMMARY_FIELDS = (
+    "title", "author", "genre", "publication_year", "status", "quantity_available",
+)
+
+# Fields returned per query kind. Availability lookups only need to know
+# where a book is and whether it can be taken; a title lookup is narrow
+# enough to return the whole record. "_id" is always fetched for paging
+# and stripped before results leave this module.
+PROJECTIONS: Dict[str, Optional[Dict[str, int]]] = {
+    "status": {
+        f: 1 for f in ("title", "author", "status", "location", "quantity_available")
+    },
+    "genre": {f: 1 for f in _SUMMARY_FIELDS},
+    "author": {f: 1 for f in _SUMMARY_FIELDS},
+    "search": {f: 1 for f in _SUMMARY_FIELDS},
+    "all": {f: 1 for f in _SUMMARY_FIELDS},
+    "title": None,
+}
+
+
+class QueryPlanError(RuntimeError):
+    """Raised when a supported catalog query is not served by an index."""
+
+
+@dataclass(frozen=True)
+class CatalogQuery:
+    """
+    A parsed inventory query.
+
+    ``fallback`` is tried when the primary filter matches nothing, e.g. an
+    exact genre match that misses because only "Myst" was given, or an
+    author match that misses because only the surname was given.
+    """
+
+    kind: str
+    filter: Dict[str, Any]
+    collation: Optional[Collation] = None
+    fallback: Optional["CatalogQuery"] = None
+
+    def shapes(self) -> Iterator["CatalogQuery"]:
+        """Yields this query followed by its fallbacks."""
+        query = self
+        while query is not None:
+            yield query
+            query = query.fallback
+
+
+# Sorts after every other character in the CLDR collations, so a range
+# bounded by value + _MAX_CHAR holds exactly the strings starting with value.
+_MAX_CHAR = "\uffff"
+
+
+def _prefix_search(field: str, value: str, fallback: CatalogQuery) -> CatalogQuery:
+    # A range on the collated (field, _id) index rather than an anchored
+    # regex: a regex cannot use a collation, so a case-insensitive one would
+    # scan the whole index.
+    return CatalogQuery(
+        kind=field,
+        filter={field: {"$gte": value, "$lt": value + _MAX_CHAR}},
+        collation=CASE_INSENSITIVE,
+        fallback=fallback,
+    )
+
+
+def _word_search(kind: str, field: str, value: str) -> CatalogQuery:
+    # The text index narrows the candidates; the escaped regex then keeps
+    # only documents where the value actually appears in the given field.
+    return CatalogQuery(
+        kind=kind,
+        filter={
+            "$text": {"$search": value},
+            field: {"$regex": re.escape(value), "$options": "i"},
+        },
+    )
+
+
+def build_catalog_query(query: str) -> CatalogQuery:
+    """
+    Parses an inventory query string into an index-friendly filter.
+
+    Args:
+        query: "all", "available", "genre:<g>", "author:<a>", "title:<t>",
+            "status:<s>" or free text.
+
+    Returns:
+        The CatalogQuery to execute.
+    """
+    query = query.strip()
+    lowered = query.lower()
+
+    if lowered == "all":
+        return CatalogQuery(kind="all", filter={})
+    if lowered == "available":
+        return CatalogQuery(kind="status", filter={"status": "available"})
+
+    if ":" in query:
+        field, value = query.split(":", 1)
+        field = field.strip().lower()
+        value = value.strip()
+
+        if field == "status":
+            return CatalogQuery(kind="status", filter={"status": value.lower()})
+        if field in ("genre", "author", "title"):
+            # Exact match, then prefix ("genre:Myst", "author:Osm"), then
+            # words anywhere in the field ("author:Weir").
+            fallback = _word_search(field, field, value)
+            if value:
+                fallback = _prefix_search(field, value, fallback)
+            return CatalogQuery(
+                kind=field,
+                filter={field: value},
+                collation=CASE_INSENSITIVE,
+                fallback=fallback,
+            )
+        query = value
+
+    return CatalogQuery(kind="search", filter={"$text": {"$search": query}})
+
+
+def normalize_query(query: str) -> str:
+    """
+    Returns the canonical form of a query string.
+
+    Every supported query is matched case-insensitively, so queries that
+    differ only in case or whitespace are the same query.
+    """
+    return " ".join(query.lower().split())
+
+
+def _query_fingerprint(query: str) -> str:
+    return hashlib.sha1(normalize_query(query).encode()).hexdigest()[:8]
+
+
+def encode_page_token(
+    query: str, shape_index: int, last_id: Any, total: Optional[int]
+) -> str:
+    """Encodes where the next page starts as an opaque resume token."""
+    payload = {
+        "q": _query_fingerprint(query),
+        "s": shape_index,
+        "a": str(last_id),
+        "t": total,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_page_token(query: str, token: str) -> Dict[str, Any]:
+    """
+    Decodes a resume token produced by encode_page_token().
+
+    Raises:
+        ValueError: If the token is malformed or belongs to another query.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid page_token") from e
+    if payload.get("q") != _query_fingerprint(query):
+        raise ValueError("page_token does not belong to this query")
+    return payload
+
+
+class _PageRequest:
+    """The I/O-free part of fetching a page, shared by the sync and async paths."""
+
+    def __init__(self, query: str, limit: Optional[int], page_token: str):
+        settings = get_config().catalog_settings
+        self.query = query
+        self.limit = max(
+            1, min(limit or settings.default_page_size, settings.max_page_size)
+        )
+        self.max_bytes = settings.max_result_bytes
+        self.shapes = list(build_catalog_query(query).shapes())
+        if page_token:
+            token = decode_page_token(query, page_token)
+            self.shape_index, self.total = token["s"], token["t"]
+            self.after = ObjectId(token["a"])
+        else:
+            self.shape_index, self.total, self.after = 0, None, None
+
+    @property
+    def shape(self) -> CatalogQuery:
+        return self.shapes[self.shape_index]
+
+    def find_args(self) -> Tuple[Dict[str, Any], Optional[Dict[str, int]], Dict[str, Any]]:
+        """Returns the filter, projection and options for the current shape."""
+        shape = self.shape
+        mongo_filter = shape.filter
+        if self.after is not None:
+            mongo_filter = {"$and": [shape.filter, {"_id": {"$gt": self.after}}]}
+        # One extra document tells us whether another page exists.
+        options = {
+            "collation": shape.collation,
+            "sort": [("_id", ASCENDING)],
+            "limit": self.limit + 1,
+        }
+        return mongo_filter, PROJECTIONS.get(shape.kind), options
+
+    def advance(self, docs: List[Dict[str, Any]]) -> bool:
+        """Moves to the fallback shape if docs is an empty first page."""
+        if docs or self.after is not None or self.shape_index == len(self.shapes) - 1:
+            return False
+        self.shape_index += 1
+        return True
+
+    def count_args(self) -> Optional[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Returns count_documents arguments, or None for the whole collection."""
+        shape = self.shape
+        if not shape.filter:
+            return None
+        options = {"collation": shape.collation} if shape.collation else {}
+        return shape.filter, options
+
+    def build(self, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Turns the fetched documents into the tool response."""
+        books: List[Dict[str, Any]] = []
+        used_bytes = 0
+        truncated = False
+        for doc in docs[: self.limit]:
+            book = {k: v for k, v in doc.items() if k != "_id"}
+            size = len(json.dumps(book, default=str))
+            # Always return at least one book so paging makes progress.
+            if books and used_bytes + size > self.max_bytes:
+                truncated = True
+                break
+            books.append(book)
+            used_bytes += size
+
+        more_available = truncated or len(docs) > self.limit
+        next_page_token = ""
+        if more_available:
+            next_page_token = encode_page_token(
+                self.query, self.shape_index, docs[len(books) - 1]["_id"], self.total
+            )
+
+        return {
+            "result": books,
+            "count": len(books),
+            "total": self.total,
+            "more_available": more_available,
+            "next_page_token": next_page_token,
+            "truncated": truncated,
+            "query": self.query,
+        }
+
+
+def fetch_page(
+    collection: Collection,
+    query: str,
+    limit: Optional[int] = None,
+    page_token: str = "",
+) -> Dict[str, Any]:
+    """
+    Fetches one page of books for an inventory query.
+
+    Pages are ordered by "_id" and resumed with a token. Exact genre,
+    author and status pages are read from a (field, _id) index starting at
+    the token, so deep pages cost the same as the first one; title, prefix
+    and text matches are sorted before the page is cut, which costs as much
+    as the number of matches. The total is counted on the server when the
+    first page is requested and carried in the token afterwards. The page
+    stops early when its serialized size would exceed the byte budget.
+
+    Args:
+        collection: The books collection.
+        query: The inventory query string.
+        limit: Maximum books per page; clamped to the configured maximum.
+        page_token: The next_page_token of the previous page, if any.
+
+    Returns:
+        A dictionary with the books, the page count, the total and, when
+        more books are available, the token for the next page.
+    """
+    request = _PageRequest(query, limit, page_token)
+    while True:
+        mongo_filter, projection, options = request.find_args()
+        docs = list(collection.find(mongo_filter, projection, **options))
+        if not request.advance(docs):
+            break
+
+    if request.total is None:
+        count_args = request.count_args()
+        if not docs:
+            request.total = 0
+        elif count_args is None:
+            request.total = collection.estimated_document_count()
+        else:
+            request.total = collection.count_documents(count_args[0], **count_args[1])
+    return request.build(docs)
+
+
+async def fetch_page_async(
+    collection: AsyncCollection,
+    query: str,
+    limit: Optional[int] = None,
+    page_token: str = "",
+) -> Dict[str, Any]:
+    """Asynchronous fetch_page() for a collection on the async client."""
+    request = _PageRequest(query, limit, page_token)
+    while True:
+        mongo_filter, projection, options = request.find_args()
+        docs = await collection.find(mongo_filter, projection, **options).to_list()
+        if not request.advance(docs):
+            break
+
+    if request.total is None:
+        count_args = request.count_args()
+        if not docs:
+            request.total = 0
+        elif count_args is None:
+            request.total = await collection.estimated_document_count()
+        else:
+            request.total = await collection.count_documents(
+                count_args[0], **count_args[1]
+            )
+    return request.build(docs)
+
+
+_AVAILABILITY_PROJECTION = {
+    "_id": 0,
+    "isbn": 1,
+    "quantity_available": 1,
+    "store_quantities": 1,
+}
+
+
+def _unique(values: Sequence[str]) -> List[str]:
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def _availability_matrix(
+    docs: Iterable[Dict[str, Any]], product_ids: List[str], store_ids: List[str]
+) -> Dict[str, Any]:
+    by_id = {doc["isbn"]: doc for doc in docs}
+    quantities: List[List[int]] = []
+    for product_id in product_ids:
+        doc = by_id.get(product_id)
+        if doc is None:
+            continue
+        if "store_quantities" in doc:
+            # Per-store stock when the catalog tracks it ...
+            stores = doc["store_quantities"] or {}
+            row = [int(stores.get(store, 0)) for store in store_ids]
+        else:
+            # ... otherwise the single library stock serves every store.
+            row = [int(doc.get("quantity_available") or 0)] * len(store_ids)
+        quantities.append(row)
+    return {
+        "products": [p for p in product_ids if p in by_id],
+        "stores": store_ids,
+        "quantity": quantities,
+        "not_found": [p for p in product_ids if p not in by_id],
+    }
+
+
+def fetch_availability(
+    collection: Collection, product_ids: Sequence[str], store_ids: Sequence[str]
+) -> Dict[str, Any]:
+    """
+    Looks up the stock of many products at many stores in one query.
+
+    Args:
+        collection: The books collection.
+        product_ids: ISBNs of the books to check.
+        store_ids: The stores to check them at.
+
+    Returns:
+        A compact matrix: "quantity"[i][j] is the stock of "products"[i] at
+        "stores"[j], taken from the book's "store_quantities" map when it has
+        one and from "quantity_available" otherwise. Unknown ids are listed
+        in "not_found".
+    """
+    product_ids, store_ids = _unique(product_ids), _unique(store_ids)
+    docs = collection.find({"isbn": {"$in": product_ids}}, _AVAILABILITY_PROJECTION)
+    return _availability_matrix(docs, product_ids, store_ids)
+
+
+async def fetch_availability_async(
+    collection: AsyncCollection, product_ids: Sequence[str], store_ids: Sequence[str]
+) -> Dict[str, Any]:
+    """Asynchronous fetch_availability() for a collection on the async client."""
+    product_ids, store_ids = _unique(product_ids), _unique(store_ids)
+    docs = await collection.find(
+        {"isbn": {"$in": product_ids}}, _AVAILABILITY_PROJECTION
+    ).to_list()
+    return _availability_matrix(docs, product_ids, store_ids)
+
+
+def _log_isbn_index_error(collection_name: str, error: Exception) -> None:
+    logger.error(
+        "Could not build the unique isbn index on %s; ISBN lookups are not "
+        "indexed until duplicate ISBNs are removed: %s",
+        collection_name,
+        error,
+    )
+
+
+def ensure_indexes(collection: Collection) -> List[str]:
+    """
+    Creates the catalog indexes if they do not exist yet.
+
+    createIndexes is a no-op for identical existing indexes and fails when
+    an index with the same name but different options already exists, so a
+    drifted schema surfaces here instead of as slow queries later. The
+    unique ISBN_INDEX is built afterwards on its own; if duplicate ISBNs
+    prevent it, the error is logged and the other indexes stand.
+
+    Args:
+        collection: The books collection.
+
+    Returns:
+        The names of the catalog indexes that were ensured.
+    """
+    names = collection.create_indexes(CATALOG_INDEXES)
+    try:
+        names += collection.create_indexes([ISBN_INDEX])
+    except OperationFailure as e:
+        _log_isbn_index_error(collection.full_name, e)
+    logger.info("Catalog indexes ensured on %s: %s", collection.full_name, names)
+    return names
+
+
+def _plan_stages(plan: Dict[str, Any]) -> Iterator[str]:
+    # explain() output nests stages under inputStage/inputStages; on the
+    # slot-based engine the classic tree lives under "queryPlan".
+    if "queryPlan" in plan:
+        plan = plan["queryPlan"]
+    if "stage" in plan:
+        yield plan["stage"]
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def verify_query_plans(collection: Collection) -> Dict[str, List[str]]:
+    """
+    Explains every supported query shape and fails on a collection scan.
+
+    Equality shapes of INDEX_ORDERED_KINDS are explained with the page sort
+    and must not need an in-memory SORT either.
+
+    Args:
+        collection: The books collection.
+
+    Returns:
+        A mapping of query shape description to its winning plan stages.
+
+    Raises:
+        QueryPlanError: If any supported shape is planned as a COLLSCAN, or
+            an index-ordered shape with a SORT stage.
+    """
+    plans: Dict[str, List[str]] = {}
+    regressions = []
+    for sample in VERIFIED_QUERY_SHAPES:
+        for shape in build_catalog_query(sample).shapes():
+            label = f"{sample!r} ({shape.kind}, {'/'.join(shape.filter)})"
+            ordered = shape.kind in INDEX_ORDERED_KINDS and not any(
+                isinstance(value, dict) or key.startswith("$")
+                for key, value in shape.filter.items()
+            )
+            cursor = collection.find(shape.filter, collation=shape.collation)
+            if ordered:
+                cursor = cursor.sort("_id", ASCENDING)
+            stages = list(_plan_stages(cursor.explain()["queryPlanner"]["winningPlan"]))
+            plans[label] = stages
+            if "COLLSCAN" in stages or (ordered and "SORT" in stages):
+                regressions.append(label)
+
+    if regressions:
+        raise QueryPlanError(
+            "Catalog queries regressed to COLLSCAN or an in-memory SORT: "
+            + ", ".join(regressions)
+        )
+    return plans
+
+
+_bootstrap_lock = threading.Lock()
+_bootstrapped = False
+
+
+def get_books_collection() -> Collection:
+    """
+    Returns the books collection, bootstrapping its indexes once per process.
+
+    Index creation failures are logged and retried on the next call so a
+    temporarily unreachable server does not disable the tool. A query plan
+    regression, when verification is enabled, is raised.
+
+    Returns:
+        The books collection on the shared client.
+    """
+    global _bootstrapped
+
+    settings = get_config().catalog_settings
+    collection = get_collection(settings.database, settings.collection)
+    if _bootstrapped or not settings.ensure_indexes:
+        return collection
+
+    with _bootstrap_lock:
+        if not _bootstrapped:
+            try:
+                ensure_indexes(collection)
+            except Exception as e:
+                logger.error("Could not ensure catalog indexes: %s", e)
+                return collection
+            if settings.verify_query_plans:
+                verify_query_plans(collection)
+            _bootstrapped = True
+    return collection
+
+
+async def get_books_collection_async() -> AsyncCollection:
+    """
+    Asynchronous get_books_collection() returning a collection on the async
+    client of the running event loop.
+
+    Returns:
+        The books collection on the shared async client.
+    """
+    global _bootstrapped
+
+    settings = get_config().catalog_settings
+    collection = get_async_collection(settings.database, settings.collection)
+    if _bootstrapped or not settings.ensure_indexes:
+        return collection
+
+    # createIndexes is idempotent, so concurrent first calls are harmless.
+    try:
+        names = await collection.create_indexes(CATALOG_INDEXES)
+        try:
+            names += await collection.create_indexes([ISBN_INDEX])
+        except OperationFailure as e:
+            _log_isbn_index_error(collection.full_name, e)
+        logger.info("Catalog indexes ensured on %s: %s", collection.full_name, names)
+    except Exception as e:
+        logger.error("Could not ensure catalog indexes: %s", e)
+        return collection
+    if settings.verify_query_plans:
+        await asyncio.to_thread(
+            verify_query_plans, get_collection(settings.database, settings.collection)
+        )
+    _bootstrapped = True
+    return collection
+
+
+def main() -> int:
+    """Creates the catalog indexes and prints the verified query plans."""
+    settings = get_config().catalog_settings
+    collection = get_collection(settings.database, settings.collection)
+    print(f"Ensured indexes: {', '.join(ensure_indexes(collection))}")
+    try:
+        plans = verify_query_plans(collection)
+    except QueryPlanError as e:
+        print(f"FAILED: {e}")
+        return 1
+    for label, stages in plans.items():
+        print(f"  {label}: {' <- '.join(stages)}")
+    print("All supported query shapes use an index.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
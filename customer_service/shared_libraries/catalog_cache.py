@@ -0,0 +1,216 @@
+"""Read-through cache for catalog queries.
+
+Pages returned by :func:`catalog.fetch_page` are cached on the normalized
+query, page size and page token. A background invalidator clears the cache
+when the catalog changes: it follows a change stream on the books collection
+when the server supports one (replica set or sharded cluster) and otherwise
+polls the most recent ``last_updated`` value and the document count.
+
+A page is only stored if the cache was not cleared while it was being
+read, so a page read before a change cannot be cached after the
+invalidation for that change.
+"""
+
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from pymongo.asynchronous.collection import AsyncCollection
+from pymongo.collection import Collection
+from pymongo.errors import OperationFailure, PyMongoError
+
+from customer_service.config import get_config
+from customer_service.shared_libraries.cache import TTLCache
+from customer_service.shared_libraries.catalog import (
+    fetch_page,
+    fetch_page_async,
+    normalize_query,
+)
+from customer_service.shared_libraries.mongo import get_collection
+
+logger = logging.getLogger(__name__)
+
+_settings = get_config().catalog_settings
+catalog_cache = TTLCache(maxsize=_settings.cache_size, ttl=_settings.cache_ttl_secs)
+
+
+class CatalogCacheInvalidator(threading.Thread):
+    """Background thread that clears a cache whenever the catalog changes."""
+
+    def __init__(
+        self,
+        collection: Collection,
+        cache: TTLCache,
+        mode: str = "auto",
+        poll_interval: float = 5.0,
+    ):
+        super().__init__(name="catalog-cache-invalidator", daemon=True)
+        self._collection = collection
+        self._cache = cache
+        self._mode = mode
+        self._poll_interval = poll_interval
+        self._stop_event = threading.Event()
+        self.active_mode: Optional[str] = None
+        self.invalidations = 0
+
+    def stop(self) -> None:
+        """Asks the thread to exit after its current wait."""
+        self._stop_event.set()
+
+    def _invalidate(self, reason: str) -> None:
+        self._cache.clear()
+        self.invalidations += 1
+        logger.debug("Catalog cache cleared (%s)", reason)
+
+    def run(self) -> None:
+        if self._mode in ("auto", "change_stream"):
+            try:
+                self._watch()
+                return
+            except OperationFailure as e:
+                if self._mode == "change_stream":
+                    logger.error("Catalog change stream unavailable: %s", e)
+                    return
+                logger.info(
+                    "Change streams unavailable (%s); polling last_updated every %ss",
+                    e,
+                    self._poll_interval,
+                )
+        if self._mode in ("auto", "poll"):
+            self._poll()
+
+    def _watch(self) -> None:
+        resume_token = None
+        while not self._stop_event.is_set():
+            try:
+                with self._collection.watch(
+                    resume_after=resume_token, max_await_time_ms=1000
+                ) as stream:
+                    self.active_mode = "change_stream"
+                    while not self._stop_event.is_set():
+                        change = stream.try_next()
+                        resume_token = stream.resume_token
+                        if change is not None:
+                            self._invalidate(change["operationType"])
+            except OperationFailure:
+                if self.active_mode is None:
+                    raise
+                # The resume point may have rolled off the oplog; start over
+                # and drop anything that may have changed in between.
+                logger.warning("Catalog change stream lost; restarting")
+                resume_token = None
+                self._invalidate("change stream restart")
+            except PyMongoError as e:
+                logger.warning("Catalog change stream interrupted: %s", e)
+                self._stop_event.wait(self._poll_interval)
+
+    def _catalog_version(self) -> Tuple[Any, int]:
+        latest = self._collection.find_one(
+            {}, {"_id": 0, "last_updated": 1}, sort=[("last_updated", -1)]
+        )
+        # The count catches deletions, which do not move last_updated.
+        return (
+            latest.get("last_updated") if latest else None,
+            self._collection.estimated_document_count(),
+        )
+
+    def _poll(self) -> None:
+        self.active_mode = "poll"
+        version = None
+        while not self._stop_event.is_set():
+            try:
+                current = self._catalog_version()
+                if version is not None and current != version:
+                    self._invalidate("last_updated poll")
+                version = current
+            except PyMongoError as e:
+                logger.warning("Catalog poll failed: %s", e)
+            self._stop_event.wait(self._poll_interval)
+
+
+_invalidator: Optional[CatalogCacheInvalidator] = None
+_invalidator_pid: Optional[int] = None
+_invalidator_lock = threading.Lock()
+
+
+def _ensure_invalidator() -> None:
+    global _invalidator, _invalidator_pid
+
+    if _settings.cache_invalidation == "none":
+        return
+    # Threads do not survive a fork, so a child process starts its own.
+    if _invalidator is not None and _invalidator_pid == os.getpid():
+        return
+    with _invalidator_lock:
+        if _invalidator is None or _invalidator_pid != os.getpid():
+            # The invalidator runs on its own thread with the sync client.
+            _invalidator = CatalogCacheInvalidator(
+                get_collection(_settings.database, _settings.collection),
+                catalog_cache,
+                mode=_settings.cache_invalidation,
+                poll_interval=_settings.cache_poll_interval_secs,
+            )
+            _invalidator_pid = os.getpid()
+            _invalidator.start()
+
+
+def cached_fetch_page(
+    collection: Collection,
+    query: str,
+    limit: Optional[int] = None,
+    page_token: str = "",
+) -> Dict[str, Any]:
+    """
+    Read-through wrapper around catalog.fetch_page().
+
+    Args:
+        collection: The books collection.
+        query: The inventory query string.
+        limit: Maximum books per page.
+        page_token: The next_page_token of the previous page, if any.
+
+    Returns:
+        The page, served from the cache when an identical query was answered
+        recently and the catalog has not changed since.
+    """
+    if not _settings.cache_enabled:
+        return fetch_page(collection, query, limit, page_token)
+
+    _ensure_invalidator()
+    key = (normalize_query(query), limit, page_token)
+    page = catalog_cache.get(key)
+    if page is None:
+        generation = catalog_cache.generation
+        page = fetch_page(collection, query, limit, page_token)
+        catalog_cache.set(key, page, generation=generation)
+    # Echo the caller's spelling of the query, not the one that was cached.
+    return {**page, "query": query}
+
+
+async def cached_fetch_page_async(
+    collection: AsyncCollection,
+    query: str,
+    limit: Optional[int] = None,
+    page_token: str = "",
+) -> Dict[str, Any]:
+    """Asynchronous cached_fetch_page() for a collection on the async client."""
+    if not _settings.cache_enabled:
+        return await fetch_page_async(collection, query, limit, page_token)
+
+    _ensure_invalidator()
+    key = (normalize_query(query), limit, page_token)
+    page = catalog_cache.get(key)
+    if page is None:
+        generation = catalog_cache.generation
+        page = await fetch_page_async(collection, query, limit, page_token)
+        catalog_cache.set(key, page, generation=generation)
+    return {**page, "query": query}
+
+
+def catalog_cache_stats() -> Dict[str, Any]:
+    """Returns the catalog cache counters and the invalidation mode in use."""
+    stats = catalog_cache.stats()
+    stats["invalidation_mode"] = _invalidator.active_mode if _invalidator else None
+    stats["invalidations"] = _invalidator.invalidations if _invalidator else 0
+    return stats
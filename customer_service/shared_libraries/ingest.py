@@ -0,0 +1,644 @@
+"""Streaming bulk ingestion of catalog feeds into Library.Books.
+
+Reads a CSV or JSON-lines file of any size and upserts every valid row on
+``isbn``, so a feed can be loaded again, or resumed, without creating
+duplicates::
+
+    python -m customer_service.shared_libraries.ingest books.jsonl
+    python -m customer_service.shared_libraries.ingest books.csv --writers 8
+
+The work runs in two concurrent stages joined by bounded queues, so the
+memory used does not depend on the file size:
+
+* the reader parses and validates rows against CATALOG_SCHEMA, compiled once
+  into a list of converters, and groups them into batches capped in rows
+  and bytes; rejected rows go to an optional rejects file;
+* writer threads send each batch as one unordered ``bulk_write`` of
+  ``UpdateOne(upsert=True)`` operations, which the server applies in
+  parallel while the reader prepares the next batches.
+
+A batch is split by ISBN among the writers, each with its own queue, so
+every row of a given ISBN is written by the same writer in file order: when
+a feed repeats an ISBN, in one batch or across batches, its last row wins.
+
+Progress is checkpointed to a small JSON file: the byte offset below which
+every row has been written, with the size and mtime of the input. After a
+crash the same command continues from that offset; since the writes are
+upserts, rows written after the last checkpoint are simply written again.
+"""
+
+import argparse
+import csv
+import io
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from customer_service.config import IngestModel, get_config
+
+logger = logging.getLogger(__name__)
+
+_ISBN = re.compile(r"^(97[89])?[0-9-]{9,13}[0-9Xx]$")
+_STATUSES = ("available", "checked_out", "maintenance")
+_DUPLICATE_KEY = 11000
+
+
+class RowError(ValueError):
+    """Raised for a row that does not match the schema."""
+
+
+def _text(value: Any) -> str:
+    if not isinstance(value, str):
+        raise RowError(f"expected text, got {value!r}")
+    return value.strip()
+
+
+def _integer(value: Any) -> int:
+    if isinstance(value, bool):
+        raise RowError(f"expected an integer, got {value!r}")
+    if isinstance(value, int):
+        number = value
+    elif isinstance(value, float) and value.is_integer():
+        number = int(value)
+    elif isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        number = int(value)
+    else:
+        raise RowError(f"expected an integer, got {value!r}")
+    if number < 0:
+        raise RowError(f"expected a non-negative integer, got {number}")
+    return number
+
+
+def _number(value: Any) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise RowError(f"expected a number, got {value!r}") from None
+    if number < 0:
+        raise RowError(f"expected a non-negative number, got {number}")
+    return number
+
+
+def _isbn(value: Any) -> str:
+    isbn = _text(value)
+    if not _ISBN.match(isbn) or len(isbn.replace("-", "")) not in (10, 13):
+        raise RowError(f"invalid ISBN {value!r}")
+    return isbn
+
+
+def _status(value: Any) -> str:
+    status = _text(value).lower()
+    if status not in _STATUSES:
+        raise RowError(f"status must be one of {', '.join(_STATUSES)}")
+    return status
+
+
+def _year(value: Any) -> int:
+    year = _integer(value)
+    if not 1000 <= year <= 2100:
+        raise RowError(f"implausible publication year {year}")
+    return year
+
+
+def _store_quantities(value: Any) -> Dict[str, int]:
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise RowError("store_quantities must be a JSON object") from None
+    if not isinstance(value, dict):
+        raise RowError("store_quantities must be an object")
+    return {_text(store): _integer(quantity) for store, quantity in value.items()}
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """How one catalog field is validated."""
+
+    convert: Callable[[Any], Any]
+    required: bool = False
+
+
+CATALOG_SCHEMA: Dict[str, FieldSpec] = {
+    "isbn": FieldSpec(_isbn, required=True),
+    "title": FieldSpec(_text, required=True),
+    "author": FieldSpec(_text, required=True),
+    "genre": FieldSpec(_text),
+    "publication_year": FieldSpec(_year),
+    "quantity_available": FieldSpec(_integer),
+    "quantity_total": FieldSpec(_integer),
+    "location": FieldSpec(_text),
+    "publisher": FieldSpec(_text),
+    "language": FieldSpec(_text),
+    "status": FieldSpec(_status),
+    "price": FieldSpec(_number),
+    "added_date": FieldSpec(_text),
+    "last_updated": FieldSpec(_text),
+    "store_quantities": FieldSpec(_store_quantities),
+}
+
+
+def compile_schema(
+    schema: Dict[str, FieldSpec],
+) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Turns a schema into a validator of parsed rows.
+
+    Empty CSV cells count as missing; fields outside the schema are dropped,
+    except dotted CSV columns such as "store_quantities.main", which are
+    folded into their object first.
+
+    Raises (from the validator):
+        RowError: If a required field is missing or a value is invalid.
+    """
+    fields: Tuple[Tuple[str, Callable[[Any], Any], bool], ...] = tuple(
+        (name, spec.convert, spec.required) for name, spec in schema.items()
+    )
+    nested = {name for name, spec in schema.items() if spec.convert is _store_quantities}
+
+    def validate(row: Dict[str, Any]) -> Dict[str, Any]:
+        for key in [k for k in row if "." in k]:
+            parent, child = key.split(".", 1)
+            if parent in nested:
+                value = row.pop(key)
+                if value not in ("", None):
+                    row.setdefault(parent, {})[child] = value
+        doc = {}
+        for name, convert, required in fields:
+            value = row.get(name)
+            if value is None or value == "":
+                if required:
+                    raise RowError(f"missing {name}")
+                continue
+            try:
+                doc[name] = convert(value)
+            except RowError as e:
+                raise RowError(f"{name}: {e}") from None
+        return doc
+
+    return validate
+
+
+def _upsert(doc: Dict[str, Any], now: str) -> UpdateOne:
+    doc = dict(doc)
+    # A re-delivered row keeps the date the book was first added, and a
+    # feed without timestamps still bumps last_updated for the catalog
+    # cache invalidator.
+    added = doc.pop("added_date", now)
+    doc.setdefault("last_updated", now)
+    return UpdateOne(
+        {"isbn": doc["isbn"]},
+        {"$set": doc, "$setOnInsert": {"added_date": added}},
+        upsert=True,
+    )
+
+
+@dataclass
+class Batch:
+    """Validated rows ending at a byte offset of the input."""
+
+    seq: int
+    end_offset: int
+    rows: int
+    docs: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    # The number of writers the batch was split among.
+    parts: int = 1
+
+    def split(self, writers: int) -> List["Batch"]:
+        """Splits the rows by ISBN, one part per writer."""
+        parts = [
+            Batch(self.seq, self.end_offset, self.rows, {}, writers)
+            for _ in range(writers)
+        ]
+        for isbn, doc in self.docs.items():
+            parts[_writer_of(isbn, writers)].docs[isbn] = doc
+        return parts
+
+
+def _writer_of(isbn: str, writers: int) -> int:
+    # Stable across runs, unlike hash(), so a resumed run routes the same way.
+    return zlib.crc32(isbn.encode()) % writers
+
+
+@dataclass
+class IngestStats:
+    """Counters of an ingestion run."""
+
+    rows: int = 0
+    rejected: int = 0
+    duplicates: int = 0
+    upserted: int = 0
+    modified: int = 0
+    matched: int = 0
+    failed: int = 0
+    batches: int = 0
+    elapsed_secs: float = 0.0
+    resumed_from: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        rate = self.rows / self.elapsed_secs if self.elapsed_secs else 0.0
+        return {**self.__dict__, "rows_per_sec": round(rate, 1)}
+
+
+def _fingerprint(path: str) -> Dict[str, Any]:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+class Checkpoint:
+    """The committed byte offset of an input file, saved atomically."""
+
+    def __init__(self, path: str, source: Dict[str, Any]):
+        self.path = path
+        self.source = source
+
+    def load(self) -> Tuple[int, int]:
+        """Returns (offset, rows) to resume from; (0, 0) without a checkpoint.
+
+        Raises:
+            ValueError: If the checkpoint belongs to a different input file.
+        """
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path) as f:
+            saved = json.load(f)
+        if saved["source"] != self.source:
+            raise ValueError(
+                f"{self.path} was written for another version of the input; "
+                "use --restart to ingest it from the beginning"
+            )
+        return saved["offset"], saved["rows"]
+
+    def save(self, offset: int, rows: int) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"source": self.source, "offset": offset, "rows": rows}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _detect_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_records(
+    f: io.BufferedReader, fmt: str, start: int
+) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+    """
+    Yields (row, line number, end offset) from a binary file.
+
+    The end offset is the byte position just past the row, so resuming from
+    it never splits a record; for CSV the header is read first. Line numbers
+    count from the start offset. Rows that cannot be parsed are yielded as
+    RowError instances.
+    """
+    offset = start
+    line_number = 0
+
+    def lines(skip_to: int) -> Iterator[str]:
+        nonlocal offset, line_number
+        f.seek(skip_to)
+        offset = skip_to
+        for line in f:
+            offset += len(line)
+            line_number += 1
+            yield line.decode("utf-8-sig" if offset == len(line) else "utf-8")
+
+    if fmt == "csv":
+        f.seek(0)
+        header = next(csv.reader([f.readline().decode("utf-8-sig")]), [])
+        line_number = 0 if start else 1
+        reader = csv.reader(lines(max(start, f.tell())))
+        for values in reader:
+            if not values:
+                continue
+            if len(values) != len(header):
+                yield RowError(f"expected {len(header)} columns"), line_number, offset
+            else:
+                yield dict(zip(header, values)), line_number, offset
+        return
+
+    for line in lines(start):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield RowError(f"invalid JSON: {e}"), line_number, offset
+            continue
+        if not isinstance(row, dict):
+            yield RowError("expected a JSON object"), line_number, offset
+        else:
+            yield row, line_number, offset
+
+
+class Ingestor:
+    """Runs the parse and write stages of one ingestion."""
+
+    def __init__(self, collection, settings: Optional[IngestModel] = None):
+        self.collection = collection
+        self.settings = settings or get_config().ingest_settings
+        self.validate = compile_schema(CATALOG_SCHEMA)
+        self.stats = IngestStats()
+        self._lock = threading.Lock()
+        self._errors: List[BaseException] = []
+
+    def _write(self, batch: Batch) -> None:
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        operations = [_upsert(doc, now) for doc in batch.docs.values()]
+        counts = {"upserted": 0, "modified": 0, "matched": 0, "failed": 0}
+        for attempt in range(self.settings.max_retries + 1):
+            try:
+                result = self.collection.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                details = e.details
+                counts["upserted"] += details.get("nUpserted", 0)
+                counts["modified"] += details.get("nModified", 0)
+                counts["matched"] += details.get("nMatched", 0)
+                # Another process upserting a new ISBN at the same time: one
+                # insert loses on the unique index and succeeds as an update
+                # when retried.
+                retry = []
+                for error in details.get("writeErrors", []):
+                    if error.get("code") == _DUPLICATE_KEY:
+                        retry.append(operations[error["index"]])
+                    else:
+                        counts["failed"] += 1
+                        logger.error("Row rejected by the server: %s", error.get("errmsg"))
+                if retry and attempt < self.settings.max_retries:
+                    operations = retry
+                    continue
+                counts["failed"] += len(retry)
+            else:
+                counts["upserted"] += result.upserted_count
+                counts["modified"] += result.modified_count
+                counts["matched"] += result.matched_count
+            break
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self.stats, name, getattr(self.stats, name) + count)
+            self.stats.batches += 1
+
+    def _writer(self, batches: "queue.Queue[Optional[Batch]]", done: "queue.Queue") -> None:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                return
+            try:
+                if batch.docs:
+                    self._write(batch)
+                done.put((batch, None))
+            except BaseException as e:
+                done.put((batch, e))
+
+    def run(
+        self,
+        path: str,
+        fmt: Optional[str] = None,
+        checkpoint_path: Optional[str] = None,
+        rejects_path: Optional[str] = None,
+        restart: bool = False,
+        progress: Optional[Callable[[IngestStats], None]] = None,
+    ) -> IngestStats:
+        """
+        Ingests a file and returns the counters.
+
+        Args:
+            path: The CSV or JSONL file.
+            fmt: "csv" or "jsonl"; guessed from the extension by default.
+            checkpoint_path: Where progress is saved; defaults to
+                "<path>.checkpoint.json". It is removed when the file is done.
+            rejects_path: JSONL file receiving rejected rows and the reason.
+            restart: Ignore an existing checkpoint.
+            progress: Called with the counters every progress_secs.
+        """
+        settings = self.settings
+        fmt = fmt or _detect_format(path)
+        checkpoint = Checkpoint(
+            checkpoint_path or f"{path}.checkpoint.json", _fingerprint(path)
+        )
+        if restart:
+            checkpoint.clear()
+        start, rows_before = checkpoint.load()
+        self.stats.resumed_from = start
+        if start:
+            logger.info("Resuming %s at byte %d (%d rows done)", path, start, rows_before)
+
+        n_writers = max(1, settings.writers)
+        queues: "List[queue.Queue[Optional[Batch]]]" = [
+            queue.Queue(settings.queue_size) for _ in range(n_writers)
+        ]
+        done: "queue.Queue[Tuple[Batch, Optional[BaseException]]]" = queue.Queue()
+        writers = [
+            threading.Thread(
+                target=self._writer, args=(batches, done), name=f"ingest-writer-{i}", daemon=True
+            )
+            for i, batches in enumerate(queues)
+        ]
+        for writer in writers:
+            writer.start()
+
+        def dispatch(batch: Batch) -> None:
+            # Blocks while a writer is queue_size batches behind, which
+            # bounds the memory of the reader.
+            for batches, part in zip(queues, batch.split(n_writers)):
+                batches.put(part)
+
+        # Batches finish out of order; the checkpoint only moves past a
+        # batch once every part of it and of every earlier batch has been
+        # written too.
+        written_parts: Dict[int, int] = {}
+        pending: Dict[int, Batch] = {}
+        next_seq = 0
+        committed_rows = rows_before
+        last_saved = last_report = started = time.monotonic()
+
+        def collect(block: bool) -> None:
+            nonlocal next_seq, committed_rows, last_saved, last_report
+            while True:
+                try:
+                    batch, error = done.get(block=block, timeout=1 if block else None)
+                except queue.Empty:
+                    return
+                if error is not None:
+                    raise error
+                written_parts[batch.seq] = written_parts.get(batch.seq, 0) + 1
+                if written_parts[batch.seq] == batch.parts:
+                    del written_parts[batch.seq]
+                    pending[batch.seq] = batch
+                committed = None
+                while next_seq in pending:
+                    committed = pending.pop(next_seq)
+                    committed_rows += committed.rows
+                    next_seq += 1
+                now = time.monotonic()
+                if committed and now - last_saved >= settings.checkpoint_interval_secs:
+                    checkpoint.save(committed.end_offset, committed_rows)
+                    last_saved = now
+                if progress and now - last_report >= settings.progress_secs:
+                    self.stats.elapsed_secs = now - started
+                    progress(self.stats)
+                    last_report = now
+                block = False
+
+        rejects = open(rejects_path, "a") if rejects_path else None
+        seq = 0
+        batch = Batch(seq, start, 0)
+        batch_start = start
+        try:
+            with open(path, "rb") as f:
+                for row, line_number, end_offset in read_records(f, fmt, start):
+                    self.stats.rows += 1
+                    batch.rows += 1
+                    batch.end_offset = end_offset
+                    try:
+                        if isinstance(row, RowError):
+                            raise row
+                        doc = self.validate(row)
+                    except RowError as e:
+                        self.stats.rejected += 1
+                        if rejects:
+                            record = {
+                                "line": line_number,
+                                "error": str(e),
+                                "row": None if row is e else row,
+                            }
+                            rejects.write(json.dumps(record, default=str) + "\n")
+                        continue
+                    if doc["isbn"] in batch.docs:
+                        # The last row of a duplicated ISBN wins; across
+                        # batches, the ISBN's writer applies them in order.
+                        self.stats.duplicates += 1
+                    batch.docs[doc["isbn"]] = doc
+                    if (
+                        len(batch.docs) >= settings.batch_size
+                        or end_offset - batch_start >= settings.max_batch_bytes
+                    ):
+                        collect(block=False)
+                        dispatch(batch)
+                        seq += 1
+                        batch_start = end_offset
+                        batch = Batch(seq, end_offset, 0)
+            dispatch(batch)
+            for batches in queues:
+                batches.put(None)
+            while next_seq <= seq:
+                collect(block=True)
+        finally:
+            if rejects:
+                rejects.close()
+            for batches in queues:
+                try:
+                    batches.put_nowait(None)
+                except queue.Full:
+                    pass
+        for writer in writers:
+            writer.join()
+        checkpoint.clear()
+        self.stats.elapsed_secs = time.monotonic() - started
+        return self.stats
+
+
+def upsert_books(collection, books: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Validates and upserts a list of books in one bulk write (e.g. sample data)."""
+    validate = compile_schema(CATALOG_SCHEMA)
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    docs = {}
+    for book in books:
+        doc = validate(dict(book))
+        docs[doc["isbn"]] = doc
+    result = collection.bulk_write([_upsert(doc, now) for doc in docs.values()], ordered=False)
+    return {
+        "upserted": result.upserted_count,
+        "modified": result.modified_count,
+        "matched": result.matched_count,
+    }
+
+
+def prepare_collection(collection, all_indexes: bool) -> None:
+    """
+    Creates the unique isbn index the upserts rely on and, with all_indexes,
+    every other catalog index.
+
+    Secondary indexes slow a bulk load down, so they are built after it.
+    Unlike ensure_indexes(), a failure to build the isbn index (duplicate
+    ISBNs already stored) is raised: the upserts cannot run without it.
+    """
+    from customer_service.shared_libraries.catalog import ISBN_INDEX, ensure_indexes
+
+    collection.create_indexes([ISBN_INDEX])
+    if all_indexes:
+        ensure_indexes(collection)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Ingests a CSV or JSONL feed into the configured books collection."""
+    settings = get_config().ingest_settings
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "jsonl"))
+    parser.add_argument("--batch-size", type=int, default=settings.batch_size)
+    parser.add_argument("--writers", type=int, default=settings.writers)
+    parser.add_argument("--checkpoint", help="default: <path>.checkpoint.json")
+    parser.add_argument("--rejects", help="JSONL file for rejected rows")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint")
+    parser.add_argument(
+        "--skip-indexes",
+        action="store_true",
+        help="do not build the other catalog indexes after the load",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    from customer_service.shared_libraries.mongo import get_collection
+
+    catalog = get_config().catalog_settings
+    collection = get_collection(catalog.database, catalog.collection)
+    prepare_collection(collection, all_indexes=False)
+
+    def report(stats: IngestStats) -> None:
+        rate = stats.rows / stats.elapsed_secs if stats.elapsed_secs else 0.0
+        print(
+            f"{stats.rows:,} rows, {stats.rejected:,} rejected, {rate:,.0f} rows/s",
+            file=sys.stderr,
+        )
+
+    ingestor = Ingestor(
+        collection,
+        settings.model_copy(update={"batch_size": args.batch_size, "writers": args.writers}),
+    )
+    try:
+        stats = ingestor.run(
+            args.path,
+            fmt=args.format,
+            checkpoint_path=args.checkpoint,
+            rejects_path=args.rejects,
+            restart=args.restart,
+            progress=report,
+        )
+    except ValueError as e:
+        print(f"FAILED: {e}", file=sys.stderr)
+        return 1
+    if not args.skip_indexes:
+        prepare_collection(collection, all_indexes=True)
+    print(json.dumps(stats.as_dict(), indent=2))
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,320 @@
+"""Non-blocking logging for the agent process.
+
+:func:`configure_logging` moves the root logger's handlers behind a
+``QueueHandler``: a log call on the request path only checks the level,
+applies sampling, shortens the arguments and puts the record on a bounded
+queue. A ``QueueListener`` thread formats the records and writes them with
+the original handlers, so a slow terminal, file or log shipper never
+stalls the event loop. When the queue is full, records are dropped and
+counted instead of blocking.
+
+Records are prepared in three steps on the caller's side:
+
+* sampling: loggers listed in ``logging_settings.sample_rates`` keep only
+  that fraction of their records below WARNING, e.g. the per-model-call
+  debug lines of the callbacks;
+* truncation: arguments are rendered by :func:`shorten` within a size
+  budget, so a large cart, CRM payload or catalog page costs a bounded
+  amount of formatting and log volume; %-style arguments are never
+  formatted for a record that is filtered out;
+* the message is merged with its arguments, since the arguments may be
+  mutated by the caller once the record is queued.
+
+With ``format="json"`` every record is written as one JSON object per
+line, with any ``extra`` fields of the call.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from itertools import islice
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, List, Optional
+
+from customer_service.config import LoggingModel, get_config
+
+logger = logging.getLogger(__name__)
+
+# Attributes every LogRecord has; anything else came from `extra`.
+_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+_TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+def shorten(value: Any, max_chars: int, max_items: int) -> Any:
+    """
+    Renders a log argument like %s would, within a budget.
+
+    Containers show at most max_items entries per level, and rendering
+    stops once max_chars characters are produced, so the cost depends on
+    the budget rather than on the size of the payload. Numbers and None are
+    returned as they are, for %i and %.2f placeholders.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        if len(value) <= max_chars:
+            return value
+        return f"{value[:max_chars]}...(+{len(value) - max_chars} chars)"
+
+    parts: List[str] = []
+    budget = max_chars
+
+    def emit(text: str) -> None:
+        nonlocal budget
+        parts.append(text)
+        budget -= len(text)
+
+    def walk(item: Any, nested: bool) -> None:
+        if isinstance(item, dict):
+            emit("{")
+            for i, (key, child) in enumerate(islice(item.items(), max_items)):
+                if budget <= 0:
+                    break
+                emit(f"{key!r}: " if i == 0 else f", {key!r}: ")
+                walk(child, True)
+            if len(item) > max_items:
+                emit(f", ...(+{len(item) - max_items})")
+            emit("}")
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            brackets = "[]" if isinstance(item, list) else "()" if isinstance(item, tuple) else "{}"
+            emit(brackets[0])
+            for i, child in enumerate(islice(item, max_items)):
+                if budget <= 0:
+                    break
+                if i:
+                    emit(", ")
+                walk(child, True)
+            if len(item) > max_items:
+                emit(f", ...(+{len(item) - max_items})")
+            emit(brackets[1])
+        else:
+            emit((repr(item) if nested else str(item))[: max(budget, 0) + 1])
+
+    walk(value, False)
+    text = "".join(parts)
+    return text if len(text) <= max_chars else f"{text[:max_chars]}..."
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records below WARNING of selected loggers."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        # The longest matching prefix wins, so a module can be sampled
+        # differently from its package.
+        self._rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self._credit: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _rate(self, name: str) -> Optional[float]:
+        for prefix, rate in self._rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate is None or rate >= 1:
+            return True
+        # Deterministic 1-in-(1/rate) per logger and message rather than
+        # random, so rare messages of a sampled logger still show up.
+        key = f"{record.name}:{record.msg}"
+        with self._lock:
+            credit = self._credit.get(key, 1.0) + rate
+            keep = credit >= 1.0
+            self._credit[key] = credit - 1.0 if keep else credit
+            if not keep:
+                self.dropped += 1
+        if keep:
+            record.sample_rate = rate
+        return keep
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int, max_items: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.max_items = max_items
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike QueueHandler.prepare(), no formatter runs here: the
+        # listener's handlers format the record on their own thread.
+        record = logging.makeLogRecord(record.__dict__)
+        if record.args:
+            args = record.args
+            if isinstance(args, dict):
+                args = {
+                    key: shorten(value, self.max_chars, self.max_items)
+                    for key, value in args.items()
+                }
+            else:
+                args = tuple(shorten(arg, self.max_chars, self.max_items) for arg in args)
+            record.msg = str(record.msg) % args
+            record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as a single-line JSON object."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class LoggingPipeline:
+    """The queue handler installed on the root logger and its listener."""
+
+    def __init__(self, settings: LoggingModel):
+        self.settings = settings
+        root = logging.getLogger()
+        self.handlers = list(root.handlers)
+        if not self.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(_TEXT_FORMAT))
+            self.handlers.append(handler)
+        self._formatters = [handler.formatter for handler in self.handlers]
+        if settings.format == "json":
+            for handler in self.handlers:
+                handler.setFormatter(JsonFormatter())
+        self.sampler = SamplingFilter(settings.sample_rates)
+        self.handler = NonBlockingQueueHandler(
+            queue.Queue(settings.queue_size),
+            settings.max_payload_chars,
+            settings.max_payload_items,
+        )
+        self.handler.addFilter(self.sampler)
+        self.listener = QueueListener(
+            self.handler.queue, *self.handlers, respect_handler_level=True
+        )
+        self._running = False
+
+    def start(self) -> None:
+        root = logging.getLogger()
+        for handler in self.handlers:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        for name, level in self.settings.levels.items():
+            logging.getLogger(name).setLevel(level)
+        self.listener.start()
+        self._running = True
+
+    def stop(self) -> None:
+        """Writes the queued records and puts the handlers back on the root logger."""
+        logging.getLogger().removeHandler(self.handler)
+        if self._running:
+            self.listener.stop()
+            self._running = False
+        self._detach()
+        if self.handler.dropped:
+            logger.warning("%i log records dropped on a full queue", self.handler.dropped)
+
+    def _detach(self) -> None:
+        root = logging.getLogger()
+        root.removeHandler(self.handler)
+        for handler, formatter in zip(self.handlers, self._formatters):
+            handler.setFormatter(formatter)
+            root.addHandler(handler)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.dropped,
+        }
+
+
+_lock = threading.Lock()
+_pipeline: Optional[LoggingPipeline] = None
+
+
+def configure_logging(settings: Optional[LoggingModel] = None) -> Optional[LoggingPipeline]:
+    """
+    Installs the logging pipeline once per process.
+
+    Call it after the host (the ADK CLI, a script's basicConfig) has set up
+    its handlers: they are kept, and run on the listener thread.
+
+    Args:
+        settings: The logging settings; defaults to the config.
+
+    Returns:
+        The pipeline, or None when it is disabled in the configuration.
+    """
+    global _pipeline
+
+    settings = settings or get_config().logging_settings
+    if not settings.enabled:
+        return None
+    with _lock:
+        if _pipeline is None:
+            _pipeline = LoggingPipeline(settings)
+            _pipeline.start()
+            atexit.register(shutdown_logging)
+        return _pipeline
+
+
+def shutdown_logging() -> None:
+    """Flushes and removes the pipeline; logging writes directly again."""
+    global _pipeline
+
+    with _lock:
+        if _pipeline is not None:
+            _pipeline.stop()
+            _pipeline = None
+
+
+def logging_stats() -> Dict[str, int]:
+    """Returns the queue depth and the dropped and sampled-out record counts."""
+    return _pipeline.stats() if _pipeline is not None else {}
+
+
+def _restart_after_fork() -> None:
+    global _lock, _pipeline
+
+    # The listener thread does not survive a fork; the child gets its own.
+    _lock = threading.Lock()
+    if _pipeline is not None:
+        _pipeline._detach()
+        _pipeline = LoggingPipeline(_pipeline.settings)
+        _pipeline.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
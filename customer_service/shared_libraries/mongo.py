@@ -0,0 +1,206 @@
+"""Process-wide MongoDB connection manager.
+
+Every Mongo-backed tool goes through :func:`get_client` (or the
+:func:`get_collection` helper) instead of building its own ``MongoClient``.
+The client is created lazily on first use, sized from ``Config.mongo_settings``
+and reused for the lifetime of the process, so tool calls run on warm pooled
+sockets instead of paying for a TCP handshake, server discovery and a monitor
+thread every time.
+
+Async tools use :func:`get_async_client`, which hands out one PyMongo
+``AsyncMongoClient`` per event loop with the same settings.
+
+pymongo itself is imported with the first client, so importing the agent
+does not pay for it.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from customer_service.config import get_config
+
+if TYPE_CHECKING:
+    from pymongo import AsyncMongoClient, MongoClient
+    from pymongo.asynchronous.collection import AsyncCollection
+    from pymongo.collection import Collection
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_client: Optional["MongoClient"] = None
+_client_pid: Optional[int] = None
+# An async client must only be used from the loop it was created on.
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncMongoClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _client_options() -> Dict[str, Any]:
+    """Builds the MongoClient keyword arguments from the configuration."""
+    configs = get_config()
+    settings = configs.mongo_settings
+    return {
+        "host": configs.MONGODB_URI or settings.uri,
+        "maxPoolSize": settings.max_pool_size,
+        "minPoolSize": settings.min_pool_size,
+        "maxIdleTimeMS": settings.max_idle_time_ms,
+        "connectTimeoutMS": settings.connect_timeout_ms,
+        "serverSelectionTimeoutMS": settings.server_selection_timeout_ms,
+        "socketTimeoutMS": settings.socket_timeout_ms,
+        "readPreference": settings.read_preference,
+        "appname": configs.app_name,
+    }
+
+
+def get_client() -> "MongoClient":
+    """
+    Returns the shared MongoClient, creating it on first use.
+
+    A MongoClient is not fork-safe, so when the current process id differs
+    from the one that created the client (e.g. a pre-forking server worker)
+    the inherited client is dropped and a new one is built for this process.
+
+    Returns:
+        The process-wide MongoClient.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    client = _client
+    if client is not None and _client_pid == pid:
+        return client
+
+    with _lock:
+        if _client is not None and _client_pid != pid:
+            # Do not close it: the sockets still belong to the parent process.
+            logger.debug("Discarding MongoClient inherited from pid %s", _client_pid)
+            _client = None
+        if _client is None:
+            from pymongo import MongoClient
+
+            options = _client_options()
+            _client = MongoClient(**options)
+            _client_pid = pid
+            logger.info(
+                "Created shared MongoClient (maxPoolSize=%s, readPreference=%s)",
+                options["maxPoolSize"],
+                options["readPreference"],
+            )
+        return _client
+
+
+def get_collection(database: str, collection: str) -> "Collection":
+    """
+    Returns a collection handle bound to the shared client.
+
+    Args:
+        database: The database name, e.g. "Library".
+        collection: The collection name, e.g. "Books".
+
+    Returns:
+        The pymongo Collection.
+    """
+    return get_client()[database][collection]
+
+
+def get_async_client() -> "AsyncMongoClient":
+    """
+    Returns the shared AsyncMongoClient of the running event loop.
+
+    Must be called from a coroutine. Connections are opened lazily, so
+    creating the client does not block the loop.
+
+    Returns:
+        The AsyncMongoClient for the current event loop.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        from pymongo import AsyncMongoClient
+
+        options = _client_options()
+        client = AsyncMongoClient(**options)
+        _async_clients[loop] = client
+        logger.info(
+            "Created shared AsyncMongoClient (maxPoolSize=%s, readPreference=%s)",
+            options["maxPoolSize"],
+            options["readPreference"],
+        )
+    return client
+
+
+def get_async_collection(database: str, collection: str) -> "AsyncCollection":
+    """
+    Returns a collection handle bound to the shared async client.
+
+    Args:
+        database: The database name, e.g. "Library".
+        collection: The collection name, e.g. "Books".
+
+    Returns:
+        The pymongo AsyncCollection.
+    """
+    return get_async_client()[database][collection]
+
+
+def ping() -> Dict[str, Any]:
+    """
+    Checks that the shared client can reach the server.
+
+    Returns:
+        A dictionary with the status and the round trip latency, or the error.
+    """
+    start = time.perf_counter()
+    try:
+        get_client().admin.command("ping")
+    except Exception as e:
+        logger.error("MongoDB ping failed: %s", e)
+        return {"status": "error", "error": str(e)}
+    return {
+        "status": "ok",
+        "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+async def ping_async() -> Dict[str, Any]:
+    """Asynchronous ping() using the async client of the running loop."""
+    start = time.perf_counter()
+    try:
+        await get_async_client().admin.command("ping")
+    except Exception as e:
+        logger.error("MongoDB ping failed: %s", e)
+        return {"status": "error", "error": str(e)}
+    return {
+        "status": "ok",
+        "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+
+def close_client() -> None:
+    """Closes the shared client; the next call to get_client() reconnects."""
+    global _client, _client_pid
+
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+def _reset_after_fork() -> None:
+    global _lock, _client, _client_pid
+
+    # The lock may have been held by another thread at fork time.
+    _lock = threading.Lock()
+    _client = None
+    _client_pid = None
+    _async_clients.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,520 @@
+"""Durable outbox for fire-and-forget side effects of the tools.
+
+CRM updates, reading recommendation messages and call companion links do not
+change what the agent tells the customer, so the tools only record them here
+and return a tracking id; a pool of background workers delivers them.
+
+Messages live in a SQLite file (``Config.outbox_settings.path``), so they
+survive restarts and every worker process on the host drains the same queue.
+As in the SQLite rate-limit backend, ``BEGIN IMMEDIATE`` takes the database's
+write lock before reading, which makes enqueueing and claiming atomic across
+processes.
+
+* Coalescing: a message enqueued with a ``coalesce_key`` is merged into a
+  pending message of the same kind and key instead of being queued again, so
+  several CRM updates for one customer become a single Salesforce write with
+  the ``details`` of every update (later values win).
+* Ordering: a message is not claimed while an older message with its key
+  is pending or being delivered, so updates for one customer are applied
+  in order even when an earlier one is waiting for a retry. Updates queued
+  behind a failed message are merged into its retry (their status becomes
+  "coalesced"), so a single write carries the latest values.
+* Retries: a failed delivery is retried with exponential backoff and jitter;
+  after ``max_attempts`` the message is kept with status "failed".
+* Crash recovery: a claimed message is leased for ``lease_secs``; if its
+  worker dies, it is claimed again once the lease has expired.
+"""
+
+import asyncio
+import atexit
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from customer_service.config import OutboxModel, get_config
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+# Merged into the retry of an older message with the same key.
+COALESCED = "coalesced"
+
+
+def _update_salesforce_crm(payload: Mapping[str, Any]) -> None:
+    # MOCK API CALL - Replace with the Salesforce REST API.
+    logger.info(
+        "Updating Salesforce CRM for customer ID %s with details: %s",
+        payload["customer_id"],
+        payload["details"],
+    )
+
+
+def _send_reading_recommendations(payload: Mapping[str, Any]) -> None:
+    # MOCK API CALL - Replace with the email/SMS provider.
+    logger.info(
+        "Sending reading recommendations for %s to customer: %s via %s",
+        payload["reading_interests"],
+        payload["customer_id"],
+        payload["delivery_method"],
+    )
+
+
+def _send_call_companion_link(payload: Mapping[str, Any]) -> None:
+    # MOCK API CALL - Replace with the SMS provider.
+    logger.info("Sending call companion link to %s", payload["phone_number"])
+
+
+# Delivery function of each message kind. A handler signals a failed
+# delivery by raising; it must be safe to call again for the same message.
+HANDLERS: Dict[str, Callable[[Mapping[str, Any]], None]] = {
+    "crm_update": _update_salesforce_crm,
+    "reading_recommendations": _send_reading_recommendations,
+    "call_companion_link": _send_call_companion_link,
+}
+
+
+def merge_payloads(old: Mapping[str, Any], new: Mapping[str, Any]) -> Dict[str, Any]:
+    """Merges a coalesced message into a pending one; nested dicts are merged."""
+    merged = dict(old)
+    for key, value in new.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def backoff_delay(
+    attempts: int, base_secs: float, max_secs: float, rng=random.random
+) -> float:
+    """Delay before retry number `attempts`: exponential with full jitter."""
+    ceiling = min(base_secs * 2 ** (attempts - 1), max_secs)
+    return ceiling / 2 + rng() * ceiling / 2
+
+
+class OutboxStore:
+    """The SQLite table holding outbox messages."""
+
+    def __init__(self, path: str, clock=time.time):
+        self._path = path
+        self._clock = clock
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        connection = self._connect()
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " tracking_id TEXT NOT NULL UNIQUE,"
+            " kind TEXT NOT NULL,"
+            " coalesce_key TEXT,"
+            " payload TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            # When a pending message may be claimed, or when the lease of an
+            # in-flight message expires.
+            " available_at REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " last_error TEXT)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_status_available"
+            " ON outbox (status, available_at)"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_coalesce"
+            " ON outbox (coalesce_key, status) WHERE coalesce_key IS NOT NULL"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Mapping[str, Any],
+        coalesce_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Records a message for delivery.
+
+        Args:
+            kind: The message kind, a key of HANDLERS.
+            payload: The JSON-serializable message.
+            coalesce_key: Messages of the same kind and key that are still
+                pending are merged into one.
+
+        Returns:
+            {"tracking_id", "coalesced"}; a coalesced message shares the
+            tracking id of the message it was merged into.
+        """
+        if kind not in HANDLERS:
+            raise ValueError(f"Unknown outbox message kind: {kind}")
+        now = self._clock()
+
+        def work(connection):
+            if coalesce_key is not None:
+                row = connection.execute(
+                    "SELECT id, tracking_id, payload FROM outbox"
+                    " WHERE coalesce_key = ? AND kind = ? AND status = ?"
+                    " ORDER BY id DESC LIMIT 1",
+                    (coalesce_key, kind, PENDING),
+                ).fetchone()
+                if row is not None:
+                    merged = merge_payloads(json.loads(row[2]), payload)
+                    connection.execute(
+                        "UPDATE outbox SET payload = ?, updated_at = ? WHERE id = ?",
+                        (json.dumps(merged, default=str), now, row[0]),
+                    )
+                    return {"tracking_id": row[1], "coalesced": True}
+            tracking_id = uuid.uuid4().hex
+            connection.execute(
+                "INSERT INTO outbox (tracking_id, kind, coalesce_key, payload,"
+                " status, available_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    tracking_id,
+                    kind,
+                    coalesce_key,
+                    json.dumps(payload, default=str),
+                    PENDING,
+                    now,
+                    now,
+                    now,
+                ),
+            )
+            return {"tracking_id": tracking_id, "coalesced": False}
+
+        return self._transaction(work)
+
+    def claim(self, limit: int, lease_secs: float) -> List[Dict[str, Any]]:
+        """
+        Leases up to `limit` due messages, oldest first.
+
+        Messages whose key has an older message that is pending (e.g. waiting
+        for a retry) or in flight are skipped, as are in-flight messages whose
+        lease has not expired.
+        """
+        now = self._clock()
+
+        def work(connection):
+            rows = connection.execute(
+                "SELECT id, tracking_id, kind, payload, attempts FROM outbox"
+                " WHERE status IN (?, ?) AND available_at <= ?"
+                " AND (coalesce_key IS NULL OR NOT EXISTS ("
+                "  SELECT 1 FROM outbox AS older"
+                "  WHERE older.coalesce_key = outbox.coalesce_key"
+                "  AND older.id < outbox.id AND older.status IN (?, ?)))"
+                " ORDER BY id LIMIT ?",
+                (PENDING, IN_FLIGHT, now, PENDING, IN_FLIGHT, limit),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE outbox SET status = ?, available_at = ?, updated_at = ?"
+                " WHERE id = ?",
+                [(IN_FLIGHT, now + lease_secs, now, row[0]) for row in rows],
+            )
+            return rows
+
+        return [
+            {
+                "id": row[0],
+                "tracking_id": row[1],
+                "kind": row[2],
+                "payload": json.loads(row[3]),
+                "attempts": row[4],
+            }
+            for row in self._transaction(work)
+        ]
+
+    def complete(self, message_id: int) -> None:
+        """Marks a claimed message as delivered."""
+        self._connect().execute(
+            "UPDATE outbox SET status = ?, updated_at = ?, last_error = NULL"
+            " WHERE id = ?",
+            (DONE, self._clock(), message_id),
+        )
+
+    def fail(self, message_id: int, error: str, retry_in: Optional[float]) -> None:
+        """
+        Records a failed delivery; retry_in None gives the message up.
+
+        Messages of the same kind and key queued while this one was in
+        flight are merged into the retry, so it is sent once with their
+        values instead of being followed by them.
+        """
+        now = self._clock()
+        if retry_in is None:
+            status, available_at = FAILED, now
+        else:
+            status, available_at = PENDING, now + retry_in
+
+        def work(connection):
+            if status == PENDING:
+                kind, coalesce_key, payload = connection.execute(
+                    "SELECT kind, coalesce_key, payload FROM outbox WHERE id = ?",
+                    (message_id,),
+                ).fetchone()
+                newer = connection.execute(
+                    "SELECT id, payload FROM outbox WHERE coalesce_key = ?"
+                    " AND kind = ? AND status = ? AND id > ? ORDER BY id",
+                    (coalesce_key, kind, PENDING, message_id),
+                ).fetchall() if coalesce_key is not None else []
+                if newer:
+                    merged = json.loads(payload)
+                    for _, later in newer:
+                        merged = merge_payloads(merged, json.loads(later))
+                    connection.execute(
+                        "UPDATE outbox SET payload = ? WHERE id = ?",
+                        (json.dumps(merged, default=str), message_id),
+                    )
+                    connection.executemany(
+                        "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?",
+                        [(COALESCED, now, row[0]) for row in newer],
+                    )
+            connection.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1,"
+                " available_at = ?, updated_at = ?, last_error = ? WHERE id = ?",
+                (status, available_at, now, error[:1000], message_id),
+            )
+
+        self._transaction(work)
+
+    def status(self, tracking_id: str) -> Optional[Dict[str, Any]]:
+        """Returns the delivery status of a message, or None if unknown."""
+        row = self._connect().execute(
+            "SELECT kind, status, attempts, created_at, updated_at, last_error"
+            " FROM outbox WHERE tracking_id = ?",
+            (tracking_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("kind", "status", "attempts", "created_at", "updated_at", "last_error")
+        return {"tracking_id": tracking_id, **dict(zip(keys, row))}
+
+    def purge(self, older_than_secs: float) -> int:
+        """Deletes delivered messages last updated before the given age."""
+        cursor = self._connect().execute(
+            "DELETE FROM outbox WHERE status IN (?, ?) AND updated_at < ?",
+            (DONE, COALESCED, self._clock() - older_than_secs),
+        )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        """Returns the number of messages per status."""
+        rows = self._connect().execute(
+            "SELECT status, COUNT(*) FROM outbox GROUP BY status"
+        ).fetchall()
+        return dict(rows)
+
+
+class Outbox:
+    """An OutboxStore drained by a pool of background worker threads."""
+
+    def __init__(self, store: OutboxStore, settings: OutboxModel):
+        self.store = store
+        self.settings = settings
+        self.counters = dict.fromkeys(
+            ("enqueued", "coalesced", "delivered", "retried", "failed"), 0
+        )
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._last_purge = 0.0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            self.counters[counter] += 1
+
+    def start(self) -> None:
+        """Starts the worker threads; does nothing if they are running."""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.settings.workers):
+                thread = threading.Thread(
+                    target=self._run, name=f"outbox-worker-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stops the workers; undelivered messages stay queued in the file."""
+        self._stopping.set()
+        self._wakeup.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def enqueue(
+        self,
+        kind: str,
+        payload: Mapping[str, Any],
+        coalesce_key: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Queues a message (see OutboxStore.enqueue) and wakes a worker."""
+        result = self.store.enqueue(kind, payload, coalesce_key)
+        self._count("coalesced" if result["coalesced"] else "enqueued")
+        self._wakeup.set()
+        return result
+
+    def deliver(self, message: Mapping[str, Any]) -> None:
+        """Delivers one claimed message and records the outcome."""
+        try:
+            HANDLERS[message["kind"]](message["payload"])
+        except Exception as e:
+            attempts = message["attempts"] + 1
+            if attempts >= self.settings.max_attempts:
+                logger.error(
+                    "Giving up on outbox message %s (%s) after %d attempts: %s",
+                    message["tracking_id"],
+                    message["kind"],
+                    attempts,
+                    e,
+                )
+                self.store.fail(message["id"], repr(e), None)
+                self._count("failed")
+                return
+            delay = backoff_delay(
+                attempts, self.settings.backoff_base_secs, self.settings.backoff_max_secs
+            )
+            logger.warning(
+                "Outbox message %s (%s) failed, retrying in %.1fs: %s",
+                message["tracking_id"],
+                message["kind"],
+                delay,
+                e,
+            )
+            self.store.fail(message["id"], repr(e), delay)
+            self._count("retried")
+            return
+        self.store.complete(message["id"])
+        self._count("delivered")
+
+    def drain_once(self) -> int:
+        """Claims and delivers one batch; returns the number of messages."""
+        batch = self.store.claim(self.settings.batch_size, self.settings.lease_secs)
+        for message in batch:
+            self.deliver(message)
+        return len(batch)
+
+    def _maybe_purge(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge < self.settings.purge_interval_secs:
+                return
+            self._last_purge = now
+        removed = self.store.purge(self.settings.retention_secs)
+        if removed:
+            logger.debug("Purged %d delivered outbox messages", removed)
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                delivered = self.drain_once()
+                self._maybe_purge()
+            except Exception as e:
+                # e.g. the database is locked for longer than the busy timeout.
+                logger.error("Outbox worker error: %s", e)
+                delivered = 0
+            if not delivered:
+                # Messages enqueued by other processes, and retries that come
+                # due, are picked up by polling.
+                self._wakeup.wait(self.settings.poll_interval_secs)
+                self._wakeup.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns this process's counters and the queue size per status."""
+        return {**self.counters, "queue": self.store.counts()}
+
+
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Optional[Outbox]:
+    """Returns the process-wide outbox, with its workers started, or None."""
+    global _outbox
+
+    settings = get_config().outbox_settings
+    if not settings.enabled:
+        return None
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                outbox = Outbox(OutboxStore(settings.path), settings)
+                outbox.start()
+                atexit.register(outbox.stop)
+                _outbox = outbox
+    return _outbox
+
+
+def send(
+    kind: str, payload: Mapping[str, Any], coalesce_key: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Queues a side effect, or performs it at once when the outbox is disabled.
+
+    Returns:
+        {"status": "queued", "tracking_id", "coalesced"} or
+        {"status": "success"}.
+    """
+    outbox = get_outbox()
+    if outbox is None:
+        HANDLERS[kind](payload)
+        return {"status": "success"}
+    return {"status": "queued", **outbox.enqueue(kind, payload, coalesce_key)}
+
+
+async def send_async(
+    kind: str, payload: Mapping[str, Any], coalesce_key: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    send() on a worker thread, for the async tools.
+
+    Enqueueing waits for SQLite's write lock (up to the busy timeout) while
+    a worker or another process holds it, and the first call opens the
+    database and starts the workers; none of that runs on the event loop.
+    """
+    return await asyncio.to_thread(send, kind, payload, coalesce_key)
+
+
+def outbox_status(tracking_id: str) -> Optional[Dict[str, Any]]:
+    """Returns the delivery status of a queued message, or None if unknown."""
+    outbox = get_outbox()
+    return outbox.store.status(tracking_id) if outbox else None
+
+
+def outbox_stats() -> Dict[str, Any]:
+    """Returns the outbox counters, or {} when it is disabled."""
+    outbox = get_outbox()
+    return outbox.stats() if outbox else {}
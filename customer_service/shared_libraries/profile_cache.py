@@ -0,0 +1,68 @@
+"""Parsed customer profiles, memoized on the profile JSON held in session state.
+
+Tools that take a ``customer_id`` are validated against the profile stored in
+``state["customer_profile"]``. Parsing that JSON into a ``Customer`` on every
+tool call is wasted work, so the parsed object is cached keyed on the JSON
+string itself: Python caches a string's hash, equal strings are compared with
+a memcmp, and any change to the profile produces a new key, which is what
+invalidates the entry.
+"""
+
+from typing import Any, Dict, Mapping
+
+from customer_service.entities.customer import Customer
+from customer_service.shared_libraries.cache import TTLCache
+
+_profiles = TTLCache(maxsize=1024, ttl=None)
+_parses = 0
+
+
+def get_customer_profile(session_state: Mapping[str, Any]) -> Customer:
+    """
+    Returns the Customer for the profile stored in the session state.
+
+    Args:
+        session_state: The session state holding "customer_profile".
+
+    Returns:
+        The parsed Customer, shared between calls; do not mutate it.
+
+    Raises:
+        KeyError: If no profile is loaded.
+        pydantic.ValidationError: If the profile cannot be parsed.
+    """
+    global _parses
+
+    blob = session_state["customer_profile"]
+    customer = _profiles.get(blob)
+    if customer is None:
+        customer = Customer.model_validate_json(blob)
+        _parses += 1
+        _profiles.set(blob, customer)
+    return customer
+
+
+def profile_footprint(customer: Customer, recent_purchases: int = 3) -> Dict[str, int]:
+    """
+    Measures what a profile costs in session state and in the prompt.
+
+    Args:
+        customer: The customer to measure.
+        recent_purchases: Purchases kept in the prompt view.
+
+    Returns:
+        Byte sizes of the indented and minified state JSON and of the prompt
+        view, plus a rough token estimate (~4 bytes per token) of the latter.
+    """
+    prompt = customer.to_prompt_json(recent_purchases).encode()
+    return {
+        "state_bytes_indented": len(customer.to_json().encode()),
+        "state_bytes_compact": len(customer.to_json(indent=None).encode()),
+        "prompt_bytes": len(prompt),
+        "prompt_tokens_estimate": len(prompt) // 4 + 1,
+    }
+
+
+def profile_cache_stats() -> Dict[str, Any]:
+    """Returns how many profiles were parsed and the cache counters."""
+    return {"parses": _parses, **_profiles.stats()}
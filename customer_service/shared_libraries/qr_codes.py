@@ -0,0 +1,345 @@
+"""Signed discount QR codes for generate_qr_code.
+
+A QR code encodes a compact, HMAC-signed discount token::
+
+    LD1.<base64url(json payload)>.<base64url(truncated HMAC-SHA256)>
+
+so a store can check with ``verify_token`` that a scanned code was issued
+here and has not been altered. Encoding and PNG rendering are CPU bound, so
+they run in a small process pool instead of on the event loop; at most
+``max_pending`` renders are queued, and concurrent requests for the same
+code share one render.
+
+Rendered codes are cached by (customer, value, type, expiration date): in
+this process in a TTLCache, and on disk as content-addressed PNG files named
+after the expiration date and the SHA-256 of the token, which every process
+on the host can reuse. Files of codes that expired before yesterday are
+deleted once a day. The tool returns either a ``data:image/png;base64`` URI
+or the file path (``Config.qr_code_settings.output``).
+
+The pool starts its workers with forkserver (spawn where that is missing),
+never by forking the agent process with its threads and open clients. A
+pool broken by a dying worker is replaced on the next render.
+"""
+
+import asyncio
+import atexit
+import base64
+import hashlib
+import hmac
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import secrets
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from customer_service.config import QRCodeModel, get_config
+from customer_service.shared_libraries.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PREFIX = "LD1"
+_SIGNATURE_BYTES = 16
+_DISCOUNT_TYPES = {"percentage": "p", "fixed": "f"}
+_CODE_FILE = re.compile(r"^(\d{4}-\d{2}-\d{2})-[0-9a-f]{32}\.png$")
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def sign_token(
+    key: bytes,
+    customer_id: str,
+    discount_value: float,
+    discount_type: str,
+    expiration_date: date,
+) -> str:
+    """Returns the signed discount token encoded in a QR code."""
+    payload = json.dumps(
+        {
+            "c": customer_id,
+            "v": discount_value,
+            "t": _DISCOUNT_TYPES[discount_type],
+            "e": expiration_date.isoformat(),
+        },
+        separators=(",", ":"),
+    ).encode()
+    body = f"{TOKEN_PREFIX}.{_b64(payload)}"
+    signature = hmac.new(key, body.encode(), hashlib.sha256).digest()
+    return f"{body}.{_b64(signature[:_SIGNATURE_BYTES])}"
+
+
+def verify_token(key: bytes, token: str) -> Optional[Dict[str, Any]]:
+    """
+    Checks a scanned token.
+
+    Returns:
+        The discount (customer_id, discount_value, discount_type,
+        expiration_date), or None if the token is malformed or its signature
+        does not match. Expiry is left to the caller.
+    """
+    try:
+        prefix, payload, signature = token.split(".")
+        if prefix != TOKEN_PREFIX:
+            return None
+        expected = hmac.new(
+            key, f"{prefix}.{payload}".encode(), hashlib.sha256
+        ).digest()[:_SIGNATURE_BYTES]
+        if not hmac.compare_digest(expected, _unb64(signature)):
+            return None
+        data = json.loads(_unb64(payload))
+    except (ValueError, TypeError):
+        return None
+    types = {v: k for k, v in _DISCOUNT_TYPES.items()}
+    return {
+        "customer_id": data["c"],
+        "discount_value": data["v"],
+        "discount_type": types.get(data["t"], data["t"]),
+        "expiration_date": data["e"],
+    }
+
+
+def render_png(
+    data: str, box_size: int = 4, border: int = 2, mask_pattern: Optional[int] = None
+) -> bytes:
+    """
+    Encodes data as a QR code and renders it as a 1-bit PNG.
+
+    The module matrix is scaled with numpy and saved in one go, instead of
+    drawing every module as a rectangle with PIL. Runs in the render pool,
+    so it must stay a picklable module-level function.
+
+    Args:
+        data: The text to encode.
+        box_size: Pixels per module.
+        border: Quiet zone width, in modules.
+        mask_pattern: A fixed mask (0-7); None evaluates all eight and keeps
+            the most readable, which is most of the encoding time.
+    """
+    import numpy as np
+    import qrcode
+    from PIL import Image
+
+    code = qrcode.QRCode(
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        border=border,
+        mask_pattern=mask_pattern,
+    )
+    code.add_data(data)
+    code.make(fit=True)
+    # True is a dark module; in a mode "1" image True is white.
+    pixels = ~np.array(code.get_matrix(), dtype=bool)
+    pixels = pixels.repeat(box_size, axis=0).repeat(box_size, axis=1)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+class QRCodeRenderer:
+    """Renders signed discount QR codes off the event loop, with caching."""
+
+    def __init__(self, settings: QRCodeModel, key: bytes):
+        self.settings = settings
+        self._key = key
+        self._cache = TTLCache(maxsize=settings.cache_size, ttl=settings.cache_ttl_secs)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        # Created lazily: it must belong to the running event loop.
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pruned_on: Optional[date] = None
+        self.renders = 0
+        self.pruned = 0
+        os.makedirs(settings.output_dir, exist_ok=True)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                methods = multiprocessing.get_all_start_methods()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.settings.workers,
+                    mp_context=multiprocessing.get_context(
+                        "forkserver" if "forkserver" in methods else "spawn"
+                    ),
+                )
+            return self._pool
+
+    def _discard(self, pool: ProcessPoolExecutor) -> None:
+        with self._pool_lock:
+            if self._pool is not pool:
+                return
+            self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        """Stops the render pool."""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _path(self, token: str, expiration_date: date) -> str:
+        digest = hashlib.sha256(token.encode()).hexdigest()[:32]
+        return os.path.join(
+            self.settings.output_dir, f"{expiration_date.isoformat()}-{digest}.png"
+        )
+
+    def prune(self, today: Optional[date] = None) -> int:
+        """
+        Deletes the files of codes that expired before yesterday.
+
+        The day of grace keeps files the in-process cache may still hand out.
+
+        Returns:
+            The number of files deleted.
+        """
+        cutoff = ((today or date.today()) - timedelta(days=1)).isoformat()
+        deleted = 0
+        with os.scandir(self.settings.output_dir) as entries:
+            for entry in entries:
+                match = _CODE_FILE.match(entry.name)
+                if match and match[1] < cutoff:
+                    try:
+                        os.remove(entry.path)
+                        deleted += 1
+                    except FileNotFoundError:
+                        # Another process pruned it first.
+                        pass
+        self.pruned += deleted
+        if deleted:
+            logger.info("Deleted %i expired QR codes", deleted)
+        return deleted
+
+    def _prune_daily(self) -> None:
+        today = date.today()
+        if self._pruned_on == today:
+            return
+        self._pruned_on = today
+
+        def prune() -> None:
+            try:
+                self.prune(today)
+            except OSError as e:
+                logger.warning("Could not prune expired QR codes: %s", e)
+
+        asyncio.get_running_loop().run_in_executor(None, prune)
+
+    def _result(self, token: str, path: str, png: Optional[bytes]) -> str:
+        if self.settings.output == "file":
+            return path
+        if png is None:
+            with open(path, "rb") as f:
+                png = f.read()
+        return "data:image/png;base64," + base64.b64encode(png).decode("ascii")
+
+    async def _render(self, token: str, path: str) -> str:
+        if os.path.exists(path):
+            return self._result(token, path, None)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.settings.max_pending)
+        async with self._slots:
+            for attempt in range(2):
+                pool = self._executor()
+                try:
+                    png = await asyncio.get_running_loop().run_in_executor(
+                        pool,
+                        render_png,
+                        token,
+                        self.settings.box_size,
+                        self.settings.border,
+                        self.settings.mask_pattern,
+                    )
+                    break
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed for memory); the pool
+                    # refuses all further work, so start a new one.
+                    logger.warning("QR code render pool broke; restarting it")
+                    self._discard(pool)
+                    if attempt:
+                        raise
+        self.renders += 1
+        # Written under a temporary name and renamed, so another process
+        # never reads a partial file.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(png)
+        os.replace(tmp_path, path)
+        return self._result(token, path, png)
+
+    async def generate(
+        self,
+        customer_id: str,
+        discount_value: float,
+        discount_type: str,
+        expiration_date: date,
+    ) -> Tuple[str, str]:
+        """
+        Returns the token and the rendered QR code of a discount.
+
+        The code is a data URI or a file path, depending on settings.output.
+        """
+        cache_key = (customer_id, discount_value, discount_type, expiration_date)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        self._prune_daily()
+        token = sign_token(
+            self._key, customer_id, discount_value, discount_type, expiration_date
+        )
+        future = self._in_flight.get(token)
+        if future is None:
+            future = asyncio.ensure_future(
+                self._render(token, self._path(token, expiration_date))
+            )
+            self._in_flight[token] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(token, None))
+        code = await asyncio.shield(future)
+        self._cache.set(cache_key, (token, code))
+        return token, code
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the number of renders and pruned files and the cache counters."""
+        return {"renders": self.renders, "pruned": self.pruned, **self._cache.stats()}
+
+
+def signing_key(settings: Optional[QRCodeModel] = None) -> bytes:
+    """Returns the configured HMAC key, or a random one for this process."""
+    global _ephemeral_key
+
+    settings = settings or get_config().qr_code_settings
+    if settings.signing_key:
+        return settings.signing_key.encode()
+    if _ephemeral_key is None:
+        logger.warning(
+            "qr_code_settings.signing_key is not set; QR codes issued by this "
+            "process cannot be verified by any other process"
+        )
+        _ephemeral_key = secrets.token_bytes(32)
+    return _ephemeral_key
+
+
+_ephemeral_key: Optional[bytes] = None
+_renderer: Optional[QRCodeRenderer] = None
+
+
+def get_qr_renderer() -> QRCodeRenderer:
+    """Returns the process-wide QR code renderer."""
+    global _renderer
+
+    if _renderer is None:
+        settings = get_config().qr_code_settings
+        _renderer = QRCodeRenderer(settings, signing_key(settings))
+        atexit.register(_renderer.shutdown)
+    return _renderer
@@ -0,0 +1,400 @@
+"""Non-blocking quota enforcement for model requests.
+
+A request must find capacity in every quota that applies to it: requests per
+minute for the whole fleet, each user and each session, and optionally an
+estimated token-per-minute budget. When it does not, the caller either awaits
+the reported retry-after time on the event loop, so other sessions keep
+running, or is rejected at once.
+
+Where usage is counted is pluggable (``Config.rate_limit_settings.backend``):
+
+* ``memory``: token buckets in this process.
+* ``sqlite``: a sliding-window log in a SQLite file, shared by every worker
+  process on the host; the database write lock makes each check atomic.
+* ``redis``: a sliding-window log in Redis sorted sets, updated by a Lua
+  script so the whole check-and-consume is atomic across the fleet. Any
+  server speaking the Redis protocol works, including local stand-ins.
+  redis-py comes with the ``redis`` extra
+  (``pip install customer-service-agent-system[redis]``).
+"""
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from customer_service.config import RateLimitModel, get_config
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request cannot be admitted within the allowed wait."""
+
+    def __init__(self, retry_after: float, scope: str):
+        super().__init__(
+            f"Rate limit exceeded for {scope}; retry after {retry_after:.1f}s"
+        )
+        self.retry_after = retry_after
+        self.scope = scope
+
+
+@dataclass(frozen=True)
+class QuotaRule:
+    """At most ``limit`` units per ``window_secs`` for the given key.
+
+    ``cost`` is what the current request consumes from this quota, e.g. 1
+    for a requests-per-minute rule or the estimated token count for a
+    tokens-per-minute rule.
+    """
+
+    key: str
+    limit: float
+    window_secs: float = 60.0
+    cost: float = 1.0
+
+
+class InMemoryQuotaBackend:
+    """
+    Token buckets held in this process.
+
+    Each bucket holds up to ``limit`` tokens and refills continuously at
+    ``limit / window_secs`` tokens per second. A full bucket behaves exactly
+    like a missing one, so buckets that have refilled (of sessions and users
+    no longer active) are dropped every ``sweep_secs``.
+    """
+
+    # try_acquire never waits on I/O, so it can run on the event loop.
+    blocking = False
+
+    def __init__(self, clock=time.monotonic, sweep_secs: float = 60.0):
+        self._clock = clock
+        # key -> (tokens, last update, time at which the bucket is full again)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+        self._sweep_secs = sweep_secs
+        self._next_sweep = clock() + sweep_secs
+
+    def try_acquire(self, rules: Sequence[QuotaRule]) -> float:
+        """
+        Consumes every rule's cost from its bucket, or nothing at all.
+
+        Args:
+            rules: The quotas that apply to the request.
+
+        Returns:
+            0.0 if the request was admitted, otherwise the number of seconds
+            after which it could be admitted.
+        """
+        now = self._clock()
+        with self._lock:
+            levels: List[float] = []
+            retry_after = 0.0
+            for rule in rules:
+                tokens, updated, _ = self._buckets.get(rule.key, (rule.limit, now, now))
+                rate = rule.limit / rule.window_secs
+                tokens = min(rule.limit, tokens + (now - updated) * rate)
+                levels.append(tokens)
+                if tokens < rule.cost:
+                    retry_after = max(retry_after, (rule.cost - tokens) / rate)
+            if retry_after > 0:
+                return retry_after
+            for rule, tokens in zip(rules, levels):
+                tokens -= rule.cost
+                full_at = now + (rule.limit - tokens) * rule.window_secs / rule.limit
+                self._buckets[rule.key] = (tokens, now, full_at)
+            if now >= self._next_sweep:
+                self._sweep(now)
+            return 0.0
+
+    def _sweep(self, now: float) -> None:
+        full = [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]
+        for key in full:
+            del self._buckets[key]
+        self._next_sweep = now + self._sweep_secs
+        if full:
+            logger.debug("Dropped %i refilled rate limit buckets", len(full))
+
+
+def _window_retry_after(
+    events: Sequence[Tuple[float, float]], rule: QuotaRule, now: float
+) -> float:
+    """
+    Returns how long until a sliding window has room for rule.cost.
+
+    Args:
+        events: (timestamp, cost) pairs inside the window, oldest first.
+        rule: The quota being checked.
+        now: The current time on the same clock as the timestamps.
+    """
+    excess = sum(cost for _, cost in events) + rule.cost - rule.limit
+    if excess <= 0:
+        return 0.0
+    for timestamp, cost in events:
+        excess -= cost
+        if excess <= 0:
+            return max(timestamp + rule.window_secs - now, 0.001)
+    # The request alone is larger than the quota.
+    return rule.window_secs
+
+
+class SQLiteQuotaBackend:
+    """
+    Sliding-window log in a SQLite file shared by processes on one host.
+
+    ``BEGIN IMMEDIATE`` takes the database's write lock before reading, so
+    the check and the insert of a request happen atomically with respect to
+    every other process using the same file.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, clock=time.time):
+        self._path = path
+        self._clock = clock
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS quota_events ("
+                " key TEXT NOT NULL, ts REAL NOT NULL, cost REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS quota_events_key_ts"
+                " ON quota_events (key, ts)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads.
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def try_acquire(self, rules: Sequence[QuotaRule]) -> float:
+        """Same contract as InMemoryQuotaBackend.try_acquire()."""
+        connection = self._connect()
+        now = self._clock()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            retry_after = 0.0
+            for rule in rules:
+                connection.execute(
+                    "DELETE FROM quota_events WHERE key = ? AND ts <= ?",
+                    (rule.key, now - rule.window_secs),
+                )
+                events = connection.execute(
+                    "SELECT ts, cost FROM quota_events WHERE key = ? ORDER BY ts",
+                    (rule.key,),
+                ).fetchall()
+                retry_after = max(retry_after, _window_retry_after(events, rule, now))
+            if retry_after == 0:
+                connection.executemany(
+                    "INSERT INTO quota_events (key, ts, cost) VALUES (?, ?, ?)",
+                    [(rule.key, now, rule.cost) for rule in rules],
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return retry_after
+
+
+# KEYS: one sorted set per rule. ARGV: a unique member prefix, then a
+# (limit, window, cost) triple per key. Members are "<uuid>:<i>:<cost>" scored
+# by their timestamp; the server clock keeps every replica consistent.
+_REDIS_SLIDING_WINDOW = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local retry = 0
+for i, key in ipairs(KEYS) do
+  local limit = tonumber(ARGV[i * 3 - 1])
+  local window = tonumber(ARGV[i * 3])
+  local cost = tonumber(ARGV[i * 3 + 1])
+  redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+  local entries = redis.call('ZRANGE', key, 0, -1, 'WITHSCORES')
+  local used = 0
+  for j = 1, #entries, 2 do
+    used = used + tonumber(string.match(entries[j], ':([^:]+)$'))
+  end
+  local excess = used + cost - limit
+  if excess > 0 then
+    local wait = window
+    for j = 1, #entries, 2 do
+      excess = excess - tonumber(string.match(entries[j], ':([^:]+)$'))
+      if excess <= 0 then
+        wait = math.max(tonumber(entries[j + 1]) + window - now, 0.001)
+        break
+      end
+    end
+    retry = math.max(retry, wait)
+  end
+end
+if retry > 0 then
+  return tostring(retry)
+end
+for i, key in ipairs(KEYS) do
+  local window = tonumber(ARGV[i * 3])
+  local cost = ARGV[i * 3 + 1]
+  redis.call('ZADD', key, now, ARGV[1] .. ':' .. i .. ':' .. cost)
+  redis.call('PEXPIRE', key, math.ceil(window * 1000))
+end
+return '0'
+"""
+
+
+class RedisQuotaBackend:
+    """Sliding-window log in Redis, shared by every replica of the fleet."""
+
+    blocking = True
+
+    def __init__(self, url: str = "", client=None, prefix: str = "rate_limit:"):
+        """
+        Args:
+            url: Redis URL used when no client is given.
+            client: An existing redis-py compatible client, e.g. one pointing
+                at a local stand-in server.
+            prefix: Namespace for the quota keys.
+        """
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise ImportError(
+                    'The redis rate limit backend needs the "redis" extra: '
+                    "pip install customer-service-agent-system[redis]"
+                ) from e
+
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self._prefix = prefix
+        self._script = client.register_script(_REDIS_SLIDING_WINDOW)
+
+    def try_acquire(self, rules: Sequence[QuotaRule]) -> float:
+        """Same contract as InMemoryQuotaBackend.try_acquire()."""
+        args: List[Any] = [uuid.uuid4().hex]
+        for rule in rules:
+            args.extend([rule.limit, rule.window_secs, rule.cost])
+        result = self._script(
+            keys=[self._prefix + rule.key for rule in rules], args=args
+        )
+        return float(result)
+
+
+def create_backend(settings: RateLimitModel):
+    """Builds the quota backend selected in the configuration."""
+    if settings.backend == "sqlite":
+        return SQLiteQuotaBackend(settings.sqlite_path)
+    if settings.backend == "redis":
+        return RedisQuotaBackend(
+            settings.redis_url, prefix=f"{get_config().app_name}:rate_limit:"
+        )
+    if settings.backend != "memory":
+        raise ValueError(f"Unknown rate limit backend: {settings.backend}")
+    return InMemoryQuotaBackend()
+
+
+class RateLimiter:
+    """Applies the configured request and token quotas."""
+
+    def __init__(self, settings: RateLimitModel, backend=None):
+        self.settings = settings
+        self.backend = backend or create_backend(settings)
+        self.granted = 0
+        self.throttled = 0
+        self.throttled_secs = 0.0
+        self.rejected = 0
+
+    def rules_for(
+        self, user_id: str, session_id: str, tokens: int = 0
+    ) -> List[QuotaRule]:
+        """Returns the quota rules that apply to a request."""
+        settings = self.settings
+        rules = []
+        if settings.global_rpm:
+            rules.append(QuotaRule("rpm:global", settings.global_rpm))
+        if settings.user_rpm:
+            rules.append(QuotaRule(f"rpm:user:{user_id}", settings.user_rpm))
+        if settings.session_rpm:
+            rules.append(QuotaRule(f"rpm:session:{session_id}", settings.session_rpm))
+        if settings.global_tpm and tokens:
+            rules.append(
+                QuotaRule(
+                    "tpm:global",
+                    settings.global_tpm,
+                    cost=min(tokens, settings.global_tpm),
+                )
+            )
+        return rules
+
+    async def _try_acquire(self, rules: Sequence[QuotaRule]) -> float:
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.backend.try_acquire, rules)
+        return self.backend.try_acquire(rules)
+
+    async def acquire(self, user_id: str, session_id: str, tokens: int = 0) -> float:
+        """
+        Waits without blocking the event loop until the request is admitted.
+
+        Args:
+            user_id: The user making the request.
+            session_id: The session the request belongs to.
+            tokens: Estimated model tokens of the request, for the TPM quota.
+
+        Returns:
+            The number of seconds the request was delayed.
+
+        Raises:
+            RateLimitExceeded: In "reject" mode when there is no quota left,
+                or in "wait" mode when the wait would exceed max_wait_secs.
+        """
+        rules = self.rules_for(user_id, session_id, tokens)
+        if not self.settings.enabled or not rules:
+            return 0.0
+
+        scope = f"user {user_id} / session {session_id}"
+        waited = 0.0
+        while True:
+            retry_after = await self._try_acquire(rules)
+            if retry_after <= 0:
+                self.granted += 1
+                if waited:
+                    self.throttled += 1
+                    self.throttled_secs += waited
+                return waited
+            if (
+                self.settings.mode == "reject"
+                or waited + retry_after > self.settings.max_wait_secs
+            ):
+                self.rejected += 1
+                raise RateLimitExceeded(retry_after, scope)
+            logger.debug("Throttling %s for %.2fs", scope, retry_after)
+            await asyncio.sleep(retry_after)
+            waited += retry_after
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the admission counters and the total throttled time."""
+        return {
+            "backend": self.settings.backend,
+            "granted": self.granted,
+            "throttled": self.throttled,
+            "throttled_secs": round(self.throttled_secs, 3),
+            "rejected": self.rejected,
+        }
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Returns the process-wide RateLimiter built from the configuration."""
+    global _limiter
+
+    if _limiter is None:
+        _limiter = RateLimiter(get_config().rate_limit_settings)
+    return _limiter
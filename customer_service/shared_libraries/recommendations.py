@@ -0,0 +1,406 @@
+"""Book recommendation engine behind get_book_recommendations.
+
+Everything expensive happens when the engine is built from the catalog and
+the customers' purchase histories:
+
+* a genre and an author inverted index, each holding the books of that
+  genre/author ranked by popularity, plus the overall most popular books;
+* item-item similarity from co-purchases: with ``B`` the customer x book
+  purchase matrix, ``C = B.T @ B`` counts how often two books were bought by
+  the same customer, and cosine normalization of ``C`` gives the similarity.
+  Only the top-k neighbours of each book are kept.
+
+Serving a request then only walks a few precomputed top-k lists, skipping
+books the customer already owns or has in the cart, so its cost does not
+depend on the catalog size. record_purchase() folds a single purchase into
+the co-purchase counts and neighbour lists without a full rebuild, for a
+checkout step to call; the agent has none, so purchases reach the tables
+with the periodic rebuild (recommendation_settings.rebuild_secs).
+
+Building the tables takes seconds on a large catalog, so the agent runs
+warm_up() on a background thread when the first session starts, and
+get_book_recommendations fetches the engine with asyncio.to_thread: the
+event loop never waits for a build.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from scipy import sparse
+
+from customer_service.config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+def _key(value: Any) -> str:
+    return str(value or "").strip().lower()
+
+
+def _owned_title(name: str) -> str:
+    # Purchase items are named "<title> by <author>".
+    return _key(name.split(" by ")[0])
+
+
+class RecommendationEngine:
+    """Precomputed top-k recommendation tables over the book catalog."""
+
+    def __init__(
+        self,
+        books: Iterable[Dict[str, Any]],
+        baskets: Iterable[Sequence[str]],
+        top_k: int = 20,
+    ):
+        """
+        Args:
+            books: Catalog documents; "product_id" (or "isbn") identifies a book.
+            baskets: The product ids bought by each customer.
+            top_k: Length of every precomputed table.
+        """
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self.items: List[Dict[str, Any]] = []
+        self.index: Dict[str, int] = {}
+        for book in books:
+            product_id = book.get("product_id") or book.get("isbn")
+            if not product_id or product_id in self.index:
+                continue
+            self.index[product_id] = len(self.items)
+            self.items.append(
+                {
+                    "product_id": product_id,
+                    "name": f"{book.get('title')} by {book.get('author')}",
+                    "title": book.get("title"),
+                    "author": book.get("author"),
+                    "genre": book.get("genre"),
+                    "status": book.get("status"),
+                    "_title": _key(book.get("title")),
+                    "_genre": _key(book.get("genre")),
+                    "_author": _key(book.get("author")),
+                    "_prior": float(book.get("quantity_total") or 0),
+                }
+            )
+
+        n = len(self.items)
+        rows, cols = [], []
+        for row, basket in enumerate(baskets):
+            for product_id in set(basket):
+                col = self.index.get(product_id)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+        n_baskets = (rows[-1] + 1) if rows else 0
+        purchases = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(n_baskets, n),
+        )
+        self._cooc = (purchases.T @ purchases).tocsr()
+        self._cooc.sort_indices()
+        # Co-purchases recorded since the build, row -> {col: count}; kept
+        # apart so record_purchase() never rewrites the whole matrix.
+        self._added: Dict[int, Dict[int, float]] = {}
+        self.popularity = self._cooc.diagonal().astype(np.float64)
+        self.prior = np.array([item["_prior"] for item in self.items])
+        self._norms = np.sqrt(np.maximum(self.popularity, 1.0))
+
+        self.neighbors: List[np.ndarray] = [np.empty(0, dtype=np.int64)] * n
+        # Weight of each row's last neighbour when its list was computed; no
+        # book left out of the list weighs more.
+        self._floors = np.zeros(n)
+        self._refresh_neighbors(range(n))
+
+        # Every table is a prefix of one ranking of the whole catalog.
+        order = self._rank_all()
+        self.popular = order[: self.top_k]
+        self.genre_index = self._top_by_key([item["_genre"] for item in self.items], order)
+        self.author_index = self._top_by_key(
+            [item["_author"] for item in self.items], order
+        )
+        self.built_at = time.monotonic()
+
+    def _rank_all(self) -> np.ndarray:
+        # Most purchased first, then the larger stock as a popularity prior;
+        # the sort is stable, so ties keep catalog order.
+        return np.lexsort((-self.prior, -self.popularity))
+
+    def _rank(self, members: np.ndarray) -> np.ndarray:
+        order = np.lexsort((-self.prior[members], -self.popularity[members]))
+        return members[order][: self.top_k]
+
+    def _top_by_key(self, keys: List[str], order: np.ndarray) -> Dict[str, np.ndarray]:
+        """The first top_k rows of order for each key, in one pass over the catalog."""
+        names, groups = np.unique(np.array(keys, dtype=object), return_inverse=True)
+        # Grouped by key, each group keeping the order of the ranking.
+        ranked = order[np.argsort(groups[order], kind="stable")]
+        starts = np.concatenate(([0], np.cumsum(np.bincount(groups, minlength=len(names)))))
+        return {
+            name: ranked[start : min(start + self.top_k, end)]
+            for name, start, end in zip(names.tolist(), starts[:-1], starts[1:])
+        }
+
+    def _merge(self, table: np.ndarray, rows: Sequence[int]) -> np.ndarray:
+        # Only the rows bought gained popularity, so the new top k is within
+        # the old top k and those rows.
+        return self._rank(np.union1d(table, rows))
+
+    def _refresh_neighbors(self, rows: Iterable[int]) -> None:
+        cooc, norms = self._cooc, self._norms
+        for i in rows:
+            start, end = cooc.indptr[i], cooc.indptr[i + 1]
+            cols, counts = cooc.indices[start:end], cooc.data[start:end]
+            added = self._added.get(i)
+            if added:
+                cols, merged = np.unique(
+                    np.concatenate((cols, np.fromiter(added, np.int64, len(added)))),
+                    return_inverse=True,
+                )
+                counts = np.bincount(
+                    merged,
+                    weights=np.concatenate(
+                        (counts, np.fromiter(added.values(), np.float64, len(added)))
+                    ),
+                )
+            keep = cols != i
+            cols = cols[keep]
+            if not len(cols):
+                self.neighbors[i] = np.empty(0, dtype=np.int64)
+                continue
+            scores = counts[keep] / (norms[i] * norms[cols])
+            if len(cols) > self.top_k:
+                top = np.argpartition(-scores, self.top_k)[: self.top_k]
+                cols, scores = cols[top], scores[top]
+            self.neighbors[i] = cols[np.argsort(-scores, kind="stable")]
+            self._floors[i] = scores.min() * norms[i]
+
+    def _counts(self, i: int, cols: np.ndarray) -> np.ndarray:
+        """Co-purchase counts of row i with each of cols."""
+        cooc = self._cooc
+        start, end = cooc.indptr[i], cooc.indptr[i + 1]
+        row = cooc.indices[start:end]
+        counts = np.zeros(len(cols))
+        if len(row):
+            pos = np.minimum(np.searchsorted(row, cols), len(row) - 1)
+            found = row[pos] == cols
+            counts[found] = cooc.data[start:end][pos[found]]
+        added = self._added.get(i)
+        if added:
+            counts += [added.get(j, 0.0) for j in cols.tolist()]
+        return counts
+
+    def _weights(self, i: int, cols: np.ndarray) -> np.ndarray:
+        # The score without the norms[i] factor, which is shared by the row.
+        return self._counts(i, cols) / self._norms[cols]
+
+    def _update_neighbors(self, i: int, basket: np.ndarray) -> None:
+        """
+        Re-ranks row i after a purchase of basket, which contains i.
+
+        The weight of a book outside the list and the basket can only have
+        dropped since the list was computed, so the new neighbours are among
+        the old ones and the basket, unless one falls below the row's floor;
+        then some other book may take its place and the whole row is scanned.
+        """
+        # A shorter list than top_k held every book co-purchased with i.
+        truncated = len(self.neighbors[i]) >= self.top_k
+        cols = np.union1d(self.neighbors[i], basket[basket != i])
+        weights = self._weights(i, cols)
+        if len(cols) > self.top_k:
+            top = np.argpartition(-weights, self.top_k)[: self.top_k]
+            cols, weights = cols[top], weights[top]
+        if truncated and weights.min(initial=np.inf) < self._floors[i]:
+            self._refresh_neighbors([i])
+            return
+        self.neighbors[i] = cols[np.argsort(-weights, kind="stable")]
+        self._floors[i] = weights.min(initial=0.0)
+
+    def record_purchase(self, product_ids: Sequence[str]) -> None:
+        """
+        Folds a new purchase into the tables incrementally.
+
+        Only the co-purchase counts of the purchased books, their neighbour
+        lists and their entries in the popular, genre and author tables are
+        updated, so the cost depends on the basket and top_k rather than on
+        the catalog size; a neighbour list is rescanned only when one of its
+        books lost weight.
+
+        Args:
+            product_ids: The books bought together by one customer.
+        """
+        cols = sorted({self.index[p] for p in product_ids if p in self.index})
+        if not cols:
+            return
+        basket = np.array(cols)
+        with self._lock:
+            for i in cols:
+                added = self._added.setdefault(i, {})
+                for j in cols:
+                    if j != i:
+                        added[j] = added.get(j, 0.0) + 1.0
+            self.popularity[cols] += 1
+            self._norms[cols] = np.sqrt(self.popularity[cols])
+            for i in cols:
+                self._update_neighbors(i, basket)
+            self.popular = self._merge(self.popular, cols)
+            for i in cols:
+                genre, author = self.items[i]["_genre"], self.items[i]["_author"]
+                self.genre_index[genre] = self._merge(self.genre_index[genre], [i])
+                self.author_index[author] = self._merge(self.author_index[author], [i])
+
+    def _genre_keys(self, genre: str) -> List[str]:
+        genre = _key(genre)
+        if genre in self.genre_index:
+            return [genre]
+        # "mystery novels" -> "mystery", "sci" -> "science fiction"
+        return [g for g in self.genre_index if g and (g in genre or genre in g)]
+
+    def recommend(
+        self,
+        genre: str,
+        owned: Iterable[str] = (),
+        favorite_authors: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        k: int = 5,
+    ) -> List[Dict[str, Any]]:
+        """
+        Recommends up to k books for a genre or topic.
+
+        Candidates come, in order, from the neighbours of books the customer
+        owns, the customer's favorite authors and the most popular books of
+        the genre; books owned or excluded (e.g. in the cart) are skipped.
+
+        Args:
+            genre: The genre or topic asked for; empty for any genre.
+            owned: Product ids or names of books the customer already has.
+            favorite_authors: Authors from the customer's reading profile.
+            exclude: Further product ids or names to leave out.
+            k: Number of books to return.
+
+        Returns:
+            The recommended books, best first.
+        """
+        # A topic that matches no catalog genre falls back to any genre.
+        genres = set(self._genre_keys(genre)) or None if genre else None
+        skip_ids, skip_titles = set(), set()
+        for value in [*owned, *exclude]:
+            skip_ids.add(value)
+            skip_titles.add(_owned_title(value))
+        owned_rows = [self.index[p] for p in owned if p in self.index]
+
+        sources: List[np.ndarray] = [self.neighbors[i] for i in owned_rows]
+        sources += [self.author_index.get(_key(a), ()) for a in favorite_authors]
+        if genres is None:
+            sources.append(self.popular)
+        else:
+            sources += [self.genre_index[g] for g in genres]
+
+        picked: List[Dict[str, Any]] = []
+        seen: Set[int] = set(owned_rows)
+        for source in sources:
+            for i in source:
+                item = self.items[i]
+                if i in seen or (genres is not None and item["_genre"] not in genres):
+                    continue
+                seen.add(i)
+                if item["product_id"] in skip_ids or item["_title"] in skip_titles:
+                    continue
+                picked.append(
+                    {
+                        "product_id": item["product_id"],
+                        "name": item["name"],
+                        "genre": item["genre"],
+                        "status": item["status"],
+                    }
+                )
+                if len(picked) == k:
+                    return picked
+        return picked
+
+
+def load_engine() -> RecommendationEngine:
+    """Builds an engine from the catalog and the configured customer store."""
+    from customer_service.entities.customer_repository import sample_customers
+    from customer_service.shared_libraries.catalog import get_books_collection
+    from customer_service.shared_libraries.mongo import get_collection
+
+    config = get_config()
+    books = get_books_collection().find(
+        {},
+        {"_id": 0, "product_id": 1, "isbn": 1, "title": 1, "author": 1,
+         "genre": 1, "status": 1, "quantity_total": 1},
+    )
+    customer_settings = config.customer_settings
+    if customer_settings.backend == "mongo":
+        users = get_collection(customer_settings.database, customer_settings.collection)
+        baskets = (
+            [item["product_id"] for p in doc.get("purchase_history", []) for item in p["items"]]
+            for doc in users.find(
+                {"customer_id": {"$exists": True}},
+                {"_id": 0, "purchase_history.items.product_id": 1},
+            )
+        )
+    else:
+        baskets = (
+            [item.product_id for p in c.purchase_history for item in p.items]
+            for c in sample_customers()
+        )
+    engine = RecommendationEngine(books, baskets, top_k=config.recommendation_settings.top_k)
+    logger.info("Built recommendation engine over %i books", len(engine.items))
+    return engine
+
+
+_engine: Optional[RecommendationEngine] = None
+_engine_lock = threading.Lock()
+_rebuilding = False
+
+
+def _rebuild() -> None:
+    global _engine, _rebuilding
+
+    try:
+        _engine = load_engine()
+    except Exception as e:
+        logger.error("Recommendation engine rebuild failed: %s", e)
+    finally:
+        _rebuilding = False
+
+
+def get_recommendation_engine() -> RecommendationEngine:
+    """
+    Returns the process-wide engine, building it on first use.
+
+    Once the engine is older than recommendation_settings.rebuild_secs it
+    keeps serving while a fresh one is built in the background.
+    """
+    global _engine, _rebuilding
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = load_engine()
+        return _engine
+
+    rebuild_secs = get_config().recommendation_settings.rebuild_secs
+    if rebuild_secs and time.monotonic() - _engine.built_at > rebuild_secs:
+        with _engine_lock:
+            if not _rebuilding:
+                _rebuilding = True
+                threading.Thread(
+                    target=_rebuild, name="recommendation-rebuild", daemon=True
+                ).start()
+    return _engine
+
+
+
+def warm_up() -> None:
+    """
+    Builds the engine if it is not built yet, for a background thread.
+
+    Failures are logged; get_recommendation_engine() tries again on use.
+    """
+    try:
+        get_recommendation_engine()
+    except Exception as e:
+        logger.error("Recommendation engine warm-up failed: %s", e)
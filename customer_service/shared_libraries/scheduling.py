@@ -0,0 +1,395 @@
+"""Reading consultation scheduling with conflict-free booking.
+
+Each store day is divided into fixed slots (``slot_minutes`` between
+``open_hour`` and ``close_hour``), and each consultant of the store has a
+lane: a 64-bit integer whose bit i is set when slot i is booked. A store day
+is one document in ``customer_service.consultation_slots``::
+
+    {"_id": "main|2025-07-29", "store_id": "main", "date": "2025-07-29",
+     "lanes": [0b0110, 0], "bookings": {"<appointment id>": {...}}}
+
+Booking a time range is a single conditional update on one lane:
+``{"lanes.0": {"$bitsAllClear": [3, 4]}}`` with ``{"$bit": {"lanes.0": {"or":
+mask}}}``, so two customers can never get the same consultant for
+overlapping slots, without locks or transactions. Availability queries read
+only the lanes of the days asked for and find free windows with a few bit
+operations, so their cost does not grow with the number of bookings.
+"""
+
+import logging
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from datetime import date as Date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from customer_service.config import SchedulingModel, get_config
+
+logger = logging.getLogger(__name__)
+
+
+class SlotUnavailableError(Exception):
+    """Raised when a requested consultation time cannot be booked."""
+
+
+def free_starts(lane: int, slots: int, length: int) -> int:
+    """
+    Returns a bitmap of the slots where a free run of length slots starts.
+
+    Args:
+        lane: The booked-slot bitmap of one consultant.
+        slots: Number of slots in the day.
+        length: Number of consecutive slots needed.
+    """
+    if length > slots:
+        return 0
+    free = ~lane & ((1 << slots) - 1)
+    starts = free
+    for shift in range(1, length):
+        starts &= free >> shift
+    return starts & ((1 << (slots - length + 1)) - 1)
+
+
+def _bits(value: int) -> List[int]:
+    positions = []
+    while value:
+        low = value & -value
+        positions.append(low.bit_length() - 1)
+        value ^= low
+    return positions
+
+
+class SlotStore(ABC):
+    """Persists the slot lanes of every store day."""
+
+    @abstractmethod
+    def load(self, store_id: str, dates: Sequence[str]) -> Dict[str, List[int]]:
+        """Returns the lanes of the given days; days never booked are absent."""
+
+    @abstractmethod
+    def try_reserve(
+        self,
+        store_id: str,
+        date: str,
+        lanes: int,
+        lane: int,
+        mask: int,
+        appointment_id: str,
+        booking: Dict[str, Any],
+    ) -> bool:
+        """Atomically books mask on a lane if all its slots are still free."""
+
+    @abstractmethod
+    def release(
+        self, store_id: str, date: str, lane: int, mask: int, appointment_id: str
+    ) -> None:
+        """Frees the slots of a booking again."""
+
+
+class InMemorySlotStore(SlotStore):
+    """Slot lanes held in this process, for development without MongoDB."""
+
+    def __init__(self):
+        self._days: Dict[Tuple[str, str], List[int]] = {}
+        self.bookings: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, store_id, dates):
+        with self._lock:
+            return {
+                d: list(self._days[(store_id, d)])
+                for d in dates
+                if (store_id, d) in self._days
+            }
+
+    def try_reserve(self, store_id, date, lanes, lane, mask, appointment_id, booking):
+        with self._lock:
+            day = self._days.setdefault((store_id, date), [0] * lanes)
+            if day[lane] & mask:
+                return False
+            day[lane] |= mask
+            self.bookings[appointment_id] = booking
+            return True
+
+    def release(self, store_id, date, lane, mask, appointment_id):
+        with self._lock:
+            self._days[(store_id, date)][lane] &= ~mask
+            self.bookings.pop(appointment_id, None)
+
+
+class MongoSlotStore(SlotStore):
+    """One document per store day, updated with conditional bitwise updates."""
+
+    def __init__(self, collection=None, settings: Optional[SchedulingModel] = None):
+        """
+        Args:
+            collection: The pymongo collection; defaults to the configured one
+                on the shared client.
+            settings: The scheduling settings; defaults to the config.
+        """
+        if collection is None:
+            from customer_service.shared_libraries.mongo import get_collection
+
+            settings = settings or get_config().scheduling_settings
+            collection = get_collection(settings.database, settings.collection)
+        self._collection = collection
+
+    def ensure_indexes(self) -> None:
+        """Creates the (store_id, date) index used by range queries."""
+        from pymongo import ASCENDING
+
+        self._collection.create_index(
+            [("store_id", ASCENDING), ("date", ASCENDING)], name="store_id_1_date_1"
+        )
+
+    def load(self, store_id, dates):
+        if not dates:
+            return {}
+        docs = self._collection.find(
+            {"store_id": store_id, "date": {"$gte": min(dates), "$lte": max(dates)}},
+            {"_id": 0, "date": 1, "lanes": 1},
+        )
+        wanted = set(dates)
+        return {doc["date"]: doc["lanes"] for doc in docs if doc["date"] in wanted}
+
+    def try_reserve(self, store_id, date, lanes, lane, mask, appointment_id, booking):
+        from pymongo.errors import DuplicateKeyError
+
+        day_id = f"{store_id}|{date}"
+        # Bit positions rather than the mask itself: a numeric bitmask must
+        # fit in 32 bits, and later slots of a day are above that.
+        query = {"_id": day_id, f"lanes.{lane}": {"$bitsAllClear": _bits(mask)}}
+        update = {
+            "$bit": {f"lanes.{lane}": {"or": mask}},
+            "$set": {f"bookings.{appointment_id}": booking},
+        }
+        result = self._collection.update_one(query, update)
+        if result.modified_count:
+            return True
+        # The day may not exist yet; create it empty and try once more.
+        try:
+            self._collection.insert_one(
+                {"_id": day_id, "store_id": store_id, "date": date,
+                 "lanes": [0] * lanes, "bookings": {}}
+            )
+        except DuplicateKeyError:
+            return False
+        result = self._collection.update_one(query, update)
+        return bool(result.modified_count)
+
+    def release(self, store_id, date, lane, mask, appointment_id):
+        self._collection.update_one(
+            {"_id": f"{store_id}|{date}"},
+            {
+                "$bit": {f"lanes.{lane}": {"and": ~mask}},
+                "$unset": {f"bookings.{appointment_id}": ""},
+            },
+        )
+
+
+class ConsultationScheduler:
+    """Answers availability queries and books consultations."""
+
+    def __init__(self, store: SlotStore, settings: SchedulingModel):
+        self.store = store
+        self.settings = settings
+        self.slots = (settings.close_hour - settings.open_hour) * 60 // settings.slot_minutes
+        if not 0 < self.slots <= 63:
+            raise ValueError("A day must have between 1 and 63 slots")
+
+    def _slot_time(self, slot: int) -> str:
+        minutes = self.settings.open_hour * 60 + slot * self.settings.slot_minutes
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}" if minutes == 0 else f"{hours}:{minutes:02d}"
+
+    def format_range(self, start: int, length: int) -> str:
+        """Formats slots as a time range such as "9-10" or "9:30-10:30"."""
+        return f"{self._slot_time(start)}-{self._slot_time(start + length)}"
+
+    def _parse_time(self, value: str) -> int:
+        hours, _, minutes = value.strip().partition(":")
+        offset = int(hours) * 60 + int(minutes or 0) - self.settings.open_hour * 60
+        if offset < 0 or offset % self.settings.slot_minutes:
+            raise ValueError(f"{value} is not a consultation slot boundary")
+        return offset // self.settings.slot_minutes
+
+    def parse_range(self, time_range: str) -> Tuple[int, int]:
+        """Parses "9-10" or "9:30-11:00" into (first slot, number of slots)."""
+        start, _, end = time_range.partition("-")
+        first, last = self._parse_time(start), self._parse_time(end)
+        if not first < last <= self.slots:
+            raise ValueError(f"{time_range} is outside opening hours")
+        return first, last - first
+
+    def _length(self, duration_minutes: Optional[int]) -> int:
+        minutes = duration_minutes or self.settings.consultation_minutes
+        return max(1, -(-minutes // self.settings.slot_minutes))
+
+    def _started_slots(self, date: str) -> int:
+        """Returns how many of the day's slots have already started."""
+        now = datetime.now()
+        today = now.date().isoformat()
+        if date > today:
+            return 0
+        if date < today:
+            return self.slots
+        elapsed = now.hour * 60 + now.minute - self.settings.open_hour * 60
+        return min(self.slots, max(0, -(-elapsed // self.settings.slot_minutes)))
+
+    def _free(self, lanes: Optional[List[int]], length: int) -> int:
+        if lanes is None:
+            lanes = [0] * self.settings.consultants
+        starts = 0
+        for lane in lanes:
+            starts |= free_starts(lane, self.slots, length)
+        return starts
+
+    def available(
+        self, store_id: str, date: str, duration_minutes: Optional[int] = None
+    ) -> List[str]:
+        """
+        Returns the time ranges of the given length still bookable on a day.
+
+        Raises:
+            ValueError: If the date is not YYYY-MM-DD, as in reserve().
+        """
+        date = datetime.strptime(date, "%Y-%m-%d").date().isoformat()
+        length = self._length(duration_minutes)
+        lanes = self.store.load(store_id, [date]).get(date)
+        started = self._started_slots(date)
+        free = self._free(lanes, length) >> started << started
+        return [self.format_range(s, length) for s in _bits(free)]
+
+    def next_free(
+        self,
+        store_id: str,
+        count: int = 5,
+        days: Optional[int] = None,
+        duration_minutes: Optional[int] = None,
+        start: Optional[Date] = None,
+    ) -> List[Dict[str, str]]:
+        """
+        Returns the earliest free consultation times over the coming days.
+
+        The lanes of the whole range are read with one query.
+
+        Args:
+            store_id: The store to search.
+            count: Number of times to return.
+            days: Days to search, starting today; defaults to search_days.
+            duration_minutes: Consultation length; defaults to the setting.
+            start: First day to search; defaults to today. Today's slots
+                that have already started are skipped.
+
+        Returns:
+            Up to count {"date", "time_range"} entries, earliest first.
+        """
+        length = self._length(duration_minutes)
+        now = datetime.now()
+        start = max(start or now.date(), now.date())
+        dates = [
+            (start + timedelta(days=i)).isoformat()
+            for i in range(days or self.settings.search_days)
+        ]
+        booked = self.store.load(store_id, dates)
+        found: List[Dict[str, str]] = []
+        for date in dates:
+            started = self._started_slots(date)
+            for slot in _bits(self._free(booked.get(date), length) >> started << started):
+                found.append({"date": date, "time_range": self.format_range(slot, length)})
+                if len(found) == count:
+                    return found
+        return found
+
+    def reserve(
+        self, store_id: str, customer_id: str, date: str, time_range: str, details: str
+    ) -> Dict[str, Any]:
+        """
+        Books a consultation with the first consultant free for the range.
+
+        Returns:
+            The appointment, including its "appointment_id", its "start"
+            time as H:MM and the "lane" and "mask" needed to release it.
+
+        Raises:
+            ValueError: If the date or time range is invalid.
+            SlotUnavailableError: If no consultant is free for the range.
+        """
+        date = datetime.strptime(date, "%Y-%m-%d").date().isoformat()
+        first, length = self.parse_range(time_range)
+        if first < self._started_slots(date):
+            raise ValueError(f"{date} {time_range} is in the past")
+        mask = ((1 << length) - 1) << first
+        appointment = {
+            "appointment_id": str(uuid.uuid4()),
+            "customer_id": customer_id,
+            "store_id": store_id,
+            "date": date,
+            "time": self.format_range(first, length),
+            "details": details,
+        }
+        lanes = self.store.load(store_id, [date]).get(date) or [0] * self.settings.consultants
+        # Try the consultants that looked free first; the conditional update
+        # decides, so a lane taken in the meantime just moves on to the next.
+        order = sorted(range(len(lanes)), key=lambda i: bool(lanes[i] & mask))
+        for lane in order:
+            if self.store.try_reserve(
+                store_id,
+                date,
+                len(lanes),
+                lane,
+                mask,
+                appointment["appointment_id"],
+                appointment,
+            ):
+                hours, minutes = divmod(
+                    self.settings.open_hour * 60 + first * self.settings.slot_minutes, 60
+                )
+                return {
+                    **appointment,
+                    "start": f"{hours}:{minutes:02d}",
+                    "lane": lane,
+                    "mask": mask,
+                }
+        raise SlotUnavailableError(f"No consultant is free on {date} at {time_range}")
+
+    def release(self, appointment: Dict[str, Any]) -> None:
+        """Frees the slots of an appointment returned by reserve()."""
+        self.store.release(
+            appointment["store_id"],
+            appointment["date"],
+            appointment["lane"],
+            appointment["mask"],
+            appointment["appointment_id"],
+        )
+
+
+_scheduler: Optional[ConsultationScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def create_scheduler(settings: Optional[SchedulingModel] = None) -> ConsultationScheduler:
+    """Builds the scheduler with the slot store selected in the configuration."""
+    settings = settings or get_config().scheduling_settings
+    if settings.backend == "memory":
+        store: SlotStore = InMemorySlotStore()
+    elif settings.backend == "mongo":
+        store = MongoSlotStore(settings=settings)
+        try:
+            store.ensure_indexes()
+        except Exception as e:
+            logger.error("Could not ensure the consultation slot index: %s", e)
+    else:
+        raise ValueError(f"Unknown scheduling backend: {settings.backend}")
+    return ConsultationScheduler(store, settings)
+
+
+def get_scheduler() -> ConsultationScheduler:
+    """Returns the process-wide consultation scheduler."""
+    global _scheduler
+
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = create_scheduler()
+    return _scheduler
@@ -0,0 +1,237 @@
+"""Memoization of idempotent tool results, applied by before_tool/after_tool.
+
+Within a conversation the model often repeats calls such as
+``access_cart_information`` or ``get_available_consultation_times`` with the
+same arguments. Each tool listed in ``TOOL_CACHE_POLICIES`` declares:
+
+* ``scope``: "session" results are only reused within the session that
+  produced them (anything customer specific); "global" results are shared
+  by every session in the process.
+* ``ttl_secs``: how long a result stays valid.
+* ``invalidated_by``: tools whose successful call drops the cached results,
+  e.g. ``modify_cart`` makes cached carts and recommendations stale. A
+  session-scoped result is only dropped for the session that made the call.
+
+before_tool returns a cached response, which makes ADK skip the tool; the
+call's function_call_id is remembered so that after_tool, which still runs
+for the short-circuited call, does not store the response a second time.
+"""
+
+import json
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, Mapping, Optional, Set, Tuple
+
+from customer_service.config import get_config
+from customer_service.shared_libraries.cache import TTLCache
+
+_GLOBAL = "global"
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """How the result of one tool may be reused."""
+
+    scope: str = "session"
+    ttl_secs: float = 60.0
+    invalidated_by: Tuple[str, ...] = ()
+
+
+TOOL_CACHE_POLICIES: Dict[str, CachePolicy] = {
+    # Carts also change through other workers and channels, which do not
+    # invalidate this cache; a few seconds only absorbs repeats within a turn.
+    "access_cart_information": CachePolicy("session", 5, ("modify_cart",)),
+    "get_book_recommendations": CachePolicy("session", 300, ("modify_cart",)),
+    "get_customer_record": CachePolicy("session", 300, ("schedule_reading_consultation",)),
+    "get_available_consultation_times": CachePolicy(
+        "global", 30, ("schedule_reading_consultation",)
+    ),
+    "find_next_consultation_slots": CachePolicy(
+        "global", 30, ("schedule_reading_consultation",)
+    ),
+    "check_product_availability": CachePolicy("global", 30),
+    "check_products_availability": CachePolicy("global", 30),
+}
+
+
+def _args_key(args: Mapping[str, Any]) -> str:
+    return json.dumps(args, sort_keys=True, default=str)
+
+
+def _is_error(response: Any) -> bool:
+    return isinstance(response, dict) and (
+        "error" in response or response.get("status") == "error"
+    )
+
+
+class ToolResultCache:
+    """
+    Tool results grouped by scope (a session id, or "global").
+
+    Each scope holds a small dict per tool, so invalidating a tool for a
+    scope is a single pop, and the least recently used sessions are evicted
+    as a whole.
+    """
+
+    def __init__(
+        self,
+        policies: Mapping[str, CachePolicy],
+        max_scopes: int = 10_000,
+        max_entries_per_tool: int = 64,
+        clock=time.monotonic,
+    ):
+        self.policies = dict(policies)
+        self.max_entries_per_tool = max_entries_per_tool
+        self._clock = clock
+        self._scopes = TTLCache(maxsize=max_scopes, ttl=None)
+        self._lock = threading.Lock()
+        self._short_circuited: Set[str] = set()
+        self._invalidates: Dict[str, Tuple[str, ...]] = {}
+        for tool_name, policy in self.policies.items():
+            for invalidator in policy.invalidated_by:
+                self._invalidates[invalidator] = self._invalidates.get(
+                    invalidator, ()
+                ) + (tool_name,)
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, tool_name: str, counter: str) -> None:
+        counters = self.counters.setdefault(
+            tool_name, {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+        )
+        counters[counter] += 1
+
+    def _scope_key(self, policy: CachePolicy, session_id: str) -> Hashable:
+        return _GLOBAL if policy.scope == _GLOBAL else session_id
+
+    def lookup(
+        self,
+        tool_name: str,
+        args: Mapping[str, Any],
+        session_id: str,
+        function_call_id: Optional[str] = None,
+    ) -> Optional[Any]:
+        """
+        Returns the cached response for a call, or None on a miss.
+
+        Args:
+            tool_name: The tool being called.
+            args: Its (normalized) arguments.
+            session_id: The session making the call.
+            function_call_id: The id of the call; a hit is remembered under it
+                so that store() skips the short-circuited call.
+        """
+        policy = self.policies.get(tool_name)
+        if policy is None:
+            return None
+        key = _args_key(args)
+        with self._lock:
+            tools = self._scopes.get(self._scope_key(policy, session_id))
+            entry = tools.get(tool_name, {}).get(key) if tools else None
+            if entry is None or entry[0] <= self._clock():
+                self._count(tool_name, "misses")
+                return None
+            self._count(tool_name, "hits")
+            if function_call_id:
+                self._short_circuited.add(function_call_id)
+            return entry[1]
+
+    def store(
+        self,
+        tool_name: str,
+        args: Mapping[str, Any],
+        session_id: str,
+        response: Any,
+        function_call_id: Optional[str] = None,
+    ) -> None:
+        """
+        Records a tool response and applies the invalidations it triggers.
+
+        Responses served from the cache and error responses are not stored;
+        a failed call does not invalidate anything either.
+        """
+        with self._lock:
+            if function_call_id in self._short_circuited:
+                self._short_circuited.discard(function_call_id)
+                return
+        # Tools return dicts or lists; anything else is an error message
+        # produced by before_tool.
+        if not isinstance(response, (dict, list)) or _is_error(response):
+            return
+
+        for dependent in self._invalidates.get(tool_name, ()):
+            self.invalidate(dependent, session_id)
+
+        policy = self.policies.get(tool_name)
+        if policy is None:
+            return
+        scope_key = self._scope_key(policy, session_id)
+        with self._lock:
+            tools = self._scopes.get(scope_key)
+            if tools is None:
+                tools = {}
+                self._scopes.set(scope_key, tools)
+            entries = tools.setdefault(tool_name, {})
+            entries.pop(_args_key(args), None)
+            entries[_args_key(args)] = (self._clock() + policy.ttl_secs, response)
+            while len(entries) > self.max_entries_per_tool:
+                # Dicts keep insertion order, so this drops the oldest entry.
+                del entries[next(iter(entries))]
+            self._count(tool_name, "stores")
+
+    def invalidate(self, tool_name: str, session_id: str) -> None:
+        """Drops the cached results of a tool for a session (or globally)."""
+        policy = self.policies.get(tool_name)
+        if policy is None:
+            return
+        with self._lock:
+            tools = self._scopes.get(self._scope_key(policy, session_id))
+            if tools and tools.pop(tool_name, None) is not None:
+                self._count(tool_name, "invalidations")
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the per-tool counters and hit rates, plus the totals."""
+        per_tool = {}
+        hits = lookups = 0
+        for tool_name, counters in self.counters.items():
+            tool_lookups = counters["hits"] + counters["misses"]
+            per_tool[tool_name] = {
+                **counters,
+                "hit_rate": round(counters["hits"] / tool_lookups, 4)
+                if tool_lookups
+                else 0.0,
+            }
+            hits += counters["hits"]
+            lookups += tool_lookups
+        return {
+            "tools": per_tool,
+            "hits": hits,
+            "lookups": lookups,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "scopes": len(self._scopes),
+        }
+
+
+_cache: Optional[ToolResultCache] = None
+
+
+def get_tool_cache() -> Optional[ToolResultCache]:
+    """Returns the process-wide tool cache, or None when it is disabled."""
+    global _cache
+
+    settings = get_config().tool_cache_settings
+    if not settings.enabled:
+        return None
+    if _cache is None:
+        _cache = ToolResultCache(
+            TOOL_CACHE_POLICIES,
+            max_scopes=settings.max_sessions,
+            max_entries_per_tool=settings.max_entries_per_tool,
+        )
+    return _cache
+
+
+def tool_cache_stats() -> Dict[str, Any]:
+    """Returns the tool cache counters, or {} when it is disabled."""
+    cache = get_tool_cache()
+    return cache.stats() if cache else {}
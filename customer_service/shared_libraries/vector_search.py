@@ -0,0 +1,404 @@
+"""Offline similarity index over the book catalog.
+
+Turns vague requests such as "mystery novels with female detectives" into
+the closest catalog titles, without a network model:
+
+1. Each book's text (title, author, genre, description) is tokenized into
+   words and word bigrams, hashed into ``buckets`` features and weighted by
+   TF-IDF.
+2. A fixed sparse random projection, regenerated from ``seed``, maps the
+   TF-IDF vector to ``dim`` dense dimensions; cosine similarity is roughly
+   preserved.
+3. An inverted-file (IVF) index clusters the vectors with spherical k-means.
+   A query only scans the ``nprobe`` clusters whose centroids are closest,
+   so it touches a few thousand vectors even for a million-title catalog.
+
+Vectors, cluster offsets and result labels are numpy files opened with
+``mmap_mode="r"``; the operating system pages in only the clusters a query
+reads, and every worker process shares the same page cache.
+
+Build the index with::
+
+    python -m customer_service.shared_libraries.vector_search build
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from customer_service.config import VectorSearchModel, get_config
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Title words say the most about a book, so they count twice.
+_FIELDS = (("title", 2.0), ("author", 1.0), ("genre", 1.0), ("description", 1.0))
+_LABEL_FIELDS = ("isbn", "title", "author", "genre", "status")
+_BATCH = 8192
+
+
+def _features(text: str, buckets: int) -> List[int]:
+    """Hashes the words and word bigrams of text into feature ids."""
+    words = _TOKEN.findall(text.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    # crc32 is stable across processes, unlike the built-in hash().
+    return [zlib.crc32(gram.encode()) % buckets for gram in grams]
+
+
+def _document_features(book: Dict[str, Any], buckets: int) -> Dict[int, float]:
+    counts: Dict[int, float] = {}
+    for field, weight in _FIELDS:
+        value = book.get(field)
+        if value:
+            for feature in _features(str(value), buckets):
+                counts[feature] = counts.get(feature, 0.0) + weight
+    return counts
+
+
+def _projection(
+    buckets: int, dim: int, seed: int, per_feature: int = 4
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The sparse random projection from hashed features to dim dimensions.
+
+    Returns:
+        (dims, signs), each of shape (buckets, per_feature): feature f adds
+        signs[f] times its weight to the output dimensions dims[f].
+    """
+    rng = np.random.default_rng(seed)
+    dims = rng.integers(0, dim, size=(buckets, per_feature))
+    signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=(buckets, per_feature))
+    return dims, signs
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class _Embedder:
+    """TF-IDF over hashed features followed by the random projection."""
+
+    def __init__(self, idf: np.ndarray, dim: int, seed: int):
+        self.idf = idf
+        self.dim = dim
+        self.buckets = len(idf)
+        self.dims, self.signs = _projection(self.buckets, dim, seed)
+        per_feature = self.dims.shape[1]
+        self.projection = sparse.csr_matrix(
+            (
+                self.signs.ravel(),
+                self.dims.ravel(),
+                np.arange(0, self.buckets * per_feature + 1, per_feature),
+            ),
+            shape=(self.buckets, dim),
+        )
+
+    def embed(self, feature_counts: List[Dict[int, float]]) -> np.ndarray:
+        rows, cols, data = [], [], []
+        for row, counts in enumerate(feature_counts):
+            rows.extend([row] * len(counts))
+            cols.extend(counts.keys())
+            data.extend(counts.values())
+        tf = sparse.csr_matrix(
+            (np.asarray(data, dtype=np.float32), (rows, cols)),
+            shape=(len(feature_counts), self.buckets),
+        )
+        # Sublinear term frequency, so a repeated word does not dominate.
+        tf.data = (1.0 + np.log(tf.data)) * self.idf[tf.indices]
+        return _normalize((tf @ self.projection).toarray().astype(np.float32))
+
+    def embed_text(self, text: str) -> np.ndarray:
+        # A query has a handful of features; scattering them directly is
+        # much cheaper than a sparse matrix product.
+        features, counts = np.unique(
+            np.asarray(_features(text, self.buckets), dtype=np.int64),
+            return_counts=True,
+        )
+        weights = (1.0 + np.log(counts)) * self.idf[features]
+        vector = np.zeros(self.dim, dtype=np.float32)
+        np.add.at(vector, self.dims[features], weights[:, None] * self.signs[features])
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    """Returns the closest centroid of every vector, in bounded memory."""
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        block = np.asarray(vectors[start : start + chunk], dtype=np.float32)
+        assignment[start : start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def _kmeans(
+    sample: np.ndarray, nlist: int, iterations: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Spherical k-means; returns unit-length centroids."""
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _assign(sample, centroids)
+        members = sparse.csr_matrix(
+            (np.ones(len(sample), dtype=np.float32), (assignment, np.arange(len(sample)))),
+            shape=(nlist, len(sample)),
+        )
+        sums = np.asarray(members @ sample)
+        empty = ~sums.any(axis=1)
+        # Re-seed empty clusters with random points so every list is used.
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids.astype(np.float32)
+
+
+def build_index(
+    documents: Callable[[], Iterable[Dict[str, Any]]],
+    path: str,
+    settings: Optional[VectorSearchModel] = None,
+) -> Dict[str, Any]:
+    """
+    Builds the on-disk IVF index from the catalog.
+
+    The catalog is streamed twice (document frequencies, then vectors), so
+    memory stays bounded by the vectors themselves, which are written to a
+    memory-mapped file. The finished index replaces the one at path.
+
+    Args:
+        documents: Returns a fresh iterable over the book documents.
+        path: The index directory.
+        settings: Index parameters; defaults to Config.vector_search_settings.
+
+    Returns:
+        The index metadata.
+    """
+    settings = settings or get_config().vector_search_settings
+    started = time.perf_counter()
+    buckets, dim = settings.hash_buckets, settings.dim
+
+    df = np.zeros(buckets, dtype=np.int64)
+    count = 0
+    for book in documents():
+        df[list(_document_features(book, buckets))] += 1
+        count += 1
+    if not count:
+        raise ValueError("The catalog is empty; nothing to index")
+    idf = np.log((1 + count) / (1 + df)).astype(np.float32) + 1.0
+    embedder = _Embedder(idf, dim, settings.seed)
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    # Vectors in catalog order; reordered by cluster once assignments are known.
+    staged = np.lib.format.open_memmap(
+        os.path.join(tmp, "staged.npy"), mode="w+", dtype=np.float32, shape=(count, dim)
+    )
+    staged_labels = open(os.path.join(tmp, "staged_labels.bin"), "wb")
+    staged_offsets = np.zeros(count + 1, dtype=np.int64)
+    row = 0
+    batch: List[Dict[int, float]] = []
+
+    def flush() -> None:
+        nonlocal row
+        if batch:
+            staged[row : row + len(batch)] = embedder.embed(batch)
+            row += len(batch)
+            batch.clear()
+
+    for book in documents():
+        if row + len(batch) == count:
+            break
+        i = row + len(batch)
+        batch.append(_document_features(book, buckets))
+        label = json.dumps({f: book.get(f) for f in _LABEL_FIELDS}, default=str)
+        staged_offsets[i + 1] = staged_offsets[i] + staged_labels.write(label.encode())
+        if len(batch) == _BATCH:
+            flush()
+    flush()
+    staged_labels.close()
+    count = row
+
+    rng = np.random.default_rng(settings.seed)
+    nlist = settings.nlist or int(np.clip(round(4 * np.sqrt(count)), 1, 4096))
+    nlist = min(nlist, count)
+    # A few dozen points per cluster are enough to place the centroids.
+    sample_size = min(count, max(64 * nlist, 65536), 262144)
+    sample_rows = np.sort(rng.choice(count, size=sample_size, replace=False))
+    centroids = _kmeans(staged[sample_rows], nlist, settings.kmeans_iterations, rng)
+    assignment = _assign(staged[:count], centroids)
+
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignment, minlength=nlist), out=offsets[1:])
+
+    vectors = np.lib.format.open_memmap(
+        os.path.join(tmp, "vectors.npy"), mode="w+", dtype=np.float32, shape=(count, dim)
+    )
+    labels = np.memmap(
+        os.path.join(tmp, "staged_labels.bin"), dtype=np.uint8, mode="r"
+    ) if staged_offsets[count] else np.zeros(0, dtype=np.uint8)
+    label_offsets = np.zeros(count + 1, dtype=np.int64)
+    with open(os.path.join(tmp, "labels.bin"), "wb") as out:
+        for start in range(0, count, 65536):
+            rows = order[start : start + 65536]
+            # Read the staged rows in file order, then put them in list order.
+            vectors[start : start + len(rows)] = staged[np.sort(rows)][
+                np.argsort(np.argsort(rows))
+            ]
+            for i, source in enumerate(rows, start):
+                label = labels[staged_offsets[source] : staged_offsets[source + 1]]
+                label_offsets[i + 1] = label_offsets[i] + out.write(label.tobytes())
+    vectors.flush()
+    del vectors, staged, labels
+    os.remove(os.path.join(tmp, "staged.npy"))
+    os.remove(os.path.join(tmp, "staged_labels.bin"))
+
+    np.save(os.path.join(tmp, "idf.npy"), idf)
+    np.save(os.path.join(tmp, "centroids.npy"), centroids)
+    np.save(os.path.join(tmp, "offsets.npy"), offsets)
+    np.save(os.path.join(tmp, "label_offsets.npy"), label_offsets)
+    meta = {
+        "count": count,
+        "dim": dim,
+        "hash_buckets": buckets,
+        "seed": settings.seed,
+        "nlist": nlist,
+        "built_at": time.time(),
+        "build_secs": round(time.perf_counter() - started, 3),
+    }
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+    old = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.replace(path, old)
+    os.replace(tmp, path)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info("Built vector index of %i books in %i lists at %s", count, nlist, path)
+    return meta
+
+
+class VectorIndex:
+    """Read-only view of an index directory written by build_index()."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.embedder = _Embedder(
+            np.load(os.path.join(path, "idf.npy")), self.meta["dim"], self.meta["seed"]
+        )
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.label_offsets = np.load(os.path.join(path, "label_offsets.npy"), mmap_mode="r")
+        self.labels = np.memmap(os.path.join(path, "labels.bin"), dtype=np.uint8, mode="r")
+
+    def _label(self, row: int) -> Dict[str, Any]:
+        start, end = self.label_offsets[row], self.label_offsets[row + 1]
+        return json.loads(self.labels[start:end].tobytes())
+
+    def search(self, text: str, k: int = 5, nprobe: int = 16) -> List[Dict[str, Any]]:
+        """
+        Returns the k books most similar to text, best first.
+
+        Args:
+            text: A free-text description of the books wanted.
+            k: Number of books to return.
+            nprobe: Clusters to scan; more is slower but more accurate.
+
+        Returns:
+            The matching books with their cosine "score".
+        """
+        query = self.embedder.embed_text(text)
+        if not query.any():
+            return []
+        nprobe = min(nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+        starts, ends = self.offsets[lists], self.offsets[lists + 1]
+        rows = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        if not len(rows):
+            return []
+        # Each list is a contiguous slice of the memory map.
+        block = np.concatenate([self.vectors[s:e] for s, e in zip(starts, ends)])
+        scores = block @ query
+        if len(rows) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        best = np.argsort(-scores)
+        return [
+            {**self._label(int(rows[i])), "score": round(float(scores[i]), 4)}
+            for i in best
+            if scores[i] > 0
+        ]
+
+
+_index: Optional[Tuple[float, VectorIndex]] = None
+_index_lock = threading.Lock()
+
+
+def get_vector_index() -> VectorIndex:
+    """
+    Returns the index at vector_search_settings.index_path.
+
+    The open index is reused until a rebuild replaces the directory.
+
+    Raises:
+        FileNotFoundError: If the index has not been built.
+    """
+    global _index
+
+    path = get_config().vector_search_settings.index_path
+    built = os.stat(os.path.join(path, "meta.json")).st_mtime
+    if _index is None or _index[0] != built:
+        with _index_lock:
+            if _index is None or _index[0] != built:
+                _index = (built, VectorIndex(path))
+    return _index[1]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Builds the index from Library.Books, or queries it."""
+    from customer_service.shared_libraries.catalog import get_books_collection
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="index the catalog")
+    query = commands.add_parser("query", help="search the index")
+    query.add_argument("text")
+    query.add_argument("-k", type=int, default=5)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    settings = get_config().vector_search_settings
+    if args.command == "build":
+        collection = get_books_collection()
+        projection = {"_id": 0, **{f: 1 for f, _ in _FIELDS}, **{f: 1 for f in _LABEL_FIELDS}}
+        meta = build_index(
+            lambda: collection.find({}, projection).sort("_id", 1),
+            settings.index_path,
+        )
+        print(json.dumps(meta, indent=2))
+        return 0
+
+    index = get_vector_index()
+    started = time.perf_counter()
+    results = index.search(args.text, args.k, settings.nprobe)
+    elapsed = (time.perf_counter() - started) * 1000
+    for book in results:
+        print(f"{book['score']:.3f}  {book['title']} by {book['author']} ({book['genre']})")
+    print(f"{len(results)} results in {elapsed:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
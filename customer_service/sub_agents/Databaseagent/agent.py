@@ -7,50 +7,66 @@ from google.adk.tools import google_search
 import logging
 from datetime import datetime, timedelta
 from google.adk.tools import ToolContext
-from pymongo import MongoClient
 from typing import Dict, Any, List
 
+from customer_service.shared_libraries.mongo import get_async_collection, get_collection
+
 logger = logging.getLogger(__name__)
 
-def login_enquirey(query: str) -> Dict[str, Any]:
+def _login_response(query: str, user: Dict[str, Any] | None) -> Dict[str, Any]:
+    if user:
+        logger.info("User found: %s", query)
+        return {
+            "status": "success",
+            "message": f"Username '{query}' found in database",
+            "user_exists": True,
+            "username": user.get("username")
+        }
+    logger.info("User not found: %s", query)
+    return {
+        "status": "not_found",
+        "message": f"Username '{query}' not found in database",
+        "user_exists": False
+    }
+
+
+def _login_error(e: Exception) -> Dict[str, Any]:
+    logger.error("Database connection error: %s", e)
+    return {
+        "status": "error",
+        "message": f"Database error: {str(e)}",
+        "user_exists": False
+    }
+
+
+async def login_enquirey(query: str) -> Dict[str, Any]:
     """
-    Function to fetch books from MongoDB database based on query.
+    Function to check whether a username exists in the users database.
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['customer_service']
-        collection = db['users']
+        # Reuse the pooled async client of the running event loop
+        collection = get_async_collection('customer_service', 'users')
         
         # Search for username in the database
-        user = collection.find_one({"username": query})
-        
-        if user:
-            logger.info(f"User found: {query}")
-            return {
-                "status": "success",
-                "message": f"Username '{query}' found in database",
-                "user_exists": True,
-                "username": user.get("username")
-            }
-        else:
-            logger.info(f"User not found: {query}")
-            return {
-                "status": "not_found",
-                "message": f"Username '{query}' not found in database",
-                "user_exists": False
-            }
+        user = await collection.find_one({"username": query}, {"_id": 0, "username": 1})
+        return _login_response(query, user)
             
     except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return {
-            "status": "error",
-            "message": f"Database error: {str(e)}",
-            "user_exists": False
-        }
-    finally:
-        if 'client' in locals():
-            client.close()
+        return _login_error(e)
+
+
+def login_enquirey_sync(query: str) -> Dict[str, Any]:
+    """
+    Blocking variant of login_enquirey for scripts; do not call it from the
+    agent's event loop.
+    """
+    try:
+        collection = get_collection('customer_service', 'users')
+        user = collection.find_one({"username": query}, {"_id": 0, "username": 1})
+        return _login_response(query, user)
+
+    except Exception as e:
+        return _login_error(e)
 
 
 
@@ -6,15 +6,19 @@ and providing information about books in the library."""
 from google.adk import Agent
 from google.adk.tools import google_search
 
+import asyncio
 import logging
 from datetime import datetime, timedelta
 from google.adk.tools import ToolContext
-from pymongo import MongoClient
 from typing import Dict, Any, List
 
+from customer_service.config import get_config
+
 logger = logging.getLogger(__name__)
 
-def inventory_operations(query: str) -> Dict[str, Any]:
+async def inventory_operations(
+    query: str, limit: int = 20, page_token: str = ""
+) -> Dict[str, Any]:
     """
     Function to fetch books from MongoDB database based on query.
     
@@ -42,66 +46,62 @@ def inventory_operations(query: str) -> Dict[str, Any]:
                - "genre:Mystery" to get books by genre
                - "author:Stephen King" to get books by author
                - "title:The Great Gatsby" to search by title
+               - "status:checked_out" to get books by status
+               - any other text for a word search over title, author and genre
+               Genre, author and title match the whole value case-insensitively
+               first, then values starting with it ("genre:Myst"), and fall
+               back to a word search when nothing matches.
+        limit: Maximum number of books to return in this page (default 20).
+        page_token: Pass the 'next_page_token' of a previous response to get
+               the following page; leave empty for the first page.
                
     Returns:
-        Dictionary with 'result' key containing list of matching books
+        Dictionary with 'result' key containing the books of this page, plus
+        'count' (books in this page), 'total' (all matching books),
+        'more_available' and 'next_page_token'. Only the fields relevant to
+        the kind of query are returned for each book.
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient('mongodb://localhost:27017/')
-        db = client['Library']
-        collection = db['Books']  # Fixed collection name to match sampleData.py
-        
-        # Parse query and build MongoDB filter
-        mongo_filter = {}
-        
-        if query.lower() == "all":
-            # Get all books
-            mongo_filter = {}
-        elif query.lower() == "available":
-            # Get only available books
-            mongo_filter = {"status": "available"}
-        elif ":" in query:
-            # Handle specific field queries
-            field, value = query.split(":", 1)
-            field = field.strip().lower()
-            value = value.strip()
-            
-            if field == "genre":
-                mongo_filter = {"genre": {"$regex": value, "$options": "i"}}
-            elif field == "author":
-                mongo_filter = {"author": {"$regex": value, "$options": "i"}}
-            elif field == "title":
-                mongo_filter = {"title": {"$regex": value, "$options": "i"}}
-            elif field == "status":
-                mongo_filter = {"status": value.lower()}
-        else:
-            # General text search across title, author, and genre
-            mongo_filter = {
-                "$or": [
-                    {"title": {"$regex": query, "$options": "i"}},
-                    {"author": {"$regex": query, "$options": "i"}},
-                    {"genre": {"$regex": query, "$options": "i"}}
-                ]
-            }
-        
-        # Fetch books
-        books = list(collection.find(mongo_filter, {'_id': 0}))
+        # The catalog modules load pymongo; imported on first use to keep
+        # it off the agent's cold start.
+        from customer_service.shared_libraries.catalog import get_books_collection_async
+        from customer_service.shared_libraries.catalog_cache import cached_fetch_page_async
+
+        collection = await get_books_collection_async()
+
+        # Fetch one page of books, bounded in count and size; repeated
+        # queries are answered from the catalog cache
+        page = await cached_fetch_page_async(collection, query, limit, page_token)
         
-        logger.info(f"Found {len(books)} books matching query: {query}")
-        return {
-            "result": books,
-            "count": len(books),
-            "query": query
-        }
+        logger.info("Found %i books matching query: %s", page["total"], query)
+        return page
             
     except Exception as e:
-        logger.error(f"Database operation failed: {str(e)}")
+        logger.error("Database operation failed: %s", e)
+        return {"result": [], "error": str(e), "query": query}
+
+
+def inventory_operations_sync(
+    query: str, limit: int = 20, page_token: str = ""
+) -> Dict[str, Any]:
+    """
+    Blocking variant of inventory_operations for scripts such as testTOOL.py.
+
+    Takes the same arguments and returns the same dictionary, using the
+    shared synchronous client. Do not call it from the agent's event loop.
+    """
+    try:
+        from customer_service.shared_libraries.catalog import get_books_collection
+        from customer_service.shared_libraries.catalog_cache import cached_fetch_page
+
+        collection = get_books_collection()
+        page = cached_fetch_page(collection, query, limit, page_token)
+        logger.info("Found %i books matching query: %s", page["total"], query)
+        return page
+
+    except Exception as e:
+        logger.error("Database operation failed: %s", e)
         return {"result": [], "error": str(e), "query": query}
-    
-    finally:
-        if 'client' in locals():
-            client.close()
 
 # Recommended book document format in MongoDB:
 # {
@@ -120,12 +120,58 @@ def inventory_operations(query: str) -> Dict[str, Any]:
 #     "last_updated": "2024-01-15T10:30:00Z"
 # }
 
+async def find_similar_books(description: str, limit: int = 5) -> Dict[str, Any]:
+    """
+    Finds the catalog books that best match a vague description.
+
+    Use it for requests such as "mystery novels with female detectives" or
+    "books like The Martian", where inventory_operations needs exact values.
+
+    Args:
+        description: Free-text description of the books wanted.
+        limit: Maximum number of books to return (default 5).
+
+    Returns:
+        Dictionary with 'result' key containing the matching books, best
+        first, each with isbn, title, author, genre, status and a similarity
+        'score', plus 'count'.
+    """
+
+    def search() -> List[Dict[str, Any]]:
+        # Loads numpy and scipy; imported on first use.
+        from customer_service.shared_libraries.vector_search import get_vector_index
+
+        return get_vector_index().search(
+            description,
+            k=max(1, min(limit, 50)),
+            nprobe=get_config().vector_search_settings.nprobe,
+        )
+
+    try:
+        # The first call imports numpy and scipy and opens the index, and a
+        # search pages in memory-mapped vectors; none of it runs on the loop.
+        books = await asyncio.to_thread(search)
+        logger.info("Found %i books similar to: %s", len(books), description)
+        return {"result": books, "count": len(books), "query": description}
+
+    except FileNotFoundError:
+        logger.error("Vector index missing; run vector_search build")
+        return {
+            "result": [],
+            "error": "The similarity index has not been built yet.",
+            "query": description,
+        }
+    except Exception as e:
+        logger.error("Similarity search failed: %s", e)
+        return {"result": [], "error": str(e), "query": description}
+
+
 MODEL = "gemini-2.0-flash"
 
 
 librarian_agent = Agent(
     model=MODEL,
     name="librarian_agent",
-    instruction="You are an agent that can assist with checking and updating inventory of books in a library. You have access to inventory_operations tool which can be used to check the inventory of books in a library. You can also use google_search tool to find information about books. Always provide helpful and accurate information about book availability, locations, and inventory status.",
-    tools=[inventory_operations],
+    instruction="You are an agent that can assist with checking and updating inventory of books in a library. You have access to inventory_operations tool which can be used to check the inventory of books in a library. You can also use google_search tool to find information about books. Always provide helpful and accurate information about book availability, locations, and inventory status. Results are paginated: only request the next page with next_page_token when the customer asks for more books. When the customer describes books vaguely (a theme, a mood, 'books like X'), use find_similar_books instead of guessing inventory_operations queries.",
+    tools=[inventory_operations, find_similar_books],
 )
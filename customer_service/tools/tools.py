@@ -1,32 +1,51 @@
 
 """Tools module for the customer service agent."""
 
+import asyncio
 import logging
-import uuid
 from datetime import datetime, timedelta
 from google.adk.tools import ToolContext
 
+from customer_service.config import get_config
+from customer_service.shared_libraries.carts import (
+    cart_view,
+    get_cart_store,
+    lookup_products,
+    parse_items,
+)
+from customer_service.entities.customer_repository import get_customer_repository
+from customer_service.shared_libraries import outbox
+from customer_service.shared_libraries.profile_cache import get_customer_profile
+from customer_service.shared_libraries.qr_codes import get_qr_renderer
+from customer_service.shared_libraries.scheduling import (
+    SlotUnavailableError,
+    get_scheduler,
+)
+
 logger = logging.getLogger(__name__)
 
 
-def send_call_companion_link(phone_number: str) -> str:
+async def send_call_companion_link(phone_number: str) -> str:
     """
     Sends a link to the user's phone number to start a video session.
 
+    The SMS is sent in the background; the call returns at once.
+
     Args:
         phone_number (str): The phone number to send the link to.
 
     Returns:
-        dict: A dictionary with the status and message.
+        dict: A dictionary with the status, message and tracking id.
 
     Example:
-        >>> send_call_companion_link(phone_number='+91-1234567890')
-        {'status': 'success', 'message': 'Link sent to +91-1234567890'}
+        >>> await send_call_companion_link(phone_number='+91-1234567890')
+        {'status': 'queued', 'tracking_id': '3f1c...', 'coalesced': False,
+         'message': 'Link is being sent to +91-1234567890'}
     """
 
-    logger.info("Sending call companion link to %s", phone_number)
-
-    return {"status": "success", "message": f"Link sent to {phone_number}"}
+    logger.info("Queueing call companion link to %s", phone_number)
+    result = await outbox.send_async("call_companion_link", {"phone_number": phone_number})
+    return {**result, "message": f"Link is being sent to {phone_number}"}
 
 
 def approve_discount(discount_type: str, value: float, reason: str) -> str:
@@ -80,35 +99,63 @@ def sync_ask_for_approval(discount_type: str, value: float, reason: str) -> str:
     return {"status": "approved"}
 
 
-def update_salesforce_crm(customer_id: str, details: dict) -> dict:
+async def update_salesforce_crm(customer_id: str, details: dict) -> dict:
     """
     Updates the Salesforce CRM with customer details.
 
+    The update is written to Salesforce in the background; updates for the
+    same customer that are still waiting are merged into one write.
+
     Args:
         customer_id (str): The ID of the customer.
         details (str): A dictionary of details to update in Salesforce.
 
     Returns:
-        dict: A dictionary with the status and message.
+        dict: A dictionary with the status, message and tracking id.
 
     Example:
-        >>> update_salesforce_crm(customer_id='123', details={
+        >>> await update_salesforce_crm(customer_id='123', details={
             'appointment_date': '2024-07-25',
             'appointment_time': '9-12',
             'services': 'Planting',
             'discount': '15% off planting',
             'qr_code': '10% off next in-store purchase'})
-        {'status': 'success', 'message': 'Salesforce record updated.'}
+        {'status': 'queued', 'tracking_id': '3f1c...', 'coalesced': False,
+         'message': 'Salesforce record update queued.'}
     """
-    logger.info(
-        "Updating Salesforce CRM for customer ID %s with details: %s",
-        customer_id,
-        details,
+    if not isinstance(details, dict):
+        details = {"notes": str(details)}
+    logger.info("Queueing Salesforce CRM update for customer ID %s", customer_id)
+    result = await outbox.send_async(
+        "crm_update",
+        {"customer_id": customer_id, "details": details},
+        coalesce_key=customer_id,
     )
-    return {"status": "success", "message": "Salesforce record updated."}
+    return {**result, "message": "Salesforce record update queued."}
+
+
+def get_customer_record(customer_id: str, tool_context: ToolContext) -> dict:
+    """
+    Retrieves the customer's full profile, including the complete purchase history.
+
+    The profile in the instructions only lists the most recent purchases and a
+    summary. Use this tool when older purchases or other details are needed.
+
+    Args:
+        customer_id (str): The ID of the customer.
+
+    Returns:
+        dict: The full customer record.
+
+    Example:
+        >>> get_customer_record(customer_id='123')
+        {'customer_id': '123', 'customer_first_name': 'Anubhob', 'purchase_history': [...], ...}
+    """
+    logger.info("Fetching full customer record for customer ID: %s", customer_id)
+    return get_customer_profile(tool_context.state).model_dump()
 
 
-def access_cart_information(customer_id: str) -> dict:
+async def access_cart_information(customer_id: str) -> dict:
     """
     Args:
         customer_id (str): The ID of the customer.
@@ -117,133 +164,148 @@ def access_cart_information(customer_id: str) -> dict:
         dict: A dictionary representing the cart contents.
 
     Example:
-        >>> access_cart_information(customer_id='123')
-        {'items': [{'product_id': 'soil-123', 'name': 'Standard Potting Soil', 'quantity': 1}, {'product_id': 'fert-456', 'name': 'General Purpose Fertilizer', 'quantity': 1}], 'subtotal': 25.98}
+        >>> await access_cart_information(customer_id='123')
+        {'items': [{'product_id': '978-0-441-17271-9', 'name': 'Dune by Frank Herbert', 'quantity': 1, 'price': 12.99}], 'subtotal': 12.99, 'version': 1}
     """
     logger.info("Accessing cart information for customer ID: %s", customer_id)
-
-    # MOCK API RESPONSE - Replace with actual API call
-    mock_cart = {
-        "items": [
-            {
-                "product_id": "book-123",
-                "name": "The Silent Patient by Alex Michaelides",
-                "quantity": 1,
-            },
-            {
-                "product_id": "book-456",
-                "name": "Atomic Habits by James Clear",
-                "quantity": 1,
-            },
-        ],
-        "subtotal": 25.98,
-    }
-    return mock_cart
+    try:
+        # The cart store, and its first-use index check, use the synchronous
+        # client; keep them off the event loop.
+        cart = await asyncio.to_thread(lambda: get_cart_store().get(customer_id))
+        return cart_view(cart)
+    except Exception as e:
+        logger.error("Cart lookup failed: %s", e)
+        return {"items": [], "error": str(e)}
 
 
-def modify_cart(
+async def modify_cart(
     customer_id: str, items_to_add: list[dict], items_to_remove: list[dict]
 ) -> dict:
     """Modifies the user's shopping cart by adding and/or removing items.
 
+    The whole modification is applied atomically and the updated cart is
+    returned, so there is no need to call access_cart_information afterwards.
+
     Args:
         customer_id (str): The ID of the customer.
         items_to_add (list): A list of dictionaries, each with 'product_id' and 'quantity'.
-        items_to_remove (list): A list of product_ids to remove.
+        items_to_remove (list): A list of dictionaries, each with 'product_id'
+            and optionally 'quantity'; without a quantity the item is removed
+            entirely.
 
     Returns:
-        dict: A dictionary indicating the status of the cart modification.
+        dict: A dictionary with the status of the cart modification and the updated cart.
     Example:
-        >>> modify_cart(customer_id='123', items_to_add=[{'product_id': 'soil-456', 'quantity': 1}, {'product_id': 'fert-789', 'quantity': 1}], items_to_remove=[{'product_id': 'fert-112', 'quantity': 1}])
-        {'status': 'success', 'message': 'Cart updated successfully.', 'items_added': True, 'items_removed': True}
+        >>> await modify_cart(customer_id='123', items_to_add=[{'product_id': '978-0-441-17271-9', 'quantity': 1}], items_to_remove=[{'product_id': '978-0-553-41802-6'}])
+        {'status': 'success', 'message': 'Cart updated successfully.', 'items_added': True, 'items_removed': True, 'cart': {'items': [...], 'subtotal': 12.99, 'version': 2}}
     """
 
-    logger.info("Modifying cart for customer ID: %s", customer_id)
-    logger.info("Adding items: %s", items_to_add)
-    logger.info("Removing items: %s", items_to_remove)
-    # MOCK API RESPONSE - Replace with actual API call
+    logger.info(
+        "Modifying cart for customer ID: %s (adding %s, removing %s)",
+        customer_id,
+        items_to_add,
+        items_to_remove,
+    )
+    try:
+        add = parse_items(items_to_add or [])
+        remove = parse_items(items_to_remove or [], default_quantity=None)
+    except (AttributeError, TypeError, ValueError) as e:
+        return {"status": "error", "message": str(e)}
+
+    try:
+        products = await asyncio.to_thread(lookup_products, list(add))
+        not_found = [product_id for product_id in add if product_id not in products]
+        if not_found:
+            return {
+                "status": "error",
+                "message": f"Unknown product IDs: {', '.join(not_found)}",
+            }
+        cart = await asyncio.to_thread(
+            lambda: get_cart_store().modify(customer_id, add, remove, products)
+        )
+    except Exception as e:
+        logger.error("Cart update failed: %s", e)
+        return {"status": "error", "message": str(e)}
     return {
         "status": "success",
         "message": "Cart updated successfully.",
-        "items_added": True,
-        "items_removed": True,
+        "items_added": bool(add),
+        "items_removed": bool(remove),
+        "cart": cart_view(cart),
     }
 
 
-def get_book_recommendations(book_genre: str, customer_id: str) -> dict:
+async def get_book_recommendations(
+    book_genre: str, customer_id: str, tool_context: ToolContext
+) -> dict:
     """Provides book recommendations based on the genre or topic of interest.
 
     Args:
         book_genre: The genre or topic of interest (e.g., 'Mystery', 'Science Fiction', 'Self-help').
         customer_id: Optional customer ID for personalized recommendations.
+        tool_context: The tool context.
 
     Returns:
         A dictionary of recommended books. Example:
         {'recommendations': [
-            {'product_id': 'book-456', 'name': 'Gone Girl by Gillian Flynn', 'description': '...'},
-            {'product_id': 'book-789', 'name': 'The Girl with the Dragon Tattoo', 'description': '...'}
+            {'product_id': '978-0-307-58836-4', 'name': 'Gone Girl by Gillian Flynn', 'genre': 'Mystery', 'status': 'available'},
+            {'product_id': '978-0-307-45454-1', 'name': 'The Girl with the Dragon Tattoo by Stieg Larsson', 'genre': 'Mystery', 'status': 'available'}
         ]}
+        Books the customer already owns or has in the cart are left out.
     """
-    #
     logger.info(
         "Getting book recommendations for genre " "type: %s and customer %s",
         book_genre,
         customer_id,
     )
-    # MOCK API RESPONSE - Replace with actual API call or recommendation engine
-    if book_genre.lower() == "mystery":
-        recommendations = {
-            "recommendations": [
-                {
-                    "product_id": "book-456",
-                    "name": "Gone Girl by Gillian Flynn",
-                    "description": "A psychological thriller that will keep you guessing.",
-                },
-                {
-                    "product_id": "book-789",
-                    "name": "The Girl with the Dragon Tattoo by Stieg Larsson",
-                    "description": "A gripping Nordic noir mystery series.",
-                },
-            ]
-        }
-    elif book_genre.lower() == "science fiction":
-        recommendations = {
-            "recommendations": [
-                {
-                    "product_id": "book-sci1",
-                    "name": "Dune by Frank Herbert",
-                    "description": "A classic science fiction epic.",
-                },
-                {
-                    "product_id": "book-sci2",
-                    "name": "The Martian by Andy Weir",
-                    "description": "A thrilling survival story on Mars.",
-                },
-            ]
-        }
-    else:
-        recommendations = {
-            "recommendations": [
-                {
-                    "product_id": "book-123",
-                    "name": "Educated by Tara Westover",
-                    "description": "A powerful memoir about education and family.",
-                },
-                {
-                    "product_id": "book-456",
-                    "name": "Atomic Habits by James Clear",
-                    "description": "A practical guide to building good habits.",
-                },
-            ]
-        }
-    return recommendations
-
-
-def check_product_availability(product_id: str, store_id: str) -> dict:
+    owned: list[str] = []
+    favorite_authors: list[str] = []
+    # before_tool_callback has checked customer_id against the profile in
+    # the session, so no store lookup is needed.
+    customer = None
+    if customer_id and "customer_profile" in tool_context.state:
+        customer = get_customer_profile(tool_context.state)
+    if customer is not None:
+        for purchase in customer.purchase_history:
+            for item in purchase.items:
+                owned.extend((item.product_id, item.name))
+        favorite_authors = customer.reading_profile.favorite_authors
+    in_cart = []
+    if customer_id:
+        cart = await access_cart_information(customer_id)
+        for item in cart.get("items", []):
+            in_cart.extend((item["product_id"], item.get("name", "")))
+
+    def lookup() -> list:
+        # Loads numpy and scipy; imported on first use to keep them off the
+        # agent's cold start.
+        from customer_service.shared_libraries.recommendations import (
+            get_recommendation_engine,
+        )
+
+        return get_recommendation_engine().recommend(
+            book_genre,
+            owned=owned,
+            favorite_authors=favorite_authors,
+            exclude=in_cart,
+            k=get_config().recommendation_settings.results,
+        )
+
+    try:
+        # The import and, on the first call, the engine build take a while;
+        # both run off the event loop.
+        recommendations = await asyncio.to_thread(lookup)
+    except Exception as e:
+        logger.error("Recommendation lookup failed: %s", e)
+        return {"recommendations": [], "error": str(e)}
+    return {"recommendations": recommendations}
+
+
+async def check_product_availability(product_id: str, store_id: str) -> dict:
     """Checks the availability of a book at a specified store or library.
 
     Args:
-        product_id: The ID of the book to check.
+        product_id: The ID (ISBN) of the book to check.
         store_id: The ID of the store/library (or 'pickup' for pickup availability).
 
     Returns:
@@ -251,7 +313,7 @@ def check_product_availability(product_id: str, store_id: str) -> dict:
         {'available': True, 'quantity': 10, 'store': 'Main Library'}
 
     Example:
-        >>> check_product_availability(product_id='book-456', store_id='pickup')
+        >>> await check_product_availability(product_id='978-0-307-58836-4', store_id='pickup')
         {'available': True, 'quantity': 10, 'store': 'pickup'}
     """
     logger.info(
@@ -259,102 +321,263 @@ def check_product_availability(product_id: str, store_id: str) -> dict:
         product_id,
         store_id,
     )
-    # MOCK API RESPONSE - Replace with actual API call
-    return {"available": True, "quantity": 10, "store": store_id}
+    matrix = await check_products_availability([product_id], [store_id])
+    if "error" in matrix:
+        return {"available": False, "store": store_id, "error": matrix["error"]}
+    if not matrix["products"]:
+        return {
+            "available": False,
+            "store": store_id,
+            "error": f"Unknown product ID: {product_id}",
+        }
+    quantity = matrix["quantity"][0][0]
+    return {"available": quantity > 0, "quantity": quantity, "store": store_id}
+
+
+async def check_products_availability(product_ids: list[str], store_ids: list[str]) -> dict:
+    """Checks the availability of several books at several stores at once.
 
+    Prefer this over repeated check_product_availability calls, e.g. to check
+    every item of a cart plus a list of recommendations in one step.
 
-def schedule_reading_consultation(
-    customer_id: str, date: str, time_range: str, details: str
+    Args:
+        product_ids: The IDs (ISBNs) of the books to check.
+        store_ids: The IDs of the stores/libraries (or 'pickup').
+
+    Returns:
+        A compact matrix where quantity[i][j] is the stock of products[i] at
+        stores[j]; IDs not in the catalog are listed in not_found. Example:
+        {'products': ['978-0-441-17271-9', '978-0-553-41802-6'],
+         'stores': ['pickup', 'downtown'],
+         'quantity': [[3, 3], [0, 0]],
+         'not_found': []}
+    """
+    logger.info(
+        "Checking availability of %i books at %i stores",
+        len(product_ids),
+        len(store_ids),
+    )
+    max_products = get_config().catalog_settings.max_page_size
+    if len(product_ids) > max_products:
+        return {"error": f"At most {max_products} products can be checked at once"}
+    try:
+        from customer_service.shared_libraries.catalog import (
+            fetch_availability_async,
+            get_books_collection_async,
+        )
+
+        return await fetch_availability_async(
+            await get_books_collection_async(), product_ids, store_ids
+        )
+    except Exception as e:
+        logger.error("Availability lookup failed: %s", e)
+        return {"error": str(e)}
+
+
+async def schedule_reading_consultation(
+    customer_id: str,
+    date: str,
+    time_range: str,
+    details: str,
+    tool_context: ToolContext,
+    store_id: str = "",
 ) -> dict:
     """Schedules a reading consultation appointment.
 
+    The booking is only confirmed if a consultant is free for the whole time
+    range; otherwise nothing is booked and the next free times are returned.
+
     Args:
         customer_id: The ID of the customer.
         date:  The desired date (YYYY-MM-DD).
-        time_range: The desired time range (e.g., "9-12").
+        time_range: The desired time range (e.g., "9-10" or "13:30-14:30").
         details: Any additional details (e.g., "Book recommendations for mystery novels").
+        store_id: The store for the consultation; empty for the default store.
 
     Returns:
         A dictionary indicating the status of the scheduling. Example:
-        {'status': 'success', 'appointment_id': '12345', 'date': '2024-07-29', 'time': '9:00 AM - 12:00 PM'}
+        {'status': 'success', 'appointment_id': '12345', 'date': '2024-07-29', 'time': '9-10', 'confirmation_time': '2024-07-29 9:00'}
 
     Example:
-        >>> schedule_reading_consultation(customer_id='123', date='2024-07-29', time_range='9-12', details='Book recommendations for mystery novels')
-        {'status': 'success', 'appointment_id': 'some_uuid', 'date': '2024-07-29', 'time': '9-12', 'confirmation_time': '2024-07-29 9:00'}
+        >>> await schedule_reading_consultation(customer_id='123', date='2024-07-29', time_range='9-10', details='Book recommendations for mystery novels')
+        {'status': 'success', 'appointment_id': 'some_uuid', 'date': '2024-07-29', 'time': '9-10', 'confirmation_time': '2024-07-29 9:00'}
     """
     logger.info(
-        "Scheduling reading consultation for customer ID: %s on %s (%s)",
+        "Scheduling reading consultation for customer ID: %s on %s (%s): %s",
         customer_id,
         date,
         time_range,
+        details,
     )
-    logger.info("Details: %s", details)
-    # MOCK API RESPONSE - Replace with actual API call to your scheduling system
-    # Calculate confirmation time based on date and time_range
-    start_time_str = time_range.split("-")[0]  # Get the start time (e.g., "9")
-    confirmation_time_str = (
-        f"{date} {start_time_str}:00"  # e.g., "2024-07-29 9:00"
+    store_id = store_id or get_config().scheduling_settings.default_store
+    try:
+        # The slot store and the customer repository use the synchronous
+        # client, so every call to them runs off the event loop.
+        scheduler = await asyncio.to_thread(get_scheduler)
+        booked = await asyncio.to_thread(
+            scheduler.reserve, store_id, customer_id, date, time_range, details
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    except SlotUnavailableError as e:
+        try:
+            next_available = await asyncio.to_thread(
+                scheduler.next_free,
+                store_id,
+                count=3,
+                start=datetime.strptime(date, "%Y-%m-%d").date(),
+            )
+        except Exception as lookup_error:
+            logger.error("Consultation slot search failed: %s", lookup_error)
+            next_available = []
+        return {
+            "status": "unavailable",
+            "message": str(e),
+            "next_available": next_available,
+        }
+    except Exception as e:
+        logger.error("Consultation booking failed: %s", e)
+        return {"status": "error", "message": str(e)}
+
+    appointment_id = booked["appointment_id"]
+    appointment = {
+        "date": date,
+        "time": booked["time"],
+        "store_id": store_id,
+        "details": details,
+    }
+    try:
+        if not await asyncio.to_thread(
+            lambda: get_customer_repository().add_appointment(
+                customer_id, appointment_id, appointment
+            )
+        ):
+            raise LookupError(f"Unknown customer ID: {customer_id}")
+    except Exception as e:
+        # Do not keep a slot that is not recorded on any customer.
+        await asyncio.to_thread(scheduler.release, booked)
+        logger.error("Could not record appointment %s: %s", appointment_id, e)
+        return {"status": "error", "message": str(e)}
+
+    # Keep the profile in the session (and so the prompt) in step.
+    profile = get_customer_profile(tool_context.state)
+    profile = profile.model_copy(
+        update={
+            "scheduled_appointments": {
+                **profile.scheduled_appointments,
+                appointment_id: appointment,
+            }
+        }
+    )
+    tool_context.state["customer_profile"] = profile.to_json(
+        indent=None if get_config().profile_settings.compact_state else 4
     )
 
     return {
         "status": "success",
-        "appointment_id": str(uuid.uuid4()),
+        "appointment_id": appointment_id,
         "date": date,
-        "time": time_range,
-        "confirmation_time": confirmation_time_str,  # formatted time for calendar
+        "time": booked["time"],
+        "confirmation_time": f"{date} {booked['start']}",  # e.g. "2024-07-29 9:00"
     }
 
 
-def get_available_consultation_times(date: str) -> list:
+async def get_available_consultation_times(
+    date: str, store_id: str = ""
+) -> list | dict:
     """Retrieves available reading consultation time slots for a given date.
 
     Args:
         date: The date to check (YYYY-MM-DD).
+        store_id: The store to check; empty for the default store.
 
     Returns:
-        A list of available time ranges.
+        A list of available time ranges, or {'status': 'error', 'message'}
+        if the date is invalid or the schedule cannot be read.
 
     Example:
-        >>> get_available_consultation_times(date='2024-07-29')
-        ['9-12', '13-16']
+        >>> await get_available_consultation_times(date='2024-07-29')
+        ['9-10', '9:30-10:30', '10-11', '14-15']
     """
     logger.info("Retrieving available consultation times for %s", date)
-    # MOCK API RESPONSE - Replace with actual API call
-    # Generate some mock time slots, ensuring they're in the correct format:
-    return ["9-12", "13-16"]
+    store_id = store_id or get_config().scheduling_settings.default_store
+    try:
+        return await asyncio.to_thread(
+            lambda: get_scheduler().available(store_id, date)
+        )
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+    except Exception as e:
+        logger.error("Consultation time lookup failed: %s", e)
+        return {"status": "error", "message": str(e)}
+
+
+async def find_next_consultation_slots(count: int = 5, store_id: str = "") -> dict:
+    """Finds the earliest free reading consultation times in the next two weeks.
+
+    Use this when the customer has no particular date in mind.
 
+    Args:
+        count: How many times to return (default 5).
+        store_id: The store to check; empty for the default store.
 
-def send_reading_recommendations(
+    Returns:
+        A dictionary with the free times, earliest first. Example:
+        {'slots': [{'date': '2024-07-29', 'time_range': '9-10'},
+                   {'date': '2024-07-29', 'time_range': '9:30-10:30'}]}
+    """
+    logger.info("Finding the next %s free consultation times", count)
+    store_id = store_id or get_config().scheduling_settings.default_store
+    try:
+        slots = await asyncio.to_thread(
+            lambda: get_scheduler().next_free(store_id, count=max(1, min(count, 20)))
+        )
+        return {"slots": slots}
+    except Exception as e:
+        logger.error("Consultation slot search failed: %s", e)
+        return {"slots": [], "error": str(e)}
+
+
+async def send_reading_recommendations(
     customer_id: str, reading_interests: str, delivery_method: str
 ) -> dict:
     """Sends an email or SMS with personalized reading recommendations and book care tips.
 
+    The message is sent in the background; the call returns at once.
+
     Args:
         customer_id:  The ID of the customer.
         reading_interests: The customer's reading interests or preferred genres.
         delivery_method: 'email' (default) or 'sms'.
 
     Returns:
-        A dictionary indicating the status.
+        A dictionary indicating the status and the tracking id.
 
     Example:
-        >>> send_reading_recommendations(customer_id='123', reading_interests='Mystery novels', delivery_method='email')
-        {'status': 'success', 'message': 'Reading recommendations for Mystery novels sent via email.'}
+        >>> await send_reading_recommendations(customer_id='123', reading_interests='Mystery novels', delivery_method='email')
+        {'status': 'queued', 'tracking_id': '3f1c...', 'coalesced': False, 'message': 'Reading recommendations for Mystery novels will be sent via email.'}
     """
     logger.info(
-        "Sending reading recommendations for %s to customer: %s via %s",
+        "Queueing reading recommendations for %s to customer: %s via %s",
         reading_interests,
         customer_id,
         delivery_method,
     )
-    # MOCK API RESPONSE - Replace with actual API call or email/SMS sending logic
+    result = await outbox.send_async(
+        "reading_recommendations",
+        {
+            "customer_id": customer_id,
+            "reading_interests": reading_interests,
+            "delivery_method": delivery_method,
+        },
+    )
     return {
-        "status": "success",
-        "message": f"Reading recommendations for {reading_interests} sent via {delivery_method}.",
+        **result,
+        "message": f"Reading recommendations for {reading_interests} will be sent via {delivery_method}.",
     }
 
 
-def generate_qr_code(
+async def generate_qr_code(
     customer_id: str,
     discount_value: float,
     discount_type: str,
@@ -362,6 +585,9 @@ def generate_qr_code(
 ) -> dict:
     """Generates a QR code for a discount.
 
+    The QR code encodes a signed discount token and is rendered in a
+    background process pool; codes already issued are served from a cache.
+
     Args:
         customer_id: The ID of the customer.
         discount_value: The value of the discount (e.g., 10 for 10%).
@@ -369,12 +595,14 @@ def generate_qr_code(
         expiration_days: Number of days until the QR code expires.
 
     Returns:
-        A dictionary containing the QR code data (or a link to it). Example:
-        {'status': 'success', 'qr_code_data': '...', 'expiration_date': '2024-08-28'}
+        A dictionary containing the QR code (a file path or a data URI,
+        depending on qr_code_settings.output) and its token. Example:
+        {'status': 'success', 'qr_code_data': '/tmp/library_service_qr_codes/2024-08-28-5d0e....png',
+         'token': 'LD1....', 'expiration_date': '2024-08-28'}
 
     Example:
-        >>> generate_qr_code(customer_id='123', discount_value=10.0, discount_type='percentage', expiration_days=30)
-        {'status': 'success', 'qr_code_data': 'MOCK_QR_CODE_DATA', 'expiration_date': '2024-08-24'}
+        >>> await generate_qr_code(customer_id='123', discount_value=10.0, discount_type='percentage', expiration_days=30)
+        {'status': 'success', 'qr_code_data': '/tmp/library_service_qr_codes/2024-08-24-5d0e....png', 'token': 'LD1....', 'expiration_date': '2024-08-24'}
     """
     
     # Guardrails to validate the amount of discount is acceptable for a auto-approved discount.
@@ -385,6 +613,8 @@ def generate_qr_code(
             return "cannot generate a QR code for this amount, must be 10% or less"
     if discount_type == "fixed" and discount_value > 20:
         return "cannot generate a QR code for this amount, must be 20 or less"
+    if discount_type not in ("", "percentage", "fixed"):
+        return {"status": "error", "message": f"Unknown discount type: {discount_type}"}
     
     logger.info(
         "Generating QR code for customer: %s with %s - %s discount.",
@@ -392,12 +622,20 @@ def generate_qr_code(
         discount_value,
         discount_type,
     )
-    # MOCK API RESPONSE - Replace with actual QR code generation library
-    expiration_date = (
-        datetime.now() + timedelta(days=expiration_days)
-    ).strftime("%Y-%m-%d")
+    expiration_date = (datetime.now() + timedelta(days=expiration_days)).date()
+    try:
+        token, qr_code_data = await get_qr_renderer().generate(
+            customer_id,
+            discount_value,
+            discount_type or "percentage",
+            expiration_date,
+        )
+    except Exception as e:
+        logger.error("Error generating QR code for customer %s: %s", customer_id, e)
+        return {"status": "error", "message": "Could not generate the QR code."}
     return {
         "status": "success",
-        "qr_code_data": "MOCK_QR_CODE_DATA",  # Replace with actual QR code
-        "expiration_date": expiration_date,
+        "qr_code_data": qr_code_data,
+        "token": token,
+        "expiration_date": expiration_date.isoformat(),
     }
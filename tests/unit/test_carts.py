@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import mongomock
+import pytest
+
+from customer_service.shared_libraries.carts import InMemoryCartStore, MongoCartStore
+from customer_service.tools import tools
+
+DUNE = "978-0-441-17271-9"
+PRODUCTS = {DUNE: ("Dune by Frank Herbert", 1299)}
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().customer_service.carts
+
+
+def test_removal_after_another_store_added_the_item(collection):
+    ours, theirs = MongoCartStore(collection), MongoCartStore(collection)
+    assert ours.get("123")["items"] == {}
+
+    theirs.modify("123", {DUNE: 1}, {}, PRODUCTS)
+    # Against our snapshot the item is not in the cart, so there is
+    # nothing to remove; the stored cart says otherwise.
+    cart = ours.modify("123", {}, {DUNE: None}, PRODUCTS)
+
+    assert cart["items"] == {}
+    assert collection.find_one({"customer_id": "123"})["items"] == {}
+
+
+def test_no_op_returns_the_stored_cart(collection):
+    ours, theirs = MongoCartStore(collection), MongoCartStore(collection)
+    ours.get("123")
+    theirs.modify("123", {DUNE: 2}, {}, PRODUCTS)
+
+    cart = ours.modify("123", {}, {}, PRODUCTS)
+
+    assert cart["items"][DUNE]["quantity"] == 2
+    assert cart["version"] == 1
+    assert ours.snapshots.get("123")["version"] == 1
+
+
+def test_tools_use_the_store_off_the_event_loop(monkeypatch):
+    store = InMemoryCartStore()
+    threads = []
+    load = store._load
+
+    def recording_load(customer_id):
+        threads.append(threading.current_thread())
+        return load(customer_id)
+
+    monkeypatch.setattr(store, "_load", recording_load)
+    monkeypatch.setattr(tools, "get_cart_store", lambda: store)
+    monkeypatch.setattr(tools, "lookup_products", lambda ids: PRODUCTS)
+
+    async def main():
+        await tools.modify_cart("123", [{"product_id": DUNE, "quantity": 2}], [])
+        return await tools.access_cart_information("123")
+
+    cart = asyncio.run(main())
+
+    assert cart["items"][0]["quantity"] == 2
+    assert threads and threading.main_thread() not in threads
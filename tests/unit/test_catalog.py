@@ -0,0 +1,133 @@
+import asyncio
+
+import mongomock
+import pytest
+
+from customer_service.shared_libraries.catalog import (
+    CASE_INSENSITIVE,
+    QueryPlanError,
+    build_catalog_query,
+    ensure_indexes,
+    fetch_availability,
+    fetch_availability_async,
+    verify_query_plans,
+)
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def to_list(self):
+        return list(self._cursor)
+
+
+class AsyncBooks:
+    """mongomock behind the async find() of pymongo's AsyncCollection."""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+
+@pytest.fixture
+def books():
+    collection = mongomock.MongoClient().Library.Books
+    collection.insert_many(
+        [
+            {"isbn": "978-0-441-17271-9", "quantity_available": 3},
+            {
+                "isbn": "978-0-553-41802-6",
+                "quantity_available": 9,
+                "store_quantities": {"downtown": 2},
+            },
+        ]
+    )
+    return collection
+
+
+def test_duplicate_isbns_do_not_block_the_other_indexes(books):
+    books.insert_one({"isbn": "978-0-441-17271-9", "quantity_available": 1})
+
+    names = ensure_indexes(books)
+
+    assert "isbn_1" not in names
+    assert {"genre_ci__id", "author_ci__id", "status_1__id_1"} <= set(
+        books.index_information()
+    )
+
+
+def test_unique_isbn_index_is_built_on_a_clean_catalog(books):
+    assert "isbn_1" in ensure_indexes(books)
+
+
+def test_async_availability_matches_sync(books):
+    product_ids = ["978-0-441-17271-9", "978-0-553-41802-6", "978-0-000-00000-0"]
+    store_ids = ["pickup", "downtown", "pickup"]
+
+    result = asyncio.run(fetch_availability_async(AsyncBooks(books), product_ids, store_ids))
+
+    assert result == fetch_availability(books, product_ids, store_ids)
+    assert result["quantity"] == [[3, 3], [0, 2]]
+    assert result["not_found"] == ["978-0-000-00000-0"]
+
+
+class PlannedCursor:
+    def __init__(self, stages, sorted_stages):
+        self._stages, self._sorted_stages = stages, sorted_stages
+        self._sorted = False
+
+    def sort(self, *args):
+        self._sorted = True
+        return self
+
+    def explain(self):
+        plan = None
+        for stage in reversed(self._sorted_stages if self._sorted else self._stages):
+            plan = {"stage": stage, **({"inputStage": plan} if plan else {})}
+        return {"queryPlanner": {"winningPlan": plan}}
+
+
+class PlannedBooks:
+    """Answers explain() with a fixed plan, sorted pages with sorted_stages."""
+
+    def __init__(self, sorted_stages):
+        self._sorted_stages = sorted_stages
+
+    def find(self, *args, **kwargs):
+        return PlannedCursor(["FETCH", "IXSCAN"], self._sorted_stages)
+
+
+def test_index_ordered_pages_pass_plan_verification():
+    plans = verify_query_plans(PlannedBooks(["FETCH", "IXSCAN"]))
+
+    assert all("SORT" not in stages for stages in plans.values())
+
+
+def test_in_memory_sort_of_a_genre_page_is_a_regression():
+    with pytest.raises(QueryPlanError, match="genre"):
+        verify_query_plans(PlannedBooks(["SORT", "FETCH", "IXSCAN"]))
+
+
+def test_field_queries_fall_back_to_a_collated_prefix_range():
+    exact, prefix, words = build_catalog_query("author: Osm").shapes()
+
+    assert exact.filter == {"author": "Osm"}
+    assert prefix.filter == {"author": {"$gte": "Osm", "$lt": "Osm\uffff"}}
+    assert prefix.collation == CASE_INSENSITIVE
+    assert "$text" in words.filter
+
+
+def test_prefix_pages_may_be_sorted_after_matching():
+    class SortedRanges(PlannedBooks):
+        def find(self, shape_filter, **kwargs):
+            ranged = any(isinstance(v, dict) for v in shape_filter.values())
+            return PlannedCursor(
+                ["FETCH", "IXSCAN"], self._sorted_stages if ranged else ["FETCH", "IXSCAN"]
+            )
+
+    plans = verify_query_plans(SortedRanges(["SORT", "FETCH", "IXSCAN"]))
+
+    assert "'genre:Mystery' (genre, genre)" in plans
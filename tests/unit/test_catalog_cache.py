@@ -0,0 +1,47 @@
+import pytest
+
+from customer_service.shared_libraries import catalog_cache
+from customer_service.shared_libraries.cache import TTLCache
+
+
+def test_set_with_an_old_generation_is_dropped():
+    cache = TTLCache()
+    generation = cache.generation
+    cache.clear()
+
+    assert cache.set("key", "stale", generation=generation) is False
+    assert cache.get("key") is None
+    assert cache.set("key", "fresh", generation=cache.generation) is True
+    assert cache.get("key") == "fresh"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(catalog_cache, "_ensure_invalidator", lambda: None)
+    catalog_cache.catalog_cache.clear()
+    yield catalog_cache.catalog_cache
+    catalog_cache.catalog_cache.clear()
+
+
+def test_page_read_across_an_invalidation_is_not_cached(cache, monkeypatch):
+    def fetch_page(collection, query, limit, page_token):
+        # The catalog changes while the page is being read.
+        cache.clear()
+        return {"books": ["old"], "query": query}
+
+    monkeypatch.setattr(catalog_cache, "fetch_page", fetch_page)
+
+    page = catalog_cache.cached_fetch_page(None, "genre:fantasy")
+
+    assert page["books"] == ["old"]
+    assert len(cache) == 0
+
+
+def test_page_read_without_an_invalidation_is_cached(cache, monkeypatch):
+    monkeypatch.setattr(
+        catalog_cache, "fetch_page", lambda *args: {"books": ["new"], "query": args[1]}
+    )
+
+    catalog_cache.cached_fetch_page(None, "genre:fantasy")
+
+    assert len(cache) == 1
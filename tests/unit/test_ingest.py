@@ -0,0 +1,92 @@
+"""Tests for duplicate handling and resuming in the streaming ingester."""
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+
+from customer_service.config import IngestModel
+from customer_service.shared_libraries.ingest import Ingestor
+
+
+class Books:
+    """
+    A mongomock collection that writes older rows more slowly, so batches
+    written concurrently finish in reverse order.
+    """
+
+    def __init__(self, fail_on_call=None):
+        self.collection = mongomock.MongoClient().db.books
+        self.written = []
+        self.calls = 0
+        self.fail_on_call = fail_on_call
+        self._lock = threading.Lock()
+
+    def bulk_write(self, operations, ordered):
+        with self._lock:
+            self.calls += 1
+            if self.calls == self.fail_on_call:
+                raise ConnectionError("server went away")
+        edition = min(_edition(op._doc["$set"]["title"]) for op in operations)
+        time.sleep(max(0, 30 - edition) * 0.002)
+        # mongomock's bulk_write does not accept current pymongo operations.
+        with self._lock:
+            result = SimpleNamespace(upserted_count=0, modified_count=0, matched_count=0)
+            for op in operations:
+                self.written.append(op._filter["isbn"])
+                update = self.collection.update_one(op._filter, op._doc, upsert=op._upsert)
+                result.matched_count += update.matched_count
+                result.modified_count += update.modified_count
+                result.upserted_count += update.upserted_id is not None
+            return result
+
+
+def _edition(title):
+    # "edition 12" -> 12; other titles are written without delay.
+    number = title.rsplit(" ", 1)[-1]
+    return int(number) if title.startswith("edition ") else 30
+
+
+def book(isbn, title):
+    return {"isbn": isbn, "title": title, "author": "A. Writer"}
+
+
+def write_feed(path, rows):
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    return str(path)
+
+
+def test_last_row_of_a_repeated_isbn_wins_across_batches(tmp_path):
+    isbns = [f"978-0-00-{i:06d}-0" for i in range(10)]
+    rows = [book(isbn, f"edition {n}") for n in range(30) for isbn in isbns]
+    path = write_feed(tmp_path / "books.jsonl", rows)
+    books = Books()
+
+    stats = Ingestor(books, IngestModel(batch_size=4, writers=4)).run(path)
+
+    assert stats.rows == 300 and stats.failed == 0
+    titles = {doc["isbn"]: doc["title"] for doc in books.collection.find()}
+    assert titles == {isbn: "edition 29" for isbn in isbns}
+
+
+def test_a_failed_run_resumes_after_the_last_written_batch(tmp_path):
+    rows = [book(f"978-0-00-{i:06d}-0", f"title {i}") for i in range(20)]
+    path = write_feed(tmp_path / "books.jsonl", rows)
+    settings = IngestModel(batch_size=5, writers=1, checkpoint_interval_secs=0)
+    failing = Books(fail_on_call=3)
+
+    with pytest.raises(ConnectionError):
+        Ingestor(failing, settings).run(path)
+
+    books = Books()
+    books.collection = failing.collection
+    stats = Ingestor(books, settings).run(path)
+
+    # The two batches written before the failure are not sent again.
+    assert stats.resumed_from == len("".join(json.dumps(r) + "\n" for r in rows[:10]))
+    assert books.written == [row["isbn"] for row in rows[10:]]
+    assert books.collection.count_documents({}) == 20
+    assert not (tmp_path / "books.jsonl.checkpoint.json").exists()
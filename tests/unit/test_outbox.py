@@ -0,0 +1,127 @@
+"""Tests for the outbox's per-key ordering and coalescing."""
+
+import asyncio
+import tempfile
+import threading
+
+import pytest
+
+from customer_service.config import OutboxModel
+from customer_service.shared_libraries import outbox
+from customer_service.shared_libraries.outbox import Outbox, OutboxStore
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return OutboxStore(str(tmp_path / "outbox.sqlite3"), clock=clock)
+
+
+@pytest.fixture
+def delivered(monkeypatch):
+    calls = []
+    failures = []
+
+    def handler(payload):
+        if failures:
+            raise failures.pop(0)
+        calls.append(payload["details"])
+
+    monkeypatch.setitem(outbox.HANDLERS, "crm_update", handler)
+    return calls, failures
+
+
+def crm(details):
+    return {"customer_id": "123", "details": details}
+
+
+def test_update_queued_behind_a_failed_one_is_not_delivered_first(
+    store, clock, delivered
+):
+    calls, failures = delivered
+    box = Outbox(store, OutboxModel(backoff_base_secs=10, backoff_max_secs=10))
+    store.enqueue("crm_update", crm({"email": "old"}), coalesce_key="123")
+    (first,) = store.claim(10, lease_secs=60)
+    # A newer update arrives while the first one is being delivered.
+    newer = store.enqueue("crm_update", crm({"email": "new"}), coalesce_key="123")
+    assert not newer["coalesced"]
+
+    failures.append(ConnectionError("Salesforce unavailable"))
+    box.deliver(first)
+    assert calls == []
+    # The newer update waits for the retry instead of overtaking it.
+    assert store.claim(10, lease_secs=60) == []
+
+    clock.now += 11
+    (retry,) = store.claim(10, lease_secs=60)
+    box.deliver(retry)
+    assert calls == [{"email": "new"}]
+    assert store.status(newer["tracking_id"])["status"] == outbox.COALESCED
+    assert store.claim(10, lease_secs=60) == []
+
+
+def test_updates_merge_into_a_waiting_retry(store, clock, delivered):
+    calls, failures = delivered
+    box = Outbox(store, OutboxModel(backoff_base_secs=10, backoff_max_secs=10))
+    store.enqueue("crm_update", crm({"email": "old"}), coalesce_key="123")
+    failures.append(ConnectionError("Salesforce unavailable"))
+    box.deliver(store.claim(10, lease_secs=60)[0])
+
+    queued = store.enqueue("crm_update", crm({"phone": "555"}), coalesce_key="123")
+    assert queued["coalesced"]
+    clock.now += 11
+    assert box.drain_once() == 1
+    assert calls == [{"email": "old", "phone": "555"}]
+
+
+def test_other_keys_are_not_held_back(store, delivered):
+    store.enqueue("crm_update", crm({"email": "a"}), coalesce_key="123")
+    store.claim(10, lease_secs=60)
+    store.enqueue("crm_update", crm({"email": "b"}), coalesce_key="456")
+    assert [m["payload"]["details"] for m in store.claim(10, lease_secs=60)] == [
+        {"email": "b"}
+    ]
+
+
+def test_tools_enqueue_off_the_event_loop(store, monkeypatch):
+    from customer_service.tools import tools
+
+    box = Outbox(store, OutboxModel())
+    threads = []
+    enqueue = box.enqueue
+
+    def recording_enqueue(*args, **kwargs):
+        threads.append(threading.get_ident())
+        return enqueue(*args, **kwargs)
+
+    monkeypatch.setattr(box, "enqueue", recording_enqueue)
+    monkeypatch.setattr(outbox, "get_outbox", lambda: box)
+
+    async def main():
+        result = await tools.update_salesforce_crm("123", {"email": "a"})
+        return result, threading.get_ident()
+
+    result, loop_thread = asyncio.run(main())
+    assert result["status"] == "queued"
+    assert threads and loop_thread not in threads
+
+
+def test_default_path_survives_reboots(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+    OutboxStore(OutboxModel().path)
+    assert (tmp_path / "state" / "library_service" / "outbox.sqlite3").exists()
+
+    monkeypatch.delenv("XDG_STATE_HOME")
+    assert not OutboxModel().path.startswith(tempfile.gettempdir())
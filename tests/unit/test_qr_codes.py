@@ -0,0 +1,49 @@
+import asyncio
+import os
+import signal
+from datetime import date
+
+import pytest
+
+from customer_service.config import QRCodeModel
+from customer_service.shared_libraries.qr_codes import QRCodeRenderer, verify_token
+
+KEY = b"test-key"
+
+
+@pytest.fixture
+def renderer(tmp_path):
+    renderer = QRCodeRenderer(
+        QRCodeModel(output_dir=str(tmp_path), workers=1, mask_pattern=0), KEY
+    )
+    yield renderer
+    renderer.shutdown()
+
+
+def test_render_recovers_from_a_broken_pool(renderer):
+    async def main():
+        await renderer.generate("123", 10, "percentage", date(2099, 1, 1))
+        for process in list(renderer._pool._processes.values()):
+            os.kill(process.pid, signal.SIGKILL)
+            process.join()
+        return await renderer.generate("123", 5, "fixed", date(2099, 1, 1))
+
+    token, path = asyncio.run(main())
+
+    assert verify_token(KEY, token)["discount_type"] == "fixed"
+    assert os.path.basename(path).startswith("2099-01-01-")
+    assert renderer.renders == 2
+
+
+def test_prune_deletes_codes_expired_before_yesterday(renderer, tmp_path):
+    names = [
+        "2024-05-01-" + "a" * 32 + ".png",
+        "2024-05-09-" + "b" * 32 + ".png",
+        "2024-05-10-" + "c" * 32 + ".png",
+        "notes.txt",
+    ]
+    for name in names:
+        (tmp_path / name).write_bytes(b"")
+
+    assert renderer.prune(today=date(2024, 5, 10)) == 1
+    assert sorted(os.listdir(tmp_path)) == names[1:]
@@ -0,0 +1,97 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from customer_service.config import RateLimitModel
+from customer_service.shared_libraries.rate_limit import (
+    InMemoryQuotaBackend,
+    QuotaRule,
+    RateLimitExceeded,
+    RateLimiter,
+    RedisQuotaBackend,
+)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_refilled_buckets_are_dropped():
+    clock = Clock()
+    backend = InMemoryQuotaBackend(clock=clock, sweep_secs=60)
+    for session in range(100):
+        backend.try_acquire([QuotaRule(f"rpm:session:{session}", 10)])
+    clock.now += 30
+    backend.try_acquire([QuotaRule("rpm:session:active", 10)])
+    assert len(backend._buckets) == 101
+
+    # The first 100 sessions have been idle for a full window by now.
+    clock.now += 31
+    backend.try_acquire([QuotaRule("rpm:session:active", 10)])
+
+    assert list(backend._buckets) == ["rpm:session:active"]
+
+
+def test_dropping_a_bucket_keeps_its_quota():
+    clock = Clock()
+    backend = InMemoryQuotaBackend(clock=clock, sweep_secs=1)
+    rule = QuotaRule("rpm:user:123", 2, window_secs=60)
+    assert backend.try_acquire([rule]) == 0
+    assert backend.try_acquire([rule]) == 0
+
+    clock.now += 5
+    # Partly refilled buckets are kept by the sweep.
+    assert backend.try_acquire([rule]) > 0
+    assert backend.try_acquire([QuotaRule("other", 2)]) == 0
+    assert "rpm:user:123" in backend._buckets
+
+
+@pytest.fixture
+def server():
+    return fakeredis.FakeServer()
+
+
+def backend(server):
+    return RedisQuotaBackend(client=fakeredis.FakeRedis(server=server))
+
+
+def test_redis_window_is_shared_by_replicas(server):
+    rules = [QuotaRule("rpm:user:123", 2)]
+    first, second = backend(server), backend(server)
+
+    assert first.try_acquire(rules) == 0
+    assert second.try_acquire(rules) == 0
+    retry_after = first.try_acquire(rules)
+
+    assert 0 < retry_after <= 60
+
+
+def test_redis_check_consumes_every_rule_or_none(server):
+    replica = backend(server)
+    user = QuotaRule("rpm:user:123", 5)
+    session = QuotaRule("rpm:session:a", 1)
+
+    assert replica.try_acquire([user, session]) == 0
+    assert replica.try_acquire([user, session]) > 0
+    # The rejected request did not use up the user's quota.
+    for _ in range(4):
+        assert replica.try_acquire([user]) == 0
+    assert replica.try_acquire([user]) > 0
+
+
+def test_limiter_rejects_over_redis(server):
+    settings = RateLimitModel(backend="redis", session_rpm=1, mode="reject")
+    limiter = RateLimiter(settings, backend=backend(server))
+
+    async def main():
+        await limiter.acquire("123", "a")
+        await limiter.acquire("123", "a")
+
+    with pytest.raises(RateLimitExceeded):
+        asyncio.run(main())
+    assert limiter.stats()["rejected"] == 1
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from customer_service.shared_libraries import recommendations
+from customer_service.tools.tools import get_book_recommendations
+
+
+class Engine:
+    # Never due for a background rebuild.
+    built_at = float("inf")
+
+    def recommend(self, genre, owned, favorite_authors, exclude, k):
+        self.owned = owned
+        return [{"product_id": "978-0-441-17271-9", "genre": genre}]
+
+
+@pytest.fixture
+def slow_build(monkeypatch):
+    def load_engine():
+        time.sleep(0.3)
+        return Engine()
+
+    monkeypatch.setattr(recommendations, "_engine", None)
+    monkeypatch.setattr(recommendations, "load_engine", load_engine)
+
+
+def test_engine_build_does_not_block_the_event_loop(slow_build):
+    async def main():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        result = await get_book_recommendations(
+            "science fiction", "", SimpleNamespace(state={})
+        )
+        task.cancel()
+        return result, ticks
+
+    result, ticks = asyncio.run(main())
+
+    assert result["recommendations"][0]["genre"] == "science fiction"
+    assert ticks >= 10
+
+
+def test_owned_books_come_from_the_session_profile(monkeypatch):
+    from customer_service.entities.customer import Customer
+    from customer_service.entities.customer_repository import sample_customers
+    from customer_service.tools import tools
+
+    customer = sample_customers()[0]
+    engine = Engine()
+    monkeypatch.setattr(recommendations, "_engine", engine)
+
+    async def empty_cart(customer_id):
+        return {"items": []}
+
+    def no_lookup(*args, **kwargs):
+        raise AssertionError("the customer store must not be queried")
+
+    monkeypatch.setattr(tools, "access_cart_information", empty_cart)
+    monkeypatch.setattr(Customer, "get_customer", staticmethod(no_lookup))
+    context = SimpleNamespace(state={"customer_profile": customer.to_json()})
+
+    asyncio.run(get_book_recommendations("mystery", customer.customer_id, context))
+
+    bought = customer.purchase_history[0].items[0].product_id
+    assert bought in engine.owned
+
+
+def test_warm_up_builds_the_engine_once(slow_build):
+    recommendations.warm_up()
+    engine = recommendations._engine
+
+    recommendations.warm_up()
+
+    assert isinstance(engine, Engine)
+    assert recommendations._engine is engine
+
+
+def test_record_purchase_matches_a_rebuild():
+    from customer_service.shared_libraries.recommendations import RecommendationEngine
+
+    books = [
+        {
+            "isbn": f"isbn-{i}",
+            "title": f"Book {i}",
+            "author": f"Author {i % 7}",
+            "genre": ("Mystery", "Fantasy", "History")[i % 3],
+            "quantity_total": i % 5,
+        }
+        for i in range(60)
+    ]
+    baskets = [[f"isbn-{(c * 7 + j * 11) % 60}" for j in range(c % 4 + 1)] for c in range(80)]
+    purchase = ["isbn-59", "isbn-58", "isbn-3"]
+
+    engine = RecommendationEngine(books, baskets, top_k=3)
+    for _ in range(4):
+        engine.record_purchase(purchase)
+    rebuilt = RecommendationEngine(books, baskets + [purchase] * 4, top_k=3)
+
+    assert engine.popular.tolist() == rebuilt.popular.tolist()
+    for table in ("genre_index", "author_index"):
+        ours, theirs = getattr(engine, table), getattr(rebuilt, table)
+        assert {k: v.tolist() for k, v in ours.items()} == {
+            k: v.tolist() for k, v in theirs.items()
+        }
+    # Books tied on score may be listed in either order.
+    def scores(e, row):
+        norms = np.sqrt(np.maximum(e.popularity, 1.0))
+        return sorted(
+            round(float(e._counts(row, np.array([j]))[0] / (norms[row] * norms[j])), 9)
+            for j in e.neighbors[row]
+        )
+
+    for product_id in purchase:
+        row = engine.index[product_id]
+        assert scores(engine, row) == scores(rebuilt, row)
@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from customer_service.config import SchedulingModel
+from customer_service.entities.customer_repository import (
+    InMemoryCustomerRepository,
+    sample_customers,
+)
+from customer_service.shared_libraries.scheduling import (
+    ConsultationScheduler,
+    InMemorySlotStore,
+    MongoSlotStore,
+    SlotUnavailableError,
+)
+from customer_service.tools import tools
+
+
+class SlotCollection:
+    """The part of a pymongo collection MongoSlotStore uses.
+
+    mongomock has no $bitsAllClear, so this applies the booking updates
+    itself and keeps the filters it was given.
+    """
+
+    def __init__(self):
+        self.docs = {}
+        self.filters = []
+
+    def insert_one(self, doc):
+        from pymongo.errors import DuplicateKeyError
+
+        if doc["_id"] in self.docs:
+            raise DuplicateKeyError("duplicate day")
+        self.docs[doc["_id"]] = doc
+
+    def update_one(self, query, update):
+        self.filters.append(query)
+        doc = self.docs.get(query["_id"])
+        field, condition = next((k, v) for k, v in query.items() if k != "_id")
+        lane = int(field.split(".")[1])
+        positions = condition["$bitsAllClear"]
+        if doc is None or any(doc["lanes"][lane] >> bit & 1 for bit in positions):
+            return SimpleNamespace(modified_count=0)
+        doc["lanes"][lane] |= update["$bit"][field]["or"]
+        return SimpleNamespace(modified_count=1)
+
+    def find(self, query, projection=None):
+        return [
+            doc for doc in self.docs.values()
+            if doc["store_id"] == query["store_id"]
+            and query["date"]["$gte"] <= doc["date"] <= query["date"]["$lte"]
+        ]
+
+
+@pytest.fixture
+def collection():
+    return SlotCollection()
+
+
+@pytest.fixture
+def scheduler(collection):
+    # 60 ten-minute slots, so the evening is above bit 31.
+    settings = SchedulingModel(
+        backend="mongo", open_hour=9, close_hour=19, slot_minutes=10, consultants=1
+    )
+    return ConsultationScheduler(MongoSlotStore(collection), settings)
+
+
+def test_slots_above_bit_31_are_queried_by_position(scheduler, collection):
+    appointment = scheduler.reserve("main", "123", "2099-01-05", "18:30-19:00", "")
+
+    assert appointment["mask"] == 0b111 << 57
+    positions = collection.filters[-1]["lanes.0"]["$bitsAllClear"]
+    assert positions == [57, 58, 59]
+    assert collection.docs["main|2099-01-05"]["lanes"][0] == 0b111 << 57
+
+
+def test_overlapping_booking_in_the_last_slot_is_refused(scheduler):
+    scheduler.reserve("main", "123", "2099-01-05", "18:30-19:00", "")
+
+    with pytest.raises(SlotUnavailableError):
+        scheduler.reserve("main", "456", "2099-01-05", "18:50-19:00", "")
+    assert scheduler.available("main", "2099-01-05")[-1] == "17:30-18:30"
+
+
+def test_booking_tool_calls_the_stores_off_the_event_loop(monkeypatch):
+    threads = []
+
+    class Repository(InMemoryCustomerRepository):
+        def add_appointment(self, *args):
+            threads.append(threading.current_thread())
+            return super().add_appointment(*args)
+
+    class Slots(InMemorySlotStore):
+        def try_reserve(self, *args):
+            threads.append(threading.current_thread())
+            return super().try_reserve(*args)
+
+    customers = sample_customers()
+    scheduler = ConsultationScheduler(Slots(), SchedulingModel(backend="memory"))
+    monkeypatch.setattr(tools, "get_scheduler", lambda: scheduler)
+    monkeypatch.setattr(tools, "get_customer_repository", lambda: Repository(customers))
+    context = SimpleNamespace(state={"customer_profile": customers[0].to_json()})
+
+    result = asyncio.run(
+        tools.schedule_reading_consultation(
+            customers[0].customer_id, "2099-01-05", "9-10", "", context
+        )
+    )
+
+    assert result["status"] == "success"
+    assert len(threads) == 2 and threading.main_thread() not in threads
+    assert result["appointment_id"] in context.state["customer_profile"]
+
+
+def test_times_for_an_invalid_date_are_an_error(monkeypatch, scheduler):
+    monkeypatch.setattr(tools, "get_scheduler", lambda: scheduler)
+
+    result = asyncio.run(tools.get_available_consultation_times("tomorrow"))
+
+    assert result["status"] == "error"
+    assert asyncio.run(tools.get_available_consultation_times("2099-01-05"))
+
+
+def test_store_errors_are_returned_as_results(monkeypatch):
+    from pymongo.errors import ServerSelectionTimeoutError
+
+    def unreachable():
+        raise ServerSelectionTimeoutError("localhost:27017: connection refused")
+
+    monkeypatch.setattr(tools, "get_scheduler", unreachable)
+    context = SimpleNamespace(state={})
+
+    booking = asyncio.run(
+        tools.schedule_reading_consultation("123", "2099-01-05", "9-10", "", context)
+    )
+    times = asyncio.run(tools.get_available_consultation_times("2099-01-05"))
+
+    assert booking["status"] == "error" and times["status"] == "error"
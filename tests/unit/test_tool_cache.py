@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from customer_service.entities.customer_repository import sample_customers
+from customer_service.shared_libraries import callbacks
+from customer_service.shared_libraries.tool_cache import (
+    TOOL_CACHE_POLICIES,
+    ToolResultCache,
+)
+
+CART = {"items": [], "subtotal": 0.0, "version": 3}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    cache = ToolResultCache(TOOL_CACHE_POLICIES, clock=clock)
+    monkeypatch.setattr(callbacks, "get_tool_cache", lambda: cache)
+    return clock
+
+
+def call(tool_name, args, call_id, response=None):
+    """Runs before_tool and, when the tool is not skipped, after_tool."""
+    customer = sample_customers()[0]
+    context = SimpleNamespace(
+        session=SimpleNamespace(id="session-1"),
+        state={"customer_profile": customer.to_json()},
+        function_call_id=call_id,
+    )
+    tool = SimpleNamespace(name=tool_name)
+    cached = callbacks.before_tool(tool, args, context)
+    if cached is not None:
+        return cached
+    callbacks.after_tool(tool, args, context, response)
+    return response
+
+
+def test_cart_is_only_reused_for_a_few_seconds(clock):
+    args = {"customer_id": "123"}
+    call("access_cart_information", args, "1", CART)
+
+    assert call("access_cart_information", args, "2", {"changed": True}) == CART
+    clock.now += 6
+    # Another worker may have changed the cart by now.
+    assert call("access_cart_information", args, "3", {"changed": True}) == {
+        "changed": True
+    }
+
+
+def test_modify_cart_drops_the_cached_cart(clock):
+    args = {"customer_id": "123"}
+    call("access_cart_information", args, "1", CART)
+    call(
+        "modify_cart",
+        {"customer_id": "123", "items_to_add": [], "items_to_remove": []},
+        "2",
+        {"status": "success"},
+    )
+
+    assert call("access_cart_information", args, "3", {"changed": True}) == {
+        "changed": True
+    }
@@ -0,0 +1,21 @@
+import asyncio
+import threading
+
+from customer_service.shared_libraries import vector_search
+from customer_service.sub_agents.inventoryAgent.agent import find_similar_books
+
+
+def test_similar_books_are_searched_off_the_event_loop(monkeypatch):
+    threads = []
+
+    class Index:
+        def search(self, text, k, nprobe):
+            threads.append(threading.current_thread())
+            return [{"isbn": "978-0-06-231500-7", "title": "The Alchemist", "score": 0.9}]
+
+    monkeypatch.setattr(vector_search, "get_vector_index", lambda: Index())
+
+    result = asyncio.run(find_similar_books("a journey to find treasure"))
+
+    assert result["count"] == 1
+    assert threads and threading.main_thread() not in threads